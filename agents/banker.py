@@ -1,4 +1,3 @@
-import random
 from decimal import Decimal as Dec
 from typing import Optional, Tuple
 
@@ -30,7 +29,7 @@ class Banker(MarketPlayer):
     def setup(self, wealth_parameter: Dec, wage_parameter: Dec, liquidation_param: Dec) -> None:
         super().setup(wealth_parameter, wage_parameter, liquidation_param)
 
-        init_value = wealth_parameter * Dec(random.random()/10 + 0.9)
+        init_value = wealth_parameter * Dec(self.model.random.random()/10 + 0.9)
         endowment = hm.round_decimal(init_value * Dec(4))
         self.fiat = init_value
         self.model.endow_havvens(self, endowment)
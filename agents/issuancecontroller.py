@@ -2,6 +2,7 @@ from agents import MarketPlayer
 from decimal import Decimal as Dec
 from typing import List, Any, Dict
 from core import orderbook as ob
+from core import model
 
 
 class IssuanceController(MarketPlayer):
@@ -21,17 +22,22 @@ class IssuanceController(MarketPlayer):
       and variable price target (non_discretionary_cap_buffer)
     """
 
-    issuance_orders: List[Dict[str, Any]] = []
-    '''
-    A list of nomins given to this player, how much remaining to sell,
-    how much the player is owed and who deserves them
-    '''
+    def __init__(self, unique_id: int, havven_model: "model.HavvenModel",
+                 fiat: Dec = Dec(0), havvens: Dec = Dec(0),
+                 nomins: Dec = Dec(0)) -> None:
+        super().__init__(unique_id, havven_model, fiat, havvens, nomins)
 
-    burn_orders: List[Dict[str, Any]] = []
-    '''
-    A list of fiat given to this player, how many nomins to buy (to burn), and how
-    much the player is owed, and what player deserves them
-    '''
+        self.issuance_orders: List[Dict[str, Any]] = []
+        '''
+        A list of nomins given to this player, how much remaining to sell,
+        how much the player is owed and who deserves them
+        '''
+
+        self.burn_orders: List[Dict[str, Any]] = []
+        '''
+        A list of fiat given to this player, how many nomins to buy (to burn), and how
+        much the player is owed, and what player deserves them
+        '''
 
     total_redeemed: Dec = Dec()
 
@@ -76,6 +82,12 @@ class IssuanceController(MarketPlayer):
             i for i in self.burn_orders if i['remaining'] > 0
         ]
 
+    def idle_steps(self) -> int:
+        # With no orders to work, there is nothing to do until one is placed, which wakes this player.
+        if self.issuance_orders or self.burn_orders:
+            return 0
+        return self.model.schedule.until_woken
+
     def place_issuance_order(self, value: Dec, player: 'MarketPlayer') -> None:
         """
         Place an order to sell issued nomins for fiat, and send the fiat to the player
@@ -86,6 +98,7 @@ class IssuanceController(MarketPlayer):
             'player': player,
             'trade': None
         })
+        self.model.schedule.wake(self)
 
     def place_burn_order(self, value: Dec, player: 'MarketPlayer'):
         self.burn_orders.append({
@@ -94,6 +107,7 @@ class IssuanceController(MarketPlayer):
             'player': player,
             'trade': None
         })
+        self.model.schedule.wake(self)
 
     def notify_cancelled(self, order: "ob.LimitOrder") -> None:
         pass
@@ -239,4 +253,4 @@ class IssuanceController(MarketPlayer):
                 if order['player'].issued_nomins < 0:
                     print(order['player'].debug_str)
 
-        self.trades.append(record)
+        super().notify_trade(record)
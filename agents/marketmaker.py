@@ -3,7 +3,6 @@ http://www.eecs.harvard.edu/cs286r/courses/fall12/papers/OPRS10.pdf
 http://www.cs.cmu.edu/~aothman/
 """
 
-import random
 from decimal import Decimal as Dec
 from typing import Dict, Any, Optional
 
@@ -54,7 +53,7 @@ class MarketMaker(MarketPlayer):
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
-        self.last_bet_end: int = random.randint(-20, 10)
+        self.last_bet_end: int = self.model.random.randint(-20, 10)
         '''How long since the last market maker's "bet"'''
 
         self.minimal_wait: int = 10
@@ -82,7 +81,7 @@ class MarketMaker(MarketPlayer):
 
         self.minimal_price: Dec = Dec('0.0001')
 
-        self.trade_market = random.choice([
+        self.trade_market = self.model.random.choice([
             self.havven_fiat_market,
             self.nomin_fiat_market,
             self.havven_nomin_market
@@ -127,73 +126,94 @@ class MarketMaker(MarketPlayer):
                 self.sell_nomins_for_fiat_with_fee(self.available_nomins / Dec(2))
                 self.sell_nomins_for_havvens_with_fee(self.available_nomins)
 
-        # if the duration has ended, close the trades
-        if self.last_bet_end >= self.minimal_wait + self.bet_duration:
-            self.last_bet_end = 0
-            self.current_bet['bid'].cancel()
-            self.current_bet['ask'].cancel()
-            self.current_bet = None
-        # if the duration hasn't ended, update the trades
-        elif self.current_bet is not None:
-            # update both bid and ask every step in case orders were partially filled
-            # so that quantities are updated
-            self.current_bet['bid'].cancel()
-            self.current_bet['ask'].cancel()
-            bid = self.place_bid_func(
-                self.last_bet_end - self.minimal_wait,
-                self.current_bet['gradient'],
-                self.current_bet['initial_price']
-            )
-            if bid is None:
-                self.current_bet = None
+        # Replace the bet's bid and ask together, matching them against the book only once both are placed.
+        with self.trade_market.deferred_matching():
+            # if the duration has ended, close the trades
+            if self.last_bet_end >= self.minimal_wait + self.bet_duration:
                 self.last_bet_end = 0
-                return
-            ask = self.place_ask_func(
-                self.last_bet_end - self.minimal_wait,
-                self.current_bet['gradient'],
-                self.current_bet['initial_price']
-            )
-            if ask is None:
-                bid.cancel()
+                self.current_bet['bid'].cancel()
+                self.current_bet['ask'].cancel()
                 self.current_bet = None
-                self.last_bet_end = 0
-                return
-            self.current_bet['bid'] = bid
-            self.current_bet['ask'] = ask
-
-        # if the minimal wait period has ended, create a bet
-        elif self.last_bet_end >= self.minimal_wait:
-            self.last_bet_end = self.minimal_wait
-            gradient = self.calculate_gradient(self.trade_market)
-            if gradient is None:
-                return
-            start_price = self.trade_market.price
-
-            bid = self.place_bid_func(
-                0,
-                gradient,
-                start_price
-            )
-            if bid is None:
-                return
-
-            ask = self.place_ask_func(
-                0,
-                gradient,
-                start_price
-            )
-            if ask is None:
-                bid.cancel()
-                return
-
-            self.current_bet = {
-                'gradient': gradient,
-                'initial_price': start_price,
-                'bid': bid,
-                'ask': ask
-            }
+            # if the duration hasn't ended, update the trades
+            elif self.current_bet is not None:
+                # update both bid and ask every step in case orders were partially filled
+                # so that quantities are updated
+                self.current_bet['bid'].cancel()
+                self.current_bet['ask'].cancel()
+                bid = self.place_bid_func(
+                    self.last_bet_end - self.minimal_wait,
+                    self.current_bet['gradient'],
+                    self.current_bet['initial_price']
+                )
+                if bid is None:
+                    self.current_bet = None
+                    self.last_bet_end = 0
+                    return
+                ask = self.place_ask_func(
+                    self.last_bet_end - self.minimal_wait,
+                    self.current_bet['gradient'],
+                    self.current_bet['initial_price']
+                )
+                if ask is None:
+                    bid.cancel()
+                    self.current_bet = None
+                    self.last_bet_end = 0
+                    return
+                self.current_bet['bid'] = bid
+                self.current_bet['ask'] = ask
+
+            # if the minimal wait period has ended, create a bet
+            elif self.last_bet_end >= self.minimal_wait:
+                self.last_bet_end = self.minimal_wait
+                gradient = self.calculate_gradient(self.trade_market)
+                if gradient is None:
+                    return
+                start_price = self.trade_market.price
+
+                bid = self.place_bid_func(
+                    0,
+                    gradient,
+                    start_price
+                )
+                if bid is None:
+                    return
+
+                ask = self.place_ask_func(
+                    0,
+                    gradient,
+                    start_price
+                )
+                if ask is None:
+                    bid.cancel()
+                    return
+
+                self.current_bet = {
+                    'gradient': gradient,
+                    'initial_price': start_price,
+                    'bid': bid,
+                    'ask': ask
+                }
         self.last_bet_end += 1
 
+    def idle_steps(self) -> int:
+        # Between bets, nothing is done until the minimal wait ends, unless there is a currency
+        # outside the market to sell, as there is every step wages are paid in fiat to a havven/nomin market maker.
+        if self.current_bet is not None:
+            return 0
+        if self.trade_market == self.havven_nomin_market:
+            to_sell = self.available_fiat + self.wage_parameter
+        elif self.trade_market == self.nomin_fiat_market:
+            to_sell = self.available_havvens
+        else:
+            to_sell = self.available_nomins
+        if to_sell > 0:
+            return 0
+        return max(0, self.minimal_wait - self.last_bet_end)
+
+    def catch_up(self, steps: int) -> None:
+        super().catch_up(steps)
+        self.last_bet_end += steps
+
     def place_bid_func(self, time_in_effect: int, gradient: Dec, start_price: Dec) -> "ob.Bid":
         """
         Place a bid at a price dependent on the time in effect and gradient
@@ -1,17 +1,37 @@
-from collections import namedtuple
+from collections import namedtuple, deque
 from decimal import Decimal as Dec
-from typing import List, Tuple, Optional
-import random
+from typing import Dict, Deque, Tuple, Optional, Union, Iterator, Any
 
 from mesa import Agent
 
 from core import orderbook as ob, model
-from managers import HavvenManager as hm
+from managers import HavvenManager as hm, AgentStore
 
 Portfolio = namedtuple(
     "Portfolio", ["fiat", "escrowed_havvens", "havvens", "havven_debt", "nomins", "issued_nomins"])
 
 
+class Stored:
+    """
+    An attribute of a player, held on the player itself,
+    and mirrored into its column of the model's agent store, if it has one, as it is set.
+
+    This only intercepts setting the attribute: as it has no __get__,
+    reading it finds the value in the player's __dict__, at no extra cost.
+    """
+
+    def __init__(self, doc: str) -> None:
+        self.__doc__ = doc
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __set__(self, player: "MarketPlayer", value: Dec) -> None:
+        player.__dict__[self.name] = value
+        if player._store is not None:
+            player._store.data[self.name][player.store_row] = value
+
+
 class MarketPlayer(Agent):
     """
     A generic agent with a fixed initial wealth in fiat,
@@ -21,21 +41,43 @@ class MarketPlayer(Agent):
     Its aim is to increase its own wealth.
     """
 
+    # The agent store holding this player's balances and its row there, if the model keeps one.
+    _store: Optional["AgentStore"] = None
+    store_row: Optional[int] = None
+
+    # The havvens and issued nomins held, behind properties which keep the manager's count
+    # of active havvens up to date. These are the values before they are first set.
+    _havvens: Dec = Dec(0)
+    _issued_nomins: Dec = Dec(0)
+
+    fiat = Stored("This agent's fiat.")
+    nomins = Stored("This agent's nomins.")
+    burning_fiat = Stored("The fiat currently being used for burning.")
+    unavailable_fiat = Stored("This agent's fiat tied up in orders.")
+    unavailable_havvens = Stored("This agent's havvens tied up in orders.")
+    unavailable_nomins = Stored("This agent's nomins tied up in orders.")
+    wage_parameter = Stored("The fiat this agent is paid each step.")
+    initial_wealth = Stored("This agent's wealth when it started out, or was last reset.")
+
     def __init__(self, unique_id: int, havven_model: "model.HavvenModel",
                  fiat: Dec = Dec(0), havvens: Dec = Dec(0),
                  nomins: Dec = Dec(0)) -> None:
         super().__init__(unique_id, havven_model)
-        self.fiat: Dec = Dec(fiat)
-        self.havvens: Dec = Dec(havvens)
-        self.nomins: Dec = Dec(nomins)
-        self.issued_nomins: Dec = Dec(0)
-        self.burning_fiat: Dec = Dec(0)
-        'Variable for counting how much fiat is being used for burning currently'
+        # A player being reset keeps its row in the store.
+        self._store = havven_model.agent_store
+        if self._store is not None and self.store_row is None:
+            self.store_row = self._store.add(self)
+
+        self.fiat = Dec(fiat)
+        self.havvens = Dec(havvens)
+        self.nomins = Dec(nomins)
+        self.issued_nomins = Dec(0)
+        self.burning_fiat = Dec(0)
 
         # values that are currently used in orders
-        self.unavailable_fiat: Dec = Dec(0)
-        self.unavailable_havvens: Dec = Dec(0)
-        self.unavailable_nomins: Dec = Dec(0)
+        self.unavailable_fiat = Dec(0)
+        self.unavailable_havvens = Dec(0)
+        self.unavailable_nomins = Dec(0)
 
         self.wage_parameter: Dec = Dec(0)
         self.liquidation_parameter: Dec = Dec(0)
@@ -43,8 +85,27 @@ class MarketPlayer(Agent):
 
         self.initial_wealth: Dec = self.wealth()
 
-        self.orders: List["ob.LimitOrder"] = []
-        self.trades: List["ob.TradeRecord"] = []
+        self.orders: Dict[int, "ob.LimitOrder"] = {}
+        """This player's live orders on every book, by id, in the order they were placed."""
+        self.trades: Deque[Union["ob.TradeRecord", Tuple["ob.OrderBook", int]]] = deque(
+            maxlen=None if self.model.manager.retain_trade_history else ob.OrderBook.recent_history_length
+        )
+        """
+        Recent trades made by this player, or their books and indices in the books' trade logs, if kept.
+        Every trade is kept only if the books retain their trade history.
+        """
+        self.traded: Dict[Tuple["ob.OrderBook", bool], Dec] = {}
+        """The total quantity this player has traded on each book, by book and whether it was buying."""
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        This agent's state for pickling, as in a model snapshot,
+        leaving out the trades it has made, unless the snapshot keeps them.
+        """
+        state = self.__dict__.copy()
+        if not self.model.snapshot_history:
+            state['trades'] = deque(maxlen=self.trades.maxlen)
+        return state
 
     def __str__(self) -> str:
         return self.name
@@ -80,6 +141,29 @@ class MarketPlayer(Agent):
         """
         return self.model.manager.round_decimal(self.nomins - self.unavailable_nomins)
 
+    @property
+    def havvens(self) -> Dec:
+        return self._havvens
+
+    @havvens.setter
+    def havvens(self, value: Dec) -> None:
+        self.model.manager.havvens_changed(self, value - self._havvens)
+        self._havvens = value
+        if self._store is not None:
+            self._store.data["havvens"][self.store_row] = value
+
+    @property
+    def issued_nomins(self) -> Dec:
+        return self._issued_nomins
+
+    @issued_nomins.setter
+    def issued_nomins(self, value: Dec) -> None:
+        self.model.manager.uncount_issuer(self)
+        self._issued_nomins = value
+        self.model.manager.count_issuer(self)
+        if self._store is not None:
+            self._store.data["issued_nomins"][self.store_row] = value
+
     @property
     def escrowed_havvens(self) -> Dec:
         return self.model.mint.escrowed_havvens(self)
@@ -141,7 +225,7 @@ class MarketPlayer(Agent):
         """
         Cancel all of this agent's orders.
         """
-        for order in list(self.orders):
+        for order in list(self.orders.values()):
             order.cancel()
 
     def wealth(self) -> Dec:
@@ -537,12 +621,44 @@ class MarketPlayer(Agent):
         """
         Notify this agent that its order was filled.
         """
-        self.trades.append(record)
+        key = (record.book, record.buyer is self)
+        self.traded[key] = self.traded.get(key, Dec(0)) + record.quantity
+        if record.log_id is None:
+            self.trades.append(record)
+        else:
+            self.trades.append((record.book, record.log_id))
+
+    def trade_records(self) -> Iterator[Union["ob.TradeRecord", "ob.LoggedTrade"]]:
+        """
+        Iterate over the recent trades this player has made, or all of them if the books retain their history,
+        reading back any which are kept in a trade log.
+        """
+        for trade in self.trades:
+            if isinstance(trade, tuple):
+                yield trade[0].trade(trade[1])
+            else:
+                yield trade
 
     def step(self) -> None:
         if not self.wage_step():
             pass
 
+    def idle_steps(self) -> int:
+        """
+        The number of steps after this one in which this agent has nothing to do,
+        which the scheduler skips if skipping idle agents.
+        A skipped agent is paid its wages for those steps as it wakes, but misses its chances of selling off,
+        so only agents which know they will be waiting report being idle, and by default no agent is.
+        """
+        return 0
+
+    def catch_up(self, steps: int) -> None:
+        """
+        Catch up on the given number of steps this agent slept through, as it wakes,
+        by paying it the wages it missed.
+        """
+        self.fiat += self.wage_parameter * steps
+
     def wage_step(self) -> bool:
         """
         Pay the agent's wage
@@ -550,7 +666,7 @@ class MarketPlayer(Agent):
         """
         self.fiat += self.wage_parameter
         # chance of a sell off wealth parameter
-        if random.random() < self.liquidation_parameter and self.model.manager.time > 10:
+        if self.model.random.random() < self.liquidation_parameter and self.model.manager.time > 10:
             return self.sell_off()
         return True
 
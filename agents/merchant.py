@@ -17,7 +17,6 @@ from decimal import Decimal as Dec
 from collections import defaultdict
 
 from typing import Dict
-import random
 
 
 class Merchant(MarketPlayer):
@@ -44,17 +43,17 @@ class Merchant(MarketPlayer):
         # Set up this merchant's inventory of items, their stocks, and their prices.
         self.inventory: Dict[str, Dict[str, Dec]] = {
             # name: price(nomins), stock_price(fiat), current_stock, stock_goal
-            str(i): {'price': Dec(random.random() * 20) + 1, 'stock_price': Dec(1),
+            str(i): {'price': Dec(self.model.random.random() * 20) + 1, 'stock_price': Dec(1),
                      'current_stock': Dec(100), 'stock_goal': Dec(100)}
-            for i in range(1, random.randint(4, 6))
+            for i in range(1, self.model.random.randint(4, 6))
         }
         for i in self.inventory:
-            self.inventory[i]['stock_price'] = self.inventory[i]['price'] * Dec((random.random() / 3) + 0.5)
+            self.inventory[i]['stock_price'] = self.inventory[i]['price'] * Dec((self.model.random.random() / 3) + 0.5)
 
         self.last_restock: int = 0
         """Time since the last inventory restock."""
 
-        self.restock_tick_rate: int = random.randint(20, 30)
+        self.restock_tick_rate: int = self.model.random.randint(20, 30)
         """Time between inventory restocking. Randomised to prevent all merchants restocking at once."""
 
     def setup(self, wealth_parameter: Dec, wage_parameter: Dec, liquidation_param: Dec) -> None:
@@ -88,6 +87,14 @@ class Merchant(MarketPlayer):
                     self.fiat -= info['stock_price'] * amount_possible
                     self.inventory[item]['current_stock'] += amount_possible
 
+    def idle_steps(self) -> int:
+        # Nothing is done between restocks.
+        return self.restock_tick_rate - self.last_restock
+
+    def catch_up(self, steps: int) -> None:
+        super().catch_up(steps)
+        self.last_restock += steps
+
     def sell_stock(self, agent: 'Buyer', item: str, quantity: Dec) -> Dec:
         """
         Function to transfer stock to buyer, telling the buyer how much they
@@ -118,9 +125,9 @@ class Buyer(MarketPlayer):
         super().__init__(*args, **kwargs)
 
         self.inventory = defaultdict(Dec)
-        self.wage = random.randint(self.min_wage, self.max_wage)
+        self.wage = self.model.random.randint(self.min_wage, self.max_wage)
 
-        self.mpc = (self.max_mpc - self.min_mpc) * random.random() + self.min_mpc
+        self.mpc = (self.max_mpc - self.min_mpc) * self.model.random.random() + self.min_mpc
         """This agent's marginal propensity to consume."""
 
         self.wait = 0
@@ -159,10 +166,10 @@ class Buyer(MarketPlayer):
             )
 
         # If feeling spendy, buy something.
-        if random.random() < self.mpc:
-            to_buy = Dec(int(random.random() * 5) + 1)
-            buying_from = random.choice(self.model.agent_manager.agents['Merchant'])
-            buying = random.choice(list(buying_from.inventory.keys()))
+        if self.model.random.random() < self.mpc:
+            to_buy = Dec(int(self.model.random.random() * 5) + 1)
+            buying_from = self.model.random.choice(self.model.agent_manager.agents['Merchant'])
+            buying = self.model.random.choice(list(buying_from.inventory.keys()))
             amount = buying_from.sell_stock(self, buying, Dec(to_buy))
             if amount > 0:
                 self.transfer_nomins_to(buying_from, amount)
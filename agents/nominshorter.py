@@ -56,6 +56,7 @@ class NominShorter(MarketPlayer):
         return Dec(min((0.5/(wait+10)), 0.0))
 
     def notify_trade(self, record: "ob.TradeRecord"):
+        super().notify_trade(record)
         if record.buyer == self:
             self._nomin_buy_wait = 0
         if record.seller == self:
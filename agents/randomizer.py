@@ -1,5 +1,4 @@
 """agents.py: Individual agents that will interact with the Havven market."""
-import random
 from decimal import Decimal as Dec
 
 from core import orderbook as ob
@@ -38,45 +37,45 @@ class Randomizer(MarketPlayer):
 
         # Cancel expired orders
         condemned = []
-        for order in self.orders:
+        for order in self.orders.values():
             if order.book.time > order.time + self.order_lifetime:
                 condemned.append(order)
         for order in condemned:
             order.cancel()
 
         if len(self.orders) < self.max_orders:
-            action = random.choice([self._havven_fiat_bid, self._havven_fiat_ask,
-                                    self._nomin_fiat_bid, self._nomin_fiat_ask,
-                                    self._havven_nomin_bid, self._havven_nomin_ask])
+            action = self.model.random.choice([self._havven_fiat_bid, self._havven_fiat_ask,
+                                               self._nomin_fiat_bid, self._nomin_fiat_ask,
+                                               self._havven_nomin_bid, self._havven_nomin_ask])
             if action() is None:
                 return
 
     def _havven_fiat_bid(self) -> "ob.Bid":
         price = self.havven_fiat_market.price
-        movement = hm.round_decimal(Dec(2 * random.random() - 1) * price * self.variance)
+        movement = hm.round_decimal(Dec(2 * self.model.random.random() - 1) * price * self.variance)
         return self.place_havven_fiat_bid(self._fraction(self.available_fiat, Dec(10)), price + movement)
 
     def _havven_fiat_ask(self) -> "ob.Ask":
         price = self.havven_fiat_market.price
-        movement = hm.round_decimal(Dec(2 * random.random() - 1) * price * self.variance)
+        movement = hm.round_decimal(Dec(2 * self.model.random.random() - 1) * price * self.variance)
         return self.place_havven_fiat_ask(self._fraction(self.available_havvens, Dec(10)), price + movement)
 
     def _nomin_fiat_bid(self) -> "ob.Bid":
         price = self.nomin_fiat_market.price
-        movement = hm.round_decimal(Dec(2 * random.random() - 1) * price * self.variance)
+        movement = hm.round_decimal(Dec(2 * self.model.random.random() - 1) * price * self.variance)
         return self.place_nomin_fiat_bid(self._fraction(self.available_fiat, Dec(10)), price + movement)
 
     def _nomin_fiat_ask(self) -> "ob.Ask":
         price = self.nomin_fiat_market.price
-        movement = hm.round_decimal(Dec(2 * random.random() - 1) * price * self.variance)
+        movement = hm.round_decimal(Dec(2 * self.model.random.random() - 1) * price * self.variance)
         return self.place_nomin_fiat_ask(self._fraction(self.available_nomins, Dec(10)), price + movement)
 
     def _havven_nomin_bid(self) -> "ob.Bid":
         price = self.havven_nomin_market.price
-        movement = hm.round_decimal(Dec(2 * random.random() - 1) * price * self.variance)
+        movement = hm.round_decimal(Dec(2 * self.model.random.random() - 1) * price * self.variance)
         return self.place_havven_nomin_bid(self._fraction(self.available_nomins, Dec(10)), price + movement)
 
     def _havven_nomin_ask(self) -> "ob.Ask":
         price = self.havven_nomin_market.price
-        movement = hm.round_decimal(Dec(2 * random.random() - 1) * price * self.variance)
+        movement = hm.round_decimal(Dec(2 * self.model.random.random() - 1) * price * self.variance)
         return self.place_havven_nomin_ask(self._fraction(self.available_havvens, Dec(10)), price + movement)
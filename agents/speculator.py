@@ -1,5 +1,5 @@
-import random
 from decimal import Decimal as Dec
+from functools import partial
 from typing import Tuple, Optional, Callable
 
 from agents import MarketPlayer
@@ -21,23 +21,23 @@ class Speculator(MarketPlayer):
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
-        self.risk_factor = Dec(random.random() / 5 + 0.05)  # (5-25)%
+        self.risk_factor = Dec(self.model.random.random() / 5 + 0.05)  # (5-25)%
         """How likely is the speculator going to place a trade if he
         doesn't have an active one"""
 
-        self.hold_duration = Dec(random.randint(20, 30))
+        self.hold_duration = Dec(self.model.random.randint(20, 30))
         """How long a speculator wants to hodl onto a trade"""
 
-        self.profit_goal = Dec(random.random() / 10 + 0.01)  # (1-2)%
+        self.profit_goal = Dec(self.model.random.random() / 10 + 0.01)  # (1-2)%
         """How much a speculator wants to profit on any trade"""
 
-        self.loss_cutoff = Dec(random.random() / 20 + 0.01)  # (1-1.5)%
+        self.loss_cutoff = Dec(self.model.random.random() / 20 + 0.01)  # (1-1.5)%
         """At what point does the speculator get rid of a trade"""
 
-        self.investment_fraction = Dec(random.random() / 10 + 0.4)  # (40-50)%
+        self.investment_fraction = Dec(self.model.random.random() / 10 + 0.4)  # (40-50)%
         """How much wealth does the speculator throw into a trade"""
 
-        self.primary_currency = random.choice(["havvens", "fiat", "nomins"])
+        self.primary_currency = self.model.random.choice(["havvens", "fiat", "nomins"])
         self.set_avail_primary()
 
     @property
@@ -50,12 +50,13 @@ class Speculator(MarketPlayer):
         Set functions for checking available primary currency, or raise an exception if
         the currency isn't one of the main 3
         """
+        # These are partials rather than lambdas so that speculators can be pickled in model snapshots.
         if self.primary_currency == "havvens":
-            self.avail_primary = lambda: self.available_havvens
+            self.avail_primary = partial(getattr, self, "available_havvens")
         elif self.primary_currency == "fiat":
-            self.avail_primary = lambda: self.available_fiat
+            self.avail_primary = partial(getattr, self, "available_fiat")
         elif self.primary_currency == "nomins":
-            self.avail_primary = lambda: self.available_nomins
+            self.avail_primary = partial(getattr, self, "available_nomins")
         else:
             raise Exception(f"currency:{self.primary_currency} isn't in [havvens, fiat, nomins]")
 
@@ -139,7 +140,7 @@ class Speculator(MarketPlayer):
         Making a trade involves buying into one of the markets, then deciding on a price
         to sell.
         """
-        if random.random() < self.risk_factor:
+        if self.model.random.random() < self.risk_factor:
             if direction == "ask":
                 price = market.highest_bid_price()
                 bid = market.bid(price, self.avail_primary() * self.investment_fraction, self)
@@ -196,7 +197,7 @@ class HavvenSpeculator(Speculator):
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
-        self.primary_currency = random.choice(["havvens", "havvens", "fiat", "nomins"])
+        self.primary_currency = self.model.random.choice(["havvens", "havvens", "fiat", "nomins"])
         # give an equal chance to short/long havvens
         self.change_currency()
 
@@ -213,22 +214,22 @@ class HavvenSpeculator(Speculator):
             self.set_avail_primary()
 
         if self.primary_currency == "havvens":
-            self.secondary_currency = random.choice(["fiat", "nomins"])
+            self.secondary_currency = self.model.random.choice(["fiat", "nomins"])
             self.direction = "bid"
             if self.secondary_currency == "fiat":
                 self.market = self.havven_fiat_market
-                self.avail_secondary = lambda: self.available_fiat
+                self.avail_secondary = partial(getattr, self, "available_fiat")
                 self.place_function = self.place_havven_fiat_bid_with_fee
                 self.sell_function = self.sell_fiat_for_havvens_with_fee
             else:  # secondary: nomins
                 self.market = self.havven_nomin_market
-                self.avail_secondary = lambda: self.available_nomins
+                self.avail_secondary = partial(getattr, self, "available_nomins")
                 self.place_function = self.place_nomin_fiat_bid_with_fee
                 self.sell_function = self.sell_nomins_for_havvens_with_fee
 
         elif self.primary_currency == "fiat":
             self.secondary_currency = "havvens"
-            self.avail_secondary = lambda: self.available_havvens
+            self.avail_secondary = partial(getattr, self, "available_havvens")
             self.market = self.havven_fiat_market
             self.direction = "ask"
             self.place_function = self.place_havven_fiat_ask_with_fee
@@ -236,7 +237,7 @@ class HavvenSpeculator(Speculator):
 
         else:  # primary: nomins
             self.secondary_currency = "havvens"
-            self.avail_secondary = lambda: self.available_havvens
+            self.avail_secondary = partial(getattr, self, "available_havvens")
             self.market = self.havven_nomin_market
             self.direction = "ask"
             self.place_function = self.place_havven_nomin_ask_with_fee
@@ -300,43 +301,43 @@ class NaiveSpeculator(Speculator):
             self.active_trade_b = None
 
         if self.primary_currency == "nomins":
-            self.avail_primary = lambda: self.available_nomins
+            self.avail_primary = partial(getattr, self, "available_nomins")
             self.direction_a = "bid"
-            self.a_currency = lambda: self.available_fiat
+            self.a_currency = partial(getattr, self, "available_fiat")
             self.market_a: ob.OrderBook = self.model.market_manager.nomin_fiat_market
             self.place_a_function = self.place_nomin_fiat_bid_with_fee
             self.sell_a_function = self.sell_fiat_for_nomins_with_fee
 
             self.direction_b = "ask"
-            self.b_currency = lambda: self.available_havvens
+            self.b_currency = partial(getattr, self, "available_havvens")
             self.market_b: ob.OrderBook = self.model.market_manager.havven_nomin_market
             self.place_b_function = self.place_havven_nomin_ask_with_fee
             self.sell_b_function = self.sell_havvens_for_nomins_with_fee
 
         if self.primary_currency == "havvens":
-            self.avail_primary = lambda: self.available_havvens
+            self.avail_primary = partial(getattr, self, "available_havvens")
             self.direction_a = "bid"
-            self.a_currency = lambda: self.available_nomins
+            self.a_currency = partial(getattr, self, "available_nomins")
             self.market_a: ob.OrderBook = self.model.market_manager.havven_nomin_market
             self.place_a_function = self.place_havven_nomin_bid_with_fee
             self.sell_a_function = self.sell_nomins_for_havvens_with_fee
 
             self.direction_b = "bid"
-            self.b_currency = lambda: self.available_fiat
+            self.b_currency = partial(getattr, self, "available_fiat")
             self.market_b: ob.OrderBook = self.model.market_manager.havven_fiat_market
             self.place_b_function = self.place_havven_fiat_bid_with_fee
             self.sell_b_function = self.sell_fiat_for_havvens_with_fee
 
         if self.primary_currency == "fiat":
-            self.avail_primary = lambda: self.available_fiat
+            self.avail_primary = partial(getattr, self, "available_fiat")
             self.direction_a = "ask"
-            self.a_currency = lambda: self.available_nomins
+            self.a_currency = partial(getattr, self, "available_nomins")
             self.market_a: ob.OrderBook = self.model.market_manager.nomin_fiat_market
             self.place_a_function = self.place_nomin_fiat_ask_with_fee
             self.sell_a_function = self.sell_nomins_for_fiat_with_fee
 
             self.direction_b = "ask"
-            self.b_currency = lambda: self.available_havvens
+            self.b_currency = partial(getattr, self, "available_havvens")
             self.market_b: ob.OrderBook = self.model.market_manager.havven_fiat_market
             self.place_b_function = self.place_havven_fiat_ask_with_fee
             self.sell_b_function = self.sell_havvens_for_fiat_with_fee
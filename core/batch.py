@@ -0,0 +1,224 @@
+"""
+batch.py: run sweeps of headless simulations across a pool of processes.
+
+A sweep is described by a JSON spec:
+
+    {
+        "max_steps": 500,
+        "seeds": [0, 1, 2],
+        "settings": {"Model.num_agents": 100},
+        "sweep": {
+            "Agents.AgentFractions.Banker": [10, 25, 50],
+            "Fees.transfer_fee_settings.nomin_fee_level": ["0.002", "0.005"],
+            "Mint.copt_sensitivity_parameter": ["1", "2"]
+        }
+    }
+
+Settings are named by their path through the settings dict, joined by dots.
+Those under "settings" apply to every run, and every combination of the values
+under "sweep" is run once per seed. Values are converted to the type of the
+setting they replace, so Decimal settings are best given as strings.
+
+Each finished run is written straight away, as a line of JSON, to the output file,
+with its settings, its seed, how many steps it completed, any exception that
+ended it early, and the final value of each model reporter.
+
+Unless every step's statistics are wanted, setting "Model.collector_interval" to 0 collects
+them only in the last step of each run, skipping most of their cost. Individual statistics can be
+collected at their own intervals instead, with "intervals": {"Gini": 10, "Max Wealth": 0}.
+
+To keep every step's statistics as well, set "Model.collector_output_dir" to a directory:
+each run streams its statistics to a subdirectory of it, recorded as the run's "series_dir",
+which core.datacollector.load_chunks reads back.
+
+Run from the repository root with:
+    python -m core.batch sweep.json --output results.jsonl --jobs 8
+"""
+
+import argparse
+import contextlib
+import copy
+import hashlib
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal as Dec
+from typing import Any, Dict, List, Optional, Set
+
+import tqdm
+
+from core import model, settingsloader
+
+
+def set_setting(settings: Dict[str, Any], path: str, value: Any) -> None:
+    """
+    Set the setting at the given dotted path to the given value,
+    converted to the type of the setting it replaces.
+    """
+    *sections, name = path.split(".")
+    section = settings
+    for key in sections:
+        if key not in section or type(section[key]) != dict:
+            raise Exception(f"Error: {path} is not a setting")
+        section = section[key]
+    if name not in section:
+        raise Exception(f"Error: {path} is not a setting")
+
+    default = section[name]
+    if type(default) == dict:
+        raise Exception(f"Error: {path} is a section, not a setting")
+    elif type(default) == bool:
+        section[name] = value if type(value) == bool else str(value).lower() == "true"
+    elif type(default) == int:
+        section[name] = int(value)
+    elif type(default) == Dec:
+        # Go through the string so that floats keep the value they were written with.
+        section[name] = Dec(str(value))
+    elif type(default) == str:
+        section[name] = str(value)
+    else:
+        section[name] = value
+
+
+def expand_sweep(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Return every run of the sweep: each combination of the swept values, once per seed.
+    Each run holds the settings it changes from the defaults, and its seed.
+    """
+    swept = spec.get("sweep", {})
+    paths = list(swept)
+    runs = []
+    for values in itertools.product(*(swept[path] for path in paths)):
+        for seed in spec.get("seeds", [0]):
+            overrides = dict(spec.get("settings", {}))
+            overrides.update(zip(paths, values))
+            runs.append({"settings": overrides, "seed": seed})
+    return runs
+
+
+def run_key(run: Dict[str, Any]) -> str:
+    """A key identifying a run by its settings and seed, to recognise it when resuming."""
+    return json.dumps([run["settings"], run["seed"]], sort_keys=True)
+
+
+def make_settings(run: Dict[str, Any]) -> Dict[str, Any]:
+    """The full settings for a run: the defaults, with the run's settings and seed applied."""
+    settings = settingsloader.get_defaults()
+    for path, value in run["settings"].items():
+        set_setting(settings, path, value)
+    settings['Model']['seed'] = run["seed"]
+    return settings
+
+
+def run_model(run: Dict[str, Any], max_steps: int, intervals: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """
+    Run a model for up to max_steps, returning the run with what it produced.
+    A run ended early by an exception still returns what it produced until then.
+    Statistics are collected at the given intervals, by name, if given.
+    """
+    settings = make_settings(run)
+    model_settings = copy.deepcopy(settings['Model'])
+    model_settings['agent_fractions'] = settings['Agents']['AgentFractions']
+    model_settings['collector_intervals'] = intervals
+
+    result = dict(run, steps=0, error=None)
+    if model_settings['collector_output_dir']:
+        # Each run streams its statistics to its own directory, named for the run.
+        series_dir = os.path.join(
+            model_settings['collector_output_dir'],
+            hashlib.sha1(run_key(run).encode()).hexdigest()[:16]
+        )
+        model_settings['collector_output_dir'] = series_dir
+        result["series_dir"] = series_dir
+    havven_model = None
+    start = time.perf_counter()
+    # The agents print freely, which is just noise across many runs.
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            havven_model = model.HavvenModel(
+                model_settings,
+                settings['Fees'],
+                settings['Agents'],
+                settings['Havven'],
+                settings['Mint']
+            )
+            # Every statistic is collected in the last step, whatever its interval.
+            havven_model.datacollector.final_step = max_steps
+            for _ in range(max_steps):
+                havven_model.step()
+                result["steps"] += 1
+        except Exception as e:
+            result["error"] = repr(e)
+    result["seconds"] = time.perf_counter() - start
+
+    result["reporters"] = {}
+    if havven_model is not None:
+        havven_model.datacollector.flush()
+        result["reporters"] = havven_model.datacollector.latest_values()
+    return result
+
+
+def completed_runs(path: str) -> Set[str]:
+    """The keys of the runs already written to the given results file."""
+    keys = set()
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    keys.add(run_key(json.loads(line)))
+    return keys
+
+
+def run_sweep(spec: Dict[str, Any], output: str, jobs: int, resume: bool = False) -> int:
+    """
+    Run every run of the sweep across a pool of processes,
+    appending each result to the output file as it finishes.
+    Return the number of runs made.
+    """
+    runs = expand_sweep(spec)
+    if resume:
+        done = completed_runs(output)
+        runs = [run for run in runs if run_key(run) not in done]
+    else:
+        open(output, "w").close()
+
+    # Check every run's settings before starting any of them.
+    for run in runs:
+        make_settings(run)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor, open(output, "a") as f:
+        futures = [executor.submit(run_model, run, spec["max_steps"], spec.get("intervals")) for run in runs]
+        for future in tqdm.tqdm(as_completed(futures), total=len(futures)):
+            f.write(json.dumps(future.result()) + "\n")
+            f.flush()
+    return len(runs)
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Run a sweep of headless simulations across processes.")
+    parser.add_argument("spec", help="the JSON file describing the sweep")
+    parser.add_argument("--output", default="results.jsonl", help="the file to write each run's results to")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="the number of processes to run at once")
+    parser.add_argument("--steps", type=int, help="the number of steps to run, overriding the spec's max_steps")
+    parser.add_argument("--resume", action="store_true",
+                        help="keep the runs already in the output file, and make only the rest")
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    if args.steps is not None:
+        spec["max_steps"] = args.steps
+    if "max_steps" not in spec:
+        parser.error("the spec has no max_steps, and --steps was not given")
+
+    count = run_sweep(spec, args.output, args.jobs, args.resume)
+    print(f"Wrote {count} runs to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -7,14 +7,46 @@ given certain parameters.
 This should work hand-in-hand with CachedServer to allow users to view
 these cached runs, without using large amounts of server resources by
 generating new data per user.
+
+Each dataset is kept in its own directory under CACHE_DIR, in the format
+described in cachestore.py, under a key hashed from everything that decides its
+data: its settings merged into the defaults, including the seed, its number of steps,
+how it is stored, and the source of the code that generates it. A change to any of
+these makes a new version of the dataset, which is generated alongside the old,
+and the least recently used old versions are evicted once the cache outgrows its budget.
 """
 
-import pickle
+import functools
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
 
 import tqdm
 
 from core import model
 from core import settingsloader
+from core.cachestore import CacheStore
+
+CACHE_DIR = "./cache"
+"""The directory the cached datasets are kept in."""
+
+FINGERPRINTED_SOURCES = [
+    "agents/*.py",
+    "managers/*.py",
+    "core/model.py",
+    "core/orderbook.py",
+    "core/scheduler.py",
+    "core/stats.py",
+    "core/datacollector.py",
+    "core/server.py",
+    "visualization/modules/*.py"
+]
+"""The source files, relative to the repository root, that decide the data of a dataset."""
 
 run_settings = [
     # settings for each individual run to create a cache for.
@@ -119,32 +151,82 @@ def set_run_settings(defaults, run_settings):
     return settings
 
 
-def generate_new_caches(data):
+@functools.lru_cache(maxsize=None)
+def code_fingerprint() -> str:
+    """a hash of the source of the code that decides the data of a dataset"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha1()
+    for pattern in FINGERPRINTED_SOURCES:
+        for path in sorted(glob.glob(os.path.join(root, pattern))):
+            digest.update(os.path.relpath(path, root).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def dataset_settings(item: Dict[str, Any], defaults: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """the settings of a run_settings item, merged into the defaults, or those of settingsloader if not given"""
+    return set_run_settings(defaults if defaults is not None else settingsloader.get_defaults(), item['settings'])
+
+
+def dataset_key(item: Dict[str, Any], settings: Dict[str, Any], chunk_steps: int, codec: str) -> str:
     """
-    generate a new dataset for each dataset that doesn't already exist in data
+    the key of the dataset of a run_settings item, with the given merged settings, chunking and codec
 
-    overwrites the defined default settings for every run
+    the server settings don't change the data, so they are left out
+    """
+    identity = {
+        "name": item['name'],
+        "settings": settingsloader.set_dec_to_str({k: v for k, v in settings.items() if k != "Server"}),
+        "max_steps": item['max_steps'],
+        "chunk_steps": chunk_steps,
+        "codec": codec,
+        "code": code_fingerprint()
+    }
+    return hashlib.sha1(json.dumps(identity, sort_keys=True).encode()).hexdigest()[:20]
 
-    generate visualisation results for every step up to max_steps, and save it to 'result'
 
-    store the result in the format:
-      data["name"] = {"data": result, "settings": settings, "max_steps": max_steps}
+def dataset_keys(defaults: Optional[Dict[str, Any]] = None, chunk_steps: int = 100,
+                 codec: str = "none") -> Dict[str, str]:
+    """the key of the current version of each dataset in run_settings, by name"""
+    return {
+        item['name']: dataset_key(item, dataset_settings(item, defaults), chunk_steps, codec)
+        for item in run_settings
+    }
+
+
+def generate_dataset(path: str, item: Dict[str, Any], chunk_steps: int = 100, codec: str = "none",
+                     progress: Optional[Callable[[int], Any]] = None,
+                     defaults: Optional[Dict[str, Any]] = None) -> str:
+    """
+    generate the dataset described by a run_settings item, with its settings merged into
+    defaults, writing it to the store at path under its key, which is returned
+
+    generate visualisation results for every step up to max_steps, and write each
+    step to the dataset as it is generated, in chunks of chunk_steps steps, encoded with codec,
+    each chunk along with a snapshot of the model
+
+    if the dataset was left unfinished, carry on from the snapshot of its last complete chunk
+
+    progress, if given, is called with the number of steps done: first with those already
+    written, if resuming, then with 1 for each step generated
     """
     from core.server import get_vis_elements
 
-    for n, item in enumerate(run_settings):
-        if item["name"] in data and len(data[item['name']]['data']) == item['max_steps']:
-            print("already have:", item['name'])
-            continue
-        print("\nGenerating", item["name"])
-        result = []
-        settings = settingsloader.get_defaults()
+    store = CacheStore(path)
+    settings = dataset_settings(item, defaults)
+    key = dataset_key(item, settings, chunk_steps, codec)
 
-        settings = set_run_settings(settings, item['settings'])
+    model_settings = settings['Model']
+    model_settings['agent_fractions'] = settings['Agents']['AgentFractions']
 
-        model_settings = settings['Model']
-        model_settings['agent_fractions'] = settings['Agents']['AgentFractions']
+    havven_model = None
+    if key in store.datasets and not store.is_complete(key):
+        writer, checkpoint = store.resume(key)
+        if checkpoint is not None:
+            havven_model = model.HavvenModel.restore(checkpoint)
 
+    if havven_model is None:
         havven_model = model.HavvenModel(
             model_settings,
             settings['Fees'],
@@ -152,53 +234,81 @@ def generate_new_caches(data):
             settings['Havven'],
             settings['Mint']
         )
-        vis_elements = get_vis_elements()
-
-        # # The following is for running the loop without tqdm for profiling
-        # # As when profiling the model, tqdm shows up as ~17% runtime
-        # for i in range(item["max_steps"]):
-        #     if not i % 100:
-        #         print(f"{n+1}/{len(run_settings)} [{'='*(i//100)}{'-'*(item['max_steps']//100 - i//100)}" +
-        #               f"] {i}/{item['max_steps']}")
-
-        for i in tqdm.tqdm(range(item["max_steps"])):
-            havven_model.step()
-            step_data = []
-            for element in vis_elements:
+        writer = store.create(
+            key, item["name"], item["description"], settingsloader.set_dec_to_str(settings),
+            item["max_steps"], chunk_steps, codec
+        )
+    vis_elements = get_vis_elements()
+    first_step = writer.steps
+    if progress is not None and first_step:
+        progress(first_step)
+
+    for i in range(first_step, item["max_steps"]):
+        havven_model.step()
+        step_data = []
+        for element in vis_elements:
+            if hasattr(element, "sent_data"):
+                # the first step sends the data that only needs sending once, which a resumed dataset has
                 if i == 0:
-                    if hasattr(element, "sent_data"):
-                        element.sent_data = False
-                        element_data = element.render(havven_model)
-                    else:
-                        element_data = element.render(havven_model)
-                else:
-                    element_data = element.render(havven_model)
-                step_data.append(element_data)
-
-            result.append(step_data)
-        data[item["name"]] = {
-            "data": result,
-            "settings": settings,
-            "max_steps": item["max_steps"],
-            "description": item["description"]
-        }
-    return data
-
-
-def load_saved():
-    try:
-        with open("./cache_data.pkl", 'rb') as f:
-            print("Loading from cache_data.pkl...")
-            data = pickle.load(f)
-    except IOError:
-        data = {}
-    except EOFError:
-        data = {}
-    return data
-
-
-def save_data(data):
-    """overwrite existing cache file with the presented data"""
-    with open("./cache_data.pkl", "wb") as f:
-        pickle.dump(data, f)
-    print("Caches saved to cache_data.pkl")
+                    element.sent_data = False
+                elif i == first_step:
+                    element.sent_data = True
+            element_data = element.render(havven_model)
+            step_data.append(element_data)
+
+        # the past orders chart totals every trade, so the checkpoints keep them
+        writer.append(step_data, lambda: havven_model.snapshot(history=True))
+        if progress is not None:
+            progress(1)
+    writer.close()
+    return key
+
+
+def generate_new_caches(store: CacheStore, chunk_steps: int = 100, codec: str = "none",
+                        jobs: Optional[int] = None, defaults: Optional[Dict[str, Any]] = None) -> CacheStore:
+    """
+    generate a new dataset for each dataset whose current version isn't already complete in the store
+
+    overwrites the given default settings, or those of settingsloader, for every run
+
+    the datasets are generated across a pool of up to jobs processes, each writing
+    its own dataset, with their progress shown together
+
+    a dataset left unfinished, by a crash or by being stopped, carries on from its last
+    complete chunk, as long as its key is unchanged
+    """
+    keys = dataset_keys(defaults, chunk_steps, codec)
+    missing = []
+    for item in run_settings:
+        if store.is_complete(keys[item['name']]):
+            print("already have:", item['name'])
+            continue
+        print("Generating", item["name"])
+        missing.append(item)
+    if not missing:
+        return store
+
+    with multiprocessing.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=min(jobs or os.cpu_count(), len(missing))) as executor:
+        steps_done = manager.Queue()
+        futures = [
+            executor.submit(generate_dataset, store.path, item, chunk_steps, codec, steps_done.put, defaults)
+            for item in missing
+        ]
+        with tqdm.tqdm(total=sum(item['max_steps'] for item in missing)) as progress_bar:
+            while not all(future.done() for future in futures) or not steps_done.empty():
+                try:
+                    progress_bar.update(steps_done.get(timeout=0.1))
+                except queue.Empty:
+                    pass
+        # raise any exception that stopped a dataset, now that the others are finished
+        for future in futures:
+            future.result()
+
+    store.refresh()
+    return store
+
+
+def load_saved(path: str = CACHE_DIR) -> CacheStore:
+    """open the store of cached datasets, reading only their descriptions"""
+    return CacheStore(path)
@@ -0,0 +1,281 @@
+"""
+cachestore.py
+
+An on-disk store of cached datasets, with each dataset kept in its own
+directory of chunked, memory-mapped files, so that datasets can be served
+without loading them, and written without rewriting one another.
+"""
+
+import glob
+import json
+import mmap
+import os
+import shutil
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class CacheStore:
+    """
+    Cached datasets on disk, each in its own directory, holding its steps in chunks.
+
+    Datasets are identified by a key, which names their directory, so that several
+    versions of a dataset of the same name can be kept at once.
+
+    A dataset's directory holds meta.json, which describes the dataset, how many
+    of its steps are written and when it was last used, and, for each chunk of steps,
+    a data file and an index. Each step is stored as JSON, compressed if the dataset
+    uses the zlib codec, and the index holds the offset of each step in the data file,
+    so a step is read from the memory-mapped data file without reading any other.
+
+    Opening a store reads only the datasets' descriptions. The most recently read
+    chunks are kept mapped, so memory use follows what is being served.
+
+    Each chunk of an unfinished dataset can be written with a checkpoint, from which its
+    writer can carry on after a crash, rather than starting the dataset over.
+    """
+
+    codecs = ("none", "zlib")
+    """The ways steps can be encoded: as plain JSON, or as JSON compressed with zlib."""
+
+    def __init__(self, path: str, max_open_chunks: int = 16) -> None:
+        self.path = path
+        self.max_open_chunks = max_open_chunks
+        os.makedirs(path, exist_ok=True)
+
+        self.datasets: Dict[str, Dict[str, Any]] = {}
+        """The description of each dataset, by key."""
+        self._open_chunks: "OrderedDict[Tuple[str, int], Tuple[mmap.mmap, np.ndarray]]" = OrderedDict()
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Read the description of every dataset again, as written by any process."""
+        for entry in list(self._open_chunks):
+            self._open_chunks.pop(entry)[0].close()
+        self.datasets = {}
+        for entry in sorted(os.listdir(self.path)):
+            meta_path = os.path.join(self.path, entry, "meta.json")
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                self.datasets[meta["key"]] = meta
+
+    def dataset_path(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def steps(self, key: str) -> int:
+        """The number of steps written of the dataset, or 0 if there is no such dataset."""
+        return self.datasets[key]["steps"] if key in self.datasets else 0
+
+    def is_complete(self, key: str) -> bool:
+        """Whether the dataset exists and every one of its steps is written."""
+        return key in self.datasets and self.datasets[key]["complete"]
+
+    def create(self, key: str, name: str, description: str, settings: Dict[str, Any], max_steps: int,
+               chunk_steps: int = 100, codec: str = "none") -> "DatasetWriter":
+        """
+        Start writing a new dataset under the given key, replacing any with the same key,
+        returning the writer to add its steps with.
+        """
+        if codec not in self.codecs:
+            raise Exception(f"Error: {codec} is not a cache codec, expected one of {self.codecs}")
+        self.remove(key)
+        meta = {
+            "key": key,
+            "name": name,
+            "description": description,
+            "settings": settings,
+            "max_steps": max_steps,
+            "chunk_steps": chunk_steps,
+            "codec": codec,
+            "steps": 0,
+            "complete": False,
+            "last_used": time.time()
+        }
+        os.makedirs(self.dataset_path(key))
+        self.write_meta(meta)
+        self.datasets[key] = meta
+        return DatasetWriter(self, meta)
+
+    def resume(self, key: str) -> Tuple["DatasetWriter", Optional[bytes]]:
+        """
+        Carry on writing an unfinished dataset after its last complete chunk,
+        returning the writer, and the checkpoint written with that chunk, if there is one.
+        """
+        if self.is_complete(key) or key not in self.datasets:
+            raise Exception(f"Error: there is no unfinished dataset {key} to resume")
+        self._close_chunks(key)
+        writer = DatasetWriter(self, self.datasets[key])
+        checkpoint_path = writer.checkpoint_path(writer.meta["steps"])
+        checkpoint = None
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "rb") as f:
+                checkpoint = f.read()
+        return writer, checkpoint
+
+    def remove(self, key: str) -> None:
+        """Remove the dataset, if it exists, leaving the others untouched."""
+        self._close_chunks(key)
+        self.datasets.pop(key, None)
+        shutil.rmtree(self.dataset_path(key), ignore_errors=True)
+
+    def touch(self, key: str) -> None:
+        """Record that the dataset was used just now, so it is the last to be evicted."""
+        self.datasets[key]["last_used"] = time.time()
+        self.write_meta(self.datasets[key])
+
+    def size(self, key: str) -> int:
+        """The number of bytes the dataset takes up on disk."""
+        return sum(entry.stat().st_size for entry in os.scandir(self.dataset_path(key)) if entry.is_file())
+
+    def evict(self, budget: int, keep: Iterable[str] = ()) -> List[str]:
+        """
+        Remove the least recently used datasets, other than those to keep,
+        until the store takes up no more than budget bytes, or only those to keep are left.
+        Return the keys of the datasets removed.
+        """
+        keep = set(keep)
+        sizes = {key: self.size(key) for key in self.datasets}
+        total = sum(sizes.values())
+        evicted = []
+        for key in sorted(self.datasets, key=lambda key: self.datasets[key]["last_used"]):
+            if total <= budget:
+                break
+            if key not in keep:
+                self.remove(key)
+                total -= sizes[key]
+                evicted.append(key)
+        return evicted
+
+    def write_meta(self, meta: Dict[str, Any]) -> None:
+        """Write the description of a dataset, replacing the last in one step."""
+        meta_path = os.path.join(self.dataset_path(meta["key"]), "meta.json")
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def _close_chunks(self, key: str) -> None:
+        for entry in [entry for entry in self._open_chunks if entry[0] == key]:
+            self._open_chunks.pop(entry)[0].close()
+
+    def _chunk(self, key: str, chunk: int) -> Tuple[mmap.mmap, np.ndarray]:
+        """Return the mapped data and the offsets of the steps of a chunk of the dataset."""
+        entry = (key, chunk)
+        if entry in self._open_chunks:
+            self._open_chunks.move_to_end(entry)
+            return self._open_chunks[entry]
+
+        base = os.path.join(self.dataset_path(key), f"chunk_{chunk:06d}")
+        offsets = np.load(base + ".idx.npy")
+        with open(base + ".bin", "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._open_chunks[entry] = (data, offsets)
+        if len(self._open_chunks) > self.max_open_chunks:
+            self._open_chunks.popitem(last=False)[1][0].close()
+        return data, offsets
+
+    def get_step_json(self, key: str, step: int) -> Optional[bytes]:
+        """
+        Return the data of a step of the dataset as the JSON it is stored as,
+        decompressed if need be, or None if it isn't written.
+        """
+        if not 0 <= step < self.steps(key):
+            return None
+        meta = self.datasets[key]
+        chunk, index = divmod(step, meta["chunk_steps"])
+        data, offsets = self._chunk(key, chunk)
+        encoded = data[offsets[index]:offsets[index + 1]]
+        if meta["codec"] == "zlib":
+            encoded = zlib.decompress(encoded)
+        return encoded
+
+    def get_steps_json(self, key: str, step_start: int, step_end: int) -> List[bytes]:
+        """Return the JSON of each written step of the dataset from step_start up to step_end."""
+        return [self.get_step_json(key, step) for step in range(max(step_start, 0), min(step_end, self.steps(key)))]
+
+    def get_step(self, key: str, step: int) -> Optional[Any]:
+        """Return the data of a step of the dataset, or None if it isn't written."""
+        encoded = self.get_step_json(key, step)
+        return json.loads(encoded) if encoded is not None else None
+
+    def get_steps(self, key: str, step_start: int, step_end: int) -> List[Any]:
+        """Return the data of each written step of the dataset from step_start up to step_end."""
+        return [json.loads(encoded) for encoded in self.get_steps_json(key, step_start, step_end)]
+
+
+class DatasetWriter:
+    """
+    Writes the steps of a dataset to its store, a chunk at a time.
+    Each chunk is written in full and then recorded in the dataset's description,
+    so that a dataset is never left with a partly written chunk.
+
+    Each chunk can be written with a checkpoint, the bytes needed to carry on generating
+    the steps after it, which is kept until the next chunk is recorded, or the dataset is complete.
+    """
+
+    def __init__(self, store: CacheStore, meta: Dict[str, Any]) -> None:
+        self.store = store
+        self.meta = meta
+        self.path = store.dataset_path(meta["key"])
+        self._pending: List[bytes] = []
+
+    @property
+    def steps(self) -> int:
+        """The number of steps added, whether or not they are written out yet."""
+        return self.meta["steps"] + len(self._pending)
+
+    def checkpoint_path(self, steps: int) -> str:
+        """The path of the checkpoint written with the chunk ending after the given number of steps."""
+        return os.path.join(self.path, f"checkpoint_{steps:09d}.bin")
+
+    def append(self, step_data: Any, checkpoint: Optional[Callable[[], bytes]] = None) -> None:
+        """
+        Add the data of the next step, writing out the chunk it completes,
+        along with the bytes returned by checkpoint, if given.
+        """
+        encoded = json.dumps(step_data, separators=(",", ":")).encode()
+        if self.meta["codec"] == "zlib":
+            encoded = zlib.compress(encoded)
+        self._pending.append(encoded)
+        if len(self._pending) == self.meta["chunk_steps"]:
+            self._write_chunk(checkpoint)
+
+    def close(self) -> None:
+        """Write out the last, partly full chunk, and mark the dataset as complete."""
+        if self._pending:
+            self._write_chunk()
+        self.meta["complete"] = True
+        self.store.write_meta(self.meta)
+        for path in glob.glob(os.path.join(self.path, "checkpoint_*.bin")):
+            os.remove(path)
+
+    def _write_chunk(self, checkpoint: Optional[Callable[[], bytes]] = None) -> None:
+        chunk = self.meta["steps"] // self.meta["chunk_steps"]
+        base = os.path.join(self.path, f"chunk_{chunk:06d}")
+        offsets = np.zeros(len(self._pending) + 1, dtype=np.int64)
+        np.cumsum([len(encoded) for encoded in self._pending], out=offsets[1:])
+
+        # Write to temporary files first, so an interrupted write leaves no partial chunk behind.
+        with open(base + ".bin.tmp", "wb") as f:
+            f.write(b"".join(self._pending))
+        with open(base + ".idx.tmp", "wb") as f:
+            np.save(f, offsets)
+        os.replace(base + ".bin.tmp", base + ".bin")
+        os.replace(base + ".idx.tmp", base + ".idx.npy")
+
+        # The checkpoint is written before the chunk is recorded, and the one before it removed only after.
+        previous = self.meta["steps"]
+        if checkpoint is not None:
+            with open(self.checkpoint_path(self.steps) + ".tmp", "wb") as f:
+                f.write(checkpoint())
+            os.replace(self.checkpoint_path(self.steps) + ".tmp", self.checkpoint_path(self.steps))
+
+        self.meta["steps"] = self.steps
+        self._pending = []
+        self.store.write_meta(self.meta)
+        if os.path.exists(self.checkpoint_path(previous)):
+            os.remove(self.checkpoint_path(previous))
@@ -0,0 +1,177 @@
+"""datacollector.py: A collector of the model's statistics, keeping each as a column of floats."""
+
+import glob
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+Reporter = Callable[[Any], Any]
+
+
+def load_chunks(directory: str) -> Dict[str, np.ndarray]:
+    """
+    Read back every chunk a collector has written to the given directory,
+    returning the values of each reporter across all of them, with the step of each row as "Step".
+    """
+    chunks = [np.load(path) for path in sorted(glob.glob(os.path.join(directory, "steps_*.npz")))]
+    if not chunks:
+        return {}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0].files}
+
+
+class ColumnarDataCollector:
+    """
+    Collects the values of the model's reporters each step, as mesa's DataCollector does,
+    but keeps the values of each numeric reporter as a column of float64s, preallocated
+    and grown geometrically, rather than as an ever-growing list of Python objects.
+
+    Reporters of anything else, such as the order books, and agent reporters keep only
+    their latest values, so the collector holds no references to objects of past steps.
+
+    Each reporter may be given an interval: it is then evaluated only every that many steps,
+    or, with an interval of at_end, only in the final step of the run, if one is set.
+    Its column holds NaN in the steps it isn't evaluated, and its latest value is that
+    of the last step it was.
+
+    If given a directory to stream to, every chunk_steps steps the collector writes the
+    rows it holds to a new NPZ file there, and drops them from memory, so its memory use
+    is bounded however long the run is. The chunks can be read back with load_chunks.
+    """
+
+    at_end: int = 0
+    """The interval of a reporter evaluated only in the final step."""
+
+    def __init__(self, model_reporters: Dict[str, Reporter],
+                 object_reporters: Optional[Dict[str, Reporter]] = None,
+                 agent_reporters: Optional[Dict[str, Reporter]] = None,
+                 capacity: int = 1024,
+                 output_dir: Optional[str] = None,
+                 chunk_steps: int = 1000,
+                 intervals: Optional[Dict[str, int]] = None) -> None:
+        """
+        :param model_reporters: functions of the model returning numbers, collected into columns
+        :param object_reporters: functions of the model returning anything else, of which only the latest is kept
+        :param agent_reporters: functions of each scheduled agent, of which only the latest values are kept
+        :param capacity: the number of steps to preallocate room for, if not streaming
+        :param output_dir: the directory to stream chunks of collected steps to, or None to keep them in memory
+        :param chunk_steps: the number of steps in each chunk, if streaming
+        :param intervals: how often each reporter is evaluated, in steps, or at_end, by name; every step if not given
+        """
+        self.model_reporters = dict(model_reporters)
+        self.object_reporters = dict(object_reporters or {})
+        self.agent_reporters = dict(agent_reporters or {})
+
+        self.output_dir = output_dir
+        self.chunk_steps = chunk_steps
+        self.intervals: Dict[str, int] = dict(intervals or {})
+        if any(interval < 0 for interval in self.intervals.values()):
+            raise Exception(f"Error: reporter intervals must not be negative: {self.intervals}")
+        if output_dir is not None:
+            if chunk_steps < 1:
+                raise Exception(f"Error: chunks must hold at least one step, not {chunk_steps}")
+            os.makedirs(output_dir, exist_ok=True)
+            # A full chunk is written out before the next step is added, so it never needs more room.
+            capacity = chunk_steps
+
+        self.steps: int = 0
+        """The number of steps collected, including any written out in chunks."""
+        self.size: int = 0
+        """The number of steps held in memory."""
+        self.final_step: Optional[int] = None
+        """The step, counting from 0, in which every reporter is evaluated, as the last of the run."""
+
+        self._capacity = max(capacity, 1)
+        self._columns: Dict[str, np.ndarray] = {name: np.zeros(self._capacity) for name in self.model_reporters}
+        self._latest: Dict[str, Any] = {}
+        self._agent_records: Dict[str, List[Tuple[int, Any]]] = {}
+
+    def _due(self, name: str, step: int) -> bool:
+        """Whether the named reporter is evaluated in the given step."""
+        if step == self.final_step:
+            return True
+        interval = self.intervals.get(name, 1)
+        return interval != self.at_end and step % interval == 0
+
+    def collect(self, model) -> None:
+        """Collect the values of every reporter due this step, for the model as it stands."""
+        step = self.steps
+        self._append({name: reporter(model) for name, reporter in self.model_reporters.items()
+                      if self._due(name, step)})
+        for name, reporter in self.object_reporters.items():
+            if self._due(name, step):
+                self._latest[name] = reporter(model)
+        for name, reporter in self.agent_reporters.items():
+            if self._due(name, step):
+                self._agent_records[name] = [(agent.unique_id, reporter(agent)) for agent in model.schedule.agents]
+
+    def _append(self, values: Dict[str, Any]) -> None:
+        """
+        Add a row of numeric reporter values, leaving those not given as NaN.
+        If streaming and the rows held fill a chunk, they are written out first.
+        """
+        if self.output_dir is not None and self.size == self.chunk_steps:
+            self.flush()
+        if self.size == self._capacity:
+            for name, column in self._columns.items():
+                self._columns[name] = np.concatenate([column, np.zeros(self._capacity)])
+            self._capacity *= 2
+
+        for name, column in self._columns.items():
+            column[self.size] = values.get(name, np.nan)
+        self._latest.update(values)
+        self.size += 1
+        self.steps += 1
+
+    def flush(self) -> None:
+        """If streaming, write the steps held in memory out to a new chunk, and drop them."""
+        if self.output_dir is None or self.size == 0:
+            return
+        first = self.steps - self.size
+        np.savez(
+            os.path.join(self.output_dir, f"steps_{first:09d}.npz"),
+            Step=np.arange(first, self.steps),
+            **{name: column[:self.size] for name, column in self._columns.items()}
+        )
+        self.size = 0
+
+    def latest(self, name: str) -> Any:
+        """Return the latest value of the named model or object reporter, as the reporter returned it."""
+        return self._latest[name]
+
+    def latest_values(self) -> Dict[str, Any]:
+        """Return the latest value of every numeric reporter, by name."""
+        return {name: self._latest[name] for name in self.model_reporters if name in self._latest}
+
+    def agent_records(self, name: str) -> List[Tuple[int, Any]]:
+        """Return the unique id of each agent, with its latest value of the named agent reporter."""
+        return self._agent_records.get(name, [])
+
+    def series(self, name: str) -> np.ndarray:
+        """Return every value collected of the named numeric reporter, reading back any chunks written."""
+        held = self._columns[name][:self.size]
+        if self.output_dir is None:
+            return held.copy()
+        return np.concatenate([load_chunks(self.output_dir).get(name, np.zeros(0)), held])
+
+    def get_model_vars_dataframe(self) -> pd.DataFrame:
+        """Return every value collected of the numeric reporters as a DataFrame, indexed by step."""
+        written = load_chunks(self.output_dir) if self.output_dir is not None else {}
+        steps = np.arange(self.steps - self.size, self.steps)
+        return pd.DataFrame(
+            {name: np.concatenate([written.get(name, np.zeros(0)), column[:self.size]])
+             for name, column in self._columns.items()},
+            index=pd.Index(np.concatenate([written.get("Step", np.zeros(0, dtype=int)), steps]), name="Step")
+        )
+
+    def latest_state(self) -> Tuple[Dict[str, Any], Dict[str, List[Tuple[int, Any]]]]:
+        """The latest values of every reporter, from which a new collector can carry on, as in a model snapshot."""
+        return dict(self._latest), dict(self._agent_records)
+
+    def restore_latest(self, state: Tuple[Dict[str, Any], Dict[str, List[Tuple[int, Any]]]]) -> None:
+        """Take on the latest values of another collector, given by its latest_state, as the first step collected."""
+        latest, agent_records = state
+        self._append({name: latest[name] for name in self.model_reporters if name in latest})
+        self._latest.update(latest)
+        self._agent_records.update(agent_records)
@@ -1,14 +1,16 @@
 """model.py: The Havven model itself lives here."""
 
+import pickle
+import random
 from decimal import Decimal as Dec
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from mesa import Model
-from mesa.time import RandomActivation
 
 import agents as ag
 from managers import HavvenManager, AgentManager, FeeManager, MarketManager, Mint
 from core import stats
+from core.scheduler import HavvenActivation
 
 
 class HavvenModel(Model):
@@ -31,6 +33,11 @@ class HavvenModel(Model):
         :param model_settings: Setting that are modifiable on the frontend
          - agent_fraction: what percentage of each agent to use
          - num_agents: the total number of agents to use
+         - seed: the seed for the model's random generator, or None for an unseeded run
+         - collector_output_dir: a directory to stream the collected statistics to, or "" to keep them in memory
+         - collector_chunk_steps: how many steps of statistics to write to each file, if streaming
+         - collector_interval: how often, in steps, statistics are collected, or 0 to collect them only in the final step
+         - collector_intervals: optionally, the interval of individual statistics, by name
          - utilisation_ratio_max: the max utilisation ratio for nomin issuance against havvens
          or at the end of each tick
         :param fee_settings: explained in feemanager.py
@@ -44,11 +51,29 @@ class HavvenModel(Model):
         # Mesa setup.
         super().__init__()
 
+        # Every random draw, by the scheduler and by the agents, comes from this model's own generator,
+        # so that runs from the same seed are identical, whatever else is running in the process.
+        # Mesa keeps its generator on the model class, so each model needs its own.
+        self.random = random.Random()
+        self.reset_randomizer(model_settings.get('seed'))
+
+        # Whether the snapshot being taken keeps the records of past trades, which agents and books read.
+        self.snapshot_history = False
+
         # The schedule will activate agents in a random order per step.
-        self.schedule = RandomActivation(self)
+        self.schedule = HavvenActivation(
+            self,
+            skip_idle_agents=agent_settings['skip_idle_agents'],
+            batch_agent_types=agent_settings['batch_agent_types']
+        )
 
-        # Set up data collection.
-        self.datacollector = stats.create_datacollector()
+        # Set up data collection, streaming it to disk if given a directory.
+        self.datacollector = stats.create_datacollector(
+            model_settings.get('collector_output_dir') or None,
+            model_settings.get('collector_chunk_steps', 1000),
+            model_settings.get('collector_interval', 1),
+            model_settings.get('collector_intervals')
+        )
 
         # Initialise simulation managers.
         self.manager = HavvenManager(
@@ -84,6 +109,56 @@ class HavvenModel(Model):
         self.mint.calculate_copt_cmax()
         self.datacollector.collect(self)
 
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        The model's state for pickling, as in a snapshot.
+        The data collector's reporters can't be pickled, so the collector is rebuilt on unpickling,
+        with the same reporter intervals, keeping its data in memory, and holding only the latest data
+        collected, which some agents read.
+        """
+        state = self.__dict__.copy()
+        state['datacollector'] = (self.datacollector.intervals, self.datacollector.latest_state())
+        state['snapshot_history'] = False
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        # Every other object is restored before the model itself, so the agents can now be read.
+        self.manager.sort_issuers()
+        intervals, latest = state['datacollector']
+        self.datacollector = stats.create_datacollector(intervals=intervals)
+        self.datacollector.restore_latest(latest)
+
+    def snapshot(self, history: bool = False) -> bytes:
+        """
+        Return a snapshot of the model as it stands, from which it can be restored to carry on
+        exactly as it would have from here: the agents and their balances, the live orders and
+        the state of each order book, the Havven, fee and mint managers, the schedule, and the
+        state of the random generator.
+        Records of past trades, per-tick chart data and collected data are left out,
+        apart from the latest tick's, unless history is set, in which case only collected data is.
+        """
+        self.snapshot_history = history
+        try:
+            return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            self.snapshot_history = False
+
+    @staticmethod
+    def restore(snapshot: bytes) -> "HavvenModel":
+        """Return a new model in the state captured by the given snapshot."""
+        return pickle.loads(snapshot)
+
+    def fork(self, seed: Optional[int] = None) -> "HavvenModel":
+        """
+        Return an independent copy of the model as it stands.
+        Unless given a new seed for its random generator, the copy carries on exactly as this model will.
+        """
+        forked = HavvenModel.restore(self.snapshot())
+        if seed is not None:
+            forked.reset_randomizer(seed)
+        return forked
+
     def fiat_value(self, havvens=Dec('0'), nomins=Dec('0'),
                    fiat=Dec('0')) -> Dec:
         """Return the equivalent fiat value of the given currency basket."""
@@ -1,12 +1,17 @@
 """orderbook: an order book for trading in a market."""
 
-from typing import Iterable, Callable, List, Optional, Tuple
+from typing import Iterable, Iterator, Callable, List, Optional, Tuple, Deque, Dict, Union, Any
 from decimal import Decimal as Dec
-from itertools import takewhile
-from collections import namedtuple
+from itertools import takewhile, islice
+from collections import namedtuple, deque
+from contextlib import contextmanager
+from operator import neg
+from bisect import bisect_left
 
-# We need a fast ordered data structure to support efficient insertion and deletion of orders.
-from sortedcontainers import SortedListWithKey, SortedDict
+import numpy as np
+
+# We need a fast ordered data structure to support efficient insertion and deletion of price levels.
+from sortedcontainers import SortedDict
 
 import agents as ag
 
@@ -18,6 +23,9 @@ class LimitOrder:
     A single limit order, including price, quantity, the issuer, and orderbook it belongs to.
     """
 
+    __slots__ = ("order_id", "price", "fee", "time", "initial_quantity", "quantity", "issuer", "book", "active",
+                 "_level", "_prev", "_next")
+
     def __init__(self, price: Dec, time: int, quantity: Dec, fee: Dec,
                  issuer: "ag.MarketPlayer", book: "OrderBook") -> None:
         self.price = HavvenManager.round_decimal(price)
@@ -44,6 +52,15 @@ class LimitOrder:
         self.active = self.quantity > 0
         """Whether the order is actively listed or not."""
 
+        self.order_id: Optional[int] = None
+        """The id of this order, unique across all books, given when it is listed."""
+
+        # The price level this order is queued in, and its neighbours in that queue.
+        # These are maintained by the order book's BookSide.
+        self._level: Optional["PriceLevel"] = None
+        self._prev: Optional["LimitOrder"] = None
+        self._next: Optional["LimitOrder"] = None
+
     def cancel(self) -> None:
         """Remove this order from the issuer and the order book if it's active."""
         pass
@@ -73,17 +90,14 @@ class LimitOrder:
 class Bid(LimitOrder):
     """A bid order. Instantiating one of these will automatically add it to its order book."""
 
+    __slots__ = ()
+
     def __init__(self, price: Dec, quantity: Dec, fee: Dec,
                  issuer: "ag.MarketPlayer", book: "OrderBook") -> None:
         super().__init__(price, book.time, quantity, fee, issuer, book)
         # Note that the bid will not be active if quantity is not positive.
         self.book.add_new_bid(self)
 
-    @classmethod
-    def comparator(cls, bid: "Bid"):
-        """Bids are sorted first by descending price and then by ascending time."""
-        return -bid.price, bid.time
-
     def cancel(self) -> None:
         """Remove this bid from the issuer and the order book if it's active."""
         self.book.cancel_bid(self)
@@ -111,17 +125,14 @@ class Bid(LimitOrder):
 class Ask(LimitOrder):
     """An ask order. Instantiating one of these will automatically add it to its order book."""
 
+    __slots__ = ()
+
     def __init__(self, price: Dec, quantity: Dec, fee: Dec,
                  issuer: "ag.MarketPlayer", book: "OrderBook") -> None:
         super().__init__(price, book.time, quantity, fee, issuer, book)
         # Note that the ask will not be active if quantity is not positive.
         self.book.add_new_ask(self)
 
-    @classmethod
-    def comparator(cls, ask: "Ask"):
-        """Asks are sorted first by ascending price and then by ascending time."""
-        return ask.price, ask.time
-
     def cancel(self) -> None:
         """Remove this ask from the issuer and the order book if it's active."""
         self.book.cancel_ask(self)
@@ -146,9 +157,72 @@ class Ask(LimitOrder):
         return "Ask: " + super().__str__()
 
 
+class FixedPointOrder(LimitOrder):
+    """
+    A limit order on a fixed point book, which holds its price, quantity and fee
+    as integer counts of the smallest currency unit, and presents them as Decimals.
+    Values set are rounded to the currency precision, as books already round them.
+    """
+
+    __slots__ = ("price_units", "quantity_units", "fee_units")
+
+    def __init__(self, price: Dec, time: int, quantity: Dec, fee: Dec,
+                 issuer: "ag.MarketPlayer", book: "OrderBook") -> None:
+        # Set the units directly, rather than converting through the Decimal properties.
+        self.price_units = HavvenManager.to_fixed(price)
+        self.quantity_units = HavvenManager.to_fixed(quantity)
+        self.fee_units = HavvenManager.to_fixed(fee)
+        self.time = time
+        self.initial_quantity = quantity
+        self.issuer = issuer
+        self.book = book
+        self.active = self.quantity_units > 0
+        self.order_id = None
+        self._level = self._prev = self._next = None
+
+    @property
+    def price(self) -> Dec:
+        return HavvenManager.from_fixed(self.price_units)
+
+    @price.setter
+    def price(self, value: Dec) -> None:
+        self.price_units = HavvenManager.to_fixed(value)
+
+    @property
+    def quantity(self) -> Dec:
+        return HavvenManager.from_fixed(self.quantity_units)
+
+    @quantity.setter
+    def quantity(self, value: Dec) -> None:
+        self.quantity_units = HavvenManager.to_fixed(value)
+
+    @property
+    def fee(self) -> Dec:
+        return HavvenManager.from_fixed(self.fee_units)
+
+    @fee.setter
+    def fee(self, value: Dec) -> None:
+        self.fee_units = HavvenManager.to_fixed(value)
+
+
+class FixedPointBid(Bid, FixedPointOrder):
+    """A bid on a fixed point book."""
+
+    __slots__ = ()
+
+
+class FixedPointAsk(Ask, FixedPointOrder):
+    """An ask on a fixed point book."""
+
+    __slots__ = ()
+
+
 class TradeRecord:
     """A record of a single trade."""
 
+    __slots__ = ("buyer", "seller", "book", "price", "quantity", "bid_fee", "ask_fee",
+                 "completion_time", "bid", "ask", "log_id")
+
     def __init__(self, buyer: "ag.MarketPlayer", seller: "ag.MarketPlayer", book: "OrderBook",
                  price: Dec, quantity: Dec, bid_fee: Dec, ask_fee: Dec, time: int,
                  bid: 'Bid', ask: 'Ask') -> None:
@@ -162,6 +236,16 @@ class TradeRecord:
         self.completion_time = time
         self.bid = bid
         self.ask = ask
+        self.log_id: Optional[int] = None
+        """The index of this trade in its book's trade log, if it keeps one."""
+
+    @property
+    def buyer_id(self) -> int:
+        return self.buyer.unique_id
+
+    @property
+    def seller_id(self) -> int:
+        return self.seller.unique_id
 
     def __str__(self) -> str:
         return f"{self.buyer} -> {self.seller} : {self.quantity}@{self.price}" \
@@ -171,6 +255,455 @@ class TradeRecord:
 # A type for matching functions in the order book.
 Matcher = Callable[[Bid, Ask], Optional[TradeRecord]]
 
+# One trade planned by a sweep, before its record is made.
+Fill = namedtuple("Fill", ["bid", "ask", "price", "quantity", "bid_fee", "ask_fee"])
+
+# A sweeper fills a taker order against successive resting orders on the other side
+# of a book, performing the transfers, and returns the fills it made.
+Sweeper = Callable[["OrderBook", LimitOrder], List[Fill]]
+
+# A trade read back from a book's trade log, which refers to its participants by id.
+LoggedTrade = namedtuple(
+    "LoggedTrade",
+    ["book", "log_id", "completion_time", "price", "quantity", "buyer_id", "seller_id", "bid_fee", "ask_fee"]
+)
+
+
+class TradeLog:
+    """
+    A columnar record of every trade made on a book, with one NumPy array per field.
+
+    Prices, quantities and fees are stored as integer counts of the smallest
+    currency unit, so they can be read back as Decimals exactly,
+    and buyers and sellers are stored by their unique ids.
+    The arrays grow geometrically as trades are appended.
+    """
+
+    columns = ("time", "price", "quantity", "buyer", "seller", "bid_fee", "ask_fee")
+    """The fields recorded for each trade."""
+
+    def __init__(self, book: "OrderBook", capacity: int = 1024) -> None:
+        self.book = book
+        self.size: int = 0
+        self._data: Dict[str, np.ndarray] = {column: np.zeros(capacity, dtype=np.int64) for column in self.columns}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, trade: TradeRecord) -> int:
+        """Record a trade, returning its index in the log."""
+        index = self.size
+        if index == len(self._data["time"]):
+            for column, values in self._data.items():
+                self._data[column] = np.concatenate([values, np.zeros(len(values), dtype=np.int64)])
+
+        data = self._data
+        data["time"][index] = trade.completion_time
+        data["price"][index] = HavvenManager.to_fixed(trade.price)
+        data["quantity"][index] = HavvenManager.to_fixed(trade.quantity)
+        data["buyer"][index] = trade.buyer.unique_id
+        data["seller"][index] = trade.seller.unique_id
+        data["bid_fee"][index] = HavvenManager.to_fixed(trade.bid_fee)
+        data["ask_fee"][index] = HavvenManager.to_fixed(trade.ask_fee)
+        self.size += 1
+        return index
+
+    def column(self, name: str) -> np.ndarray:
+        """Return the recorded values of a field, with currency amounts in the smallest unit."""
+        return self._data[name][:self.size]
+
+    def float_column(self, name: str) -> np.ndarray:
+        """Return the recorded values of a currency field as floats."""
+        return self.column(name) / HavvenManager.fixed_point_scale
+
+    def record(self, index: int) -> LoggedTrade:
+        """Read back a single trade, with its currency amounts as Decimals."""
+        if not 0 <= index < self.size:
+            raise IndexError("trade log index out of range")
+        data = self._data
+        return LoggedTrade(
+            self.book, index, int(data["time"][index]),
+            HavvenManager.from_fixed(int(data["price"][index])),
+            HavvenManager.from_fixed(int(data["quantity"][index])),
+            int(data["buyer"][index]), int(data["seller"][index]),
+            HavvenManager.from_fixed(int(data["bid_fee"][index])),
+            HavvenManager.from_fixed(int(data["ask_fee"][index]))
+        )
+
+
+class PriceLevel:
+    """
+    All the orders on one side of a book at a single price,
+    held in a doubly linked queue in order of time priority.
+    """
+
+    __slots__ = ("price", "quantity", "head", "tail", "count")
+
+    def __init__(self, price, quantity) -> None:
+        self.price = price
+        self.quantity = quantity
+        self.head: Optional[LimitOrder] = None
+        self.tail: Optional[LimitOrder] = None
+        self.count: int = 0
+
+
+class BookSide:
+    """
+    The orders on one side of an order book, grouped into price levels.
+
+    Orders are kept first by price, best first, and then by time within each level.
+    Adding an order to the back of a level, or removing any order,
+    is constant time unless a level must be created or deleted,
+    and the best order is always available in constant time.
+    """
+
+    def __init__(self, descending: bool) -> None:
+        self.descending = descending
+        """True if higher prices are better, as they are for bids."""
+
+        self.levels: SortedDict = SortedDict(neg) if descending else SortedDict()
+        """The price levels on this side, keyed and ordered by price, best first."""
+
+        self.best: Optional[PriceLevel] = None
+        """The best price level, or None if this side is empty."""
+
+        self.quantity = Dec(0)
+        """The total quantity of all orders on this side."""
+
+        self.value = Dec(0)
+        """The total of price * quantity of all orders on this side."""
+
+        self._count: int = 0
+        # Derived from the levels on demand, and discarded whenever this side changes.
+        self._depth: Optional[List[Tuple[float, float]]] = None
+        self._curve: Optional[Tuple[List, List]] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[LimitOrder]:
+        """Iterate over the orders on this side, in order of priority."""
+        for level in self.levels.values():
+            order = level.head
+            while order is not None:
+                next_order = order._next
+                yield order
+                order = next_order
+
+    def __getitem__(self, index: int) -> LimitOrder:
+        """Return the order at a given position in priority order. The first order is found immediately."""
+        if index == 0 and self.best is not None:
+            return self.best.head
+        if index < 0:
+            index += self._count
+        if 0 <= index < self._count:
+            return next(islice(self, index, None))
+        raise IndexError("order index out of range")
+
+    def add(self, order: LimitOrder, price, quantity) -> None:
+        """
+        Append an order to the back of the queue at its price,
+        given its price and quantity in the units of the price levels.
+        """
+        level = self.levels.get(price)
+        if level is None:
+            level = PriceLevel(price, quantity)
+            self.levels[price] = level
+            best = self.best
+            if best is None or (price > best.price if self.descending else price < best.price):
+                self.best = level
+        else:
+            level.quantity += quantity
+        self.quantity += quantity
+        self.value += price * quantity
+        self._depth = self._curve = None
+
+        order._level = level
+        order._prev = level.tail
+        order._next = None
+        if level.tail is None:
+            level.head = order
+        else:
+            level.tail._next = order
+        level.tail = order
+        level.count += 1
+        self._count += 1
+
+    def adjust(self, order: LimitOrder, quantity) -> None:
+        """Change the quantity recorded at an order's level, without moving the order."""
+        level = order._level
+        level.quantity += quantity
+        self.quantity += quantity
+        self.value += level.price * quantity
+        self._depth = self._curve = None
+
+    def remove(self, order: LimitOrder, quantity) -> None:
+        """
+        Unlink an order from its level, deducting its quantity from the level,
+        and deleting the level if it is emptied.
+        """
+        level = order._level
+        if order._prev is None:
+            level.head = order._next
+        else:
+            order._prev._next = order._next
+        if order._next is None:
+            level.tail = order._prev
+        else:
+            order._next._prev = order._prev
+        order._level = order._prev = order._next = None
+        level.count -= 1
+        self._count -= 1
+        self.quantity -= quantity
+        self.value -= level.price * quantity
+        self._depth = self._curve = None
+
+        if level.count == 0:
+            del self.levels[level.price]
+            if level is self.best:
+                self.best = self.levels.peekitem(0)[1] if self.levels else None
+        else:
+            level.quantity -= quantity
+
+    def depth(self) -> List[Tuple[float, float]]:
+        """
+        Return the price and total quantity at each level as floats, best price first.
+        The list is kept until the side next changes, and should not be modified.
+        """
+        if self._depth is None:
+            self._depth = [(float(level.price), float(level.quantity)) for level in self.levels.values()]
+        return self._depth
+
+    def fill_curve(self) -> Tuple[List, List]:
+        """
+        Return the price of each level, best first, along with the cumulative quantity
+        of all the levels up to and including it.
+        The lists are kept until the side next changes, and should not be modified.
+        """
+        if self._curve is None:
+            prices = []
+            totals = []
+            cumulative = Dec(0)
+            for level in self.levels.values():
+                cumulative += level.quantity
+                prices.append(level.price)
+                totals.append(cumulative)
+            self._curve = (prices, totals)
+        return self._curve
+
+    def fill_price(self, quantity):
+        """
+        Return the price of the first level at which the cumulative quantity reaches
+        the given quantity, or the last level if it never does, or None if this side is empty.
+        """
+        prices, totals = self.fill_curve()
+        if not prices:
+            return None
+        return prices[min(bisect_left(totals, quantity), len(prices) - 1)]
+
+    def fill_quantity(self, price):
+        """Return the total quantity of the levels whose prices are no worse than the given price."""
+        index = self.levels.bisect_right(price)
+        if index == 0:
+            return Dec(0)
+        return self.fill_curve()[1][index - 1]
+
+
+class FixedPointBookSide(BookSide):
+    """
+    The orders on one side of a fixed point order book, whose price levels are keyed
+    and totalled in integer counts of the smallest currency unit.
+    The value total is in units of the smallest currency unit squared.
+    Prices and quantities passed in or returned are Decimals, as for the Decimal book.
+    """
+
+    def __init__(self, descending: bool) -> None:
+        super().__init__(descending)
+        self.quantity = 0
+        self.value = 0
+
+    def depth(self) -> List[Tuple[float, float]]:
+        """
+        Return the price and total quantity at each level as floats, best price first.
+        The list is kept until the side next changes, and should not be modified.
+        """
+        if self._depth is None:
+            from_fixed = HavvenManager.from_fixed
+            self._depth = [(float(from_fixed(level.price)), float(from_fixed(level.quantity)))
+                           for level in self.levels.values()]
+        return self._depth
+
+    def fill_curve(self) -> Tuple[List[int], List[int]]:
+        """
+        Return the price of each level in units, best first, along with the cumulative quantity in units
+        of all the levels up to and including it.
+        The lists are kept until the side next changes, and should not be modified.
+        """
+        if self._curve is None:
+            prices = []
+            totals = []
+            cumulative = 0
+            for level in self.levels.values():
+                cumulative += level.quantity
+                prices.append(level.price)
+                totals.append(cumulative)
+            self._curve = (prices, totals)
+        return self._curve
+
+    def fill_price(self, quantity: Dec) -> Optional[Dec]:
+        """
+        Return the price of the first level at which the cumulative quantity reaches
+        the given quantity, or the last level if it never does, or None if this side is empty.
+        """
+        prices, totals = self.fill_curve()
+        if not prices:
+            return None
+        # Scale the quantity without rounding it, as the Decimal book compares it unrounded.
+        units = Dec(quantity).scaleb(HavvenManager.currency_precision)
+        return HavvenManager.from_fixed(prices[min(bisect_left(totals, units), len(prices) - 1)])
+
+    def fill_quantity(self, price: Dec) -> Dec:
+        """Return the total quantity of the levels whose prices are no worse than the given price."""
+        index = self.levels.bisect_right(Dec(price).scaleb(HavvenManager.currency_precision))
+        if index == 0:
+            return Dec(0)
+        return HavvenManager.from_fixed(self.fill_curve()[1][index - 1])
+
+
+class PriceBuckets:
+    """
+    A read-only view of the total quantity at each price on one side of a book,
+    ordered best price first, presented as Decimals.
+    """
+
+    def __init__(self, side: BookSide) -> None:
+        self.side = side
+
+    def __len__(self) -> int:
+        return len(self.side.levels)
+
+    def __contains__(self, price: Dec) -> bool:
+        return price in self.side.levels
+
+    def __getitem__(self, price: Dec) -> Dec:
+        return self.side.levels[price].quantity
+
+    def __iter__(self) -> Iterator[Dec]:
+        return self.keys()
+
+    def keys(self) -> Iterator[Dec]:
+        return iter(self.side.levels.keys())
+
+    def values(self) -> Iterator[Dec]:
+        return (level.quantity for level in self.side.levels.values())
+
+    def items(self) -> Iterator[Tuple[Dec, Dec]]:
+        return ((level.price, level.quantity) for level in self.side.levels.values())
+
+
+class FixedPointPriceBuckets(PriceBuckets):
+    """
+    A read-only view of the total quantity at each price on one side of a fixed point book,
+    ordered best price first, with its integer prices and quantities presented as Decimals.
+    """
+
+    def __contains__(self, price: Dec) -> bool:
+        return Dec(price).scaleb(HavvenManager.currency_precision) in self.side.levels
+
+    def __getitem__(self, price: Dec) -> Dec:
+        units = Dec(price).scaleb(HavvenManager.currency_precision)
+        return HavvenManager.from_fixed(self.side.levels[units].quantity)
+
+    def keys(self) -> Iterator[Dec]:
+        return map(HavvenManager.from_fixed, self.side.levels.keys())
+
+    def values(self) -> Iterator[Dec]:
+        return (HavvenManager.from_fixed(level.quantity) for level in self.side.levels.values())
+
+    def items(self) -> Iterator[Tuple[Dec, Dec]]:
+        return ((HavvenManager.from_fixed(level.price), HavvenManager.from_fixed(level.quantity))
+                for level in self.side.levels.values())
+
+
+class TradeWindow:
+    """
+    Running totals of the trades made over the most recent ticks, so that
+    rolling price averages and per-tick volumes need not scan the trade history.
+
+    Each tick's trades are summed into a single entry, and entries older than
+    the window are dropped as time advances. Prices and quantities are summed
+    as integer counts of the smallest currency unit, so the totals are exact.
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        """The number of ticks before the current one which are included in the totals."""
+
+        self.ticks: Deque[List[int]] = deque()
+        """Per-tick totals in the form [time, trades, price, price*quantity, quantity], oldest first."""
+
+        # Totals over all ticks currently in the window.
+        self.trades: int = 0
+        self.price_total: int = 0
+        self.value_total: int = 0
+        self.quantity_total: int = 0
+
+    def add(self, time: int, price: Dec, quantity: Dec) -> None:
+        """Record a trade made at the given time."""
+        price = HavvenManager.to_fixed(price)
+        quantity = HavvenManager.to_fixed(quantity)
+        value = price * quantity
+
+        if self.ticks and self.ticks[-1][0] == time:
+            tick = self.ticks[-1]
+        else:
+            tick = [time, 0, 0, 0, 0]
+            self.ticks.append(tick)
+        tick[1] += 1
+        tick[2] += price
+        tick[3] += value
+        tick[4] += quantity
+
+        self.trades += 1
+        self.price_total += price
+        self.value_total += value
+        self.quantity_total += quantity
+        self._expire(time)
+
+    def _expire(self, time: int) -> None:
+        """Drop any ticks which have fallen out of the window."""
+        ticks = self.ticks
+        while ticks and ticks[0][0] < time - self.window:
+            _, trades, price, value, quantity = ticks.popleft()
+            self.trades -= trades
+            self.price_total -= price
+            self.value_total -= value
+            self.quantity_total -= quantity
+
+    def totals(self, time: int, window: int) -> Tuple[int, int, int, int]:
+        """
+        Return the number of trades and the sums of price, price*quantity and quantity
+        of the trades made no more than window ticks before the given time.
+        Windows longer than this object's own only include the ticks it has kept.
+        """
+        self._expire(time)
+        if window == self.window:
+            return self.trades, self.price_total, self.value_total, self.quantity_total
+
+        totals = [0, 0, 0, 0]
+        for tick in reversed(self.ticks):
+            if tick[0] < time - window:
+                break
+            for i in range(4):
+                totals[i] += tick[i + 1]
+        return totals[0], totals[1], totals[2], totals[3]
+
+    def volume(self, time: int) -> int:
+        """Return the total quantity traded at the given tick."""
+        if self.ticks and self.ticks[-1][0] == time:
+            return self.ticks[-1][4]
+        return 0
+
 
 class OrderBook:
     """
@@ -207,6 +740,15 @@ class OrderBook:
     ask price.
     """
 
+    recent_history_length: int = 1000
+    """The number of trades kept in the history, unless the full trade history is retained."""
+
+    bid_type: type = Bid
+    """The kind of bid placed on this book."""
+
+    ask_type: type = Ask
+    """The kind of ask placed on this book."""
+
     def __init__(self, model_manager: "HavvenManager",
                  base: str,
                  quote: str,
@@ -214,7 +756,8 @@ class OrderBook:
                  quoted_fee: Callable[[Dec], Dec],
                  base_fee: Callable[[Dec], Dec],
                  quoted_qty_rcvd: Callable[[Dec], Dec],
-                 base_qty_rcvd: Callable[[Dec], Dec]) -> None:
+                 base_qty_rcvd: Callable[[Dec], Dec],
+                 sweeper: Optional[Sweeper] = None) -> None:
         # hold onto the model to be able to access variables
         self.model_manager = model_manager
 
@@ -224,20 +767,32 @@ class OrderBook:
 
         # Buys and sells should be ordered, by price first, then date.
         # Bids are ordered highest-first
-        self.bids = SortedListWithKey(key=Bid.comparator)
+        self.bids = BookSide(descending=True)
         # Asks are ordered lowest-first
-        self.asks = SortedListWithKey(key=Ask.comparator)
+        self.asks = BookSide(descending=False)
 
-        # These dicts store the quantities demanded or supplied at each price.
-        self.bid_price_buckets = SortedDict(lambda x: -x)
-        self.ask_price_buckets = SortedDict(lambda x: x)
+        # Every live order on this book by its id.
+        # Each issuer's live orders are kept by the issuer, across all books.
+        self.orders: Dict[int, LimitOrder] = {}
+
+        # These views present the quantities demanded or supplied at each price.
+        self.bid_price_buckets = PriceBuckets(self.bids)
+        self.ask_price_buckets = PriceBuckets(self.asks)
 
         # These members save on recomputation of the price when it's consulted multiple times per step.
         self._cached_price: Dec = Dec('1.0')
         self._last_cached_price_time: int = 0
 
+        # Incremented whenever the price may have changed, so values derived from it can be cached.
+        # As the price is computed lazily, read it before checking the version.
+        self.version: int = 0
+
         self.time: int = 0
 
+        # While matching is deferred, match() only notes that a match pass is needed.
+        self._deferral_depth: int = 0
+        self._match_pending: bool = False
+
         # match should be a function: match(bid, ask)
         # which resolves the given order pair,
         # which transfers buy_val of the buyer's good to the seller,
@@ -245,20 +800,58 @@ class OrderBook:
         # and which returns True iff the transfer succeeded.
         self.matcher = matcher
 
+        # If given, the sweeper fills a large order against several resting orders
+        # in one pass, with the same results as calling the matcher on each pair in turn.
+        self.sweeper = sweeper
+
         # Fees will be calculated with the following functions.
         self.quoted_fee = quoted_fee
         self.base_fee = base_fee
         self.quoted_qty_rcvd = quoted_qty_rcvd
         self.base_qty_rcvd = base_qty_rcvd
 
-        # A list of all successful trades.
-        self.history: List[TradeRecord] = []
+        # Every trade in a compact columnar form, if enabled.
+        self.trade_log: Optional[TradeLog] = TradeLog(self) if model_manager.columnar_trade_log else None
+
+        # The most recent successful trades, or all of them if the full history is retained.
+        # If there is a trade log, trades are kept as their indices in the log, rather than as records.
+        self.history: Deque[Union[TradeRecord, int]] = deque(
+            maxlen=None if model_manager.retain_trade_history else self.recent_history_length
+        )
+
+        # Running totals of recent trades, from which the price and volume are computed.
+        self.trade_window = TradeWindow(model_manager.rolling_avg_time_window)
+        self._last_trade_price: Optional[Dec] = None
 
         # A list keeping track of each tick's open, close, high, low
         self.candle_data: List[List[Dec]] = [[Dec(1), Dec(1), Dec(1), Dec(1)]]
         self.price_data: List[Dec] = [self._cached_price]
         self.volume_data: List[Dec] = [Dec(0)]
 
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        This book's state for pickling, as in a model snapshot.
+        The records of past trades, and the per-tick chart data before the latest tick, are left out,
+        as nothing the book does from here on depends on them. The latest two prices are kept,
+        which market makers take the gradient of.
+        A model snapshot which keeps the history of past trades keeps all of this.
+        """
+        state = self.__dict__.copy()
+        if self.model_manager.model.snapshot_history:
+            return state
+        state['history'] = deque(maxlen=self.history.maxlen)
+        state['trade_log'] = self.trade_log is not None
+        state['candle_data'] = self.candle_data[-1:]
+        state['price_data'] = self.price_data[-2:]
+        state['volume_data'] = self.volume_data[-1:]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        # Start a new log, if this book keeps one and its log was left out.
+        if isinstance(state['trade_log'], bool):
+            self.trade_log = TradeLog(self) if state['trade_log'] else None
+
     @property
     def name(self) -> str:
         """
@@ -273,8 +866,8 @@ class OrderBook:
         """
         # if not using rolling average, return price
         if self.model_manager.rolling_avg_time_window == 0:
-            if len(self.history) > 0:
-                return self.history[-1].price
+            if self._last_trade_price is not None:
+                return self._last_trade_price
             return Dec(1)
 
         if self.model_manager.time <= self._last_cached_price_time:
@@ -288,19 +881,11 @@ class OrderBook:
         """
         Return the average trading price over the last time_window periods.
         """
-        total = Dec(0)
-        counted = 0
+        counted, total, _, _ = self.trade_window.totals(self.model_manager.time, time_window)
 
-        for item in reversed(self.history):
-            if item.completion_time < self.model_manager.time - time_window:
-                break
-            total += item.price
-            counted += 1
-
-        if counted == 0:
-            self._cached_price = self._cached_price
-        else:
-            self._cached_price = total / Dec(counted)
+        if counted != 0:
+            self._cached_price = HavvenManager.from_fixed(total) / Dec(counted)
+            self.version += 1
 
         self._last_cached_price_time = self.model_manager.time
         return self._cached_price
@@ -309,19 +894,11 @@ class OrderBook:
         """
         Return the average trading price over the last time_window periods, weighted by quantity per trade.
         """
-        total = Dec(0)
-        counted_vol = Dec(0)
-
-        for item in reversed(self.history):
-            if item.completion_time < self.model_manager.time - time_window:
-                break
-            total += item.price * item.quantity
-            counted_vol += item.quantity
+        _, _, total, counted_vol = self.trade_window.totals(self.model_manager.time, time_window)
 
-        if counted_vol == Dec(0):
-            self._cached_price = self._cached_price
-        else:
-            self._cached_price = total / counted_vol
+        if counted_vol != 0:
+            self._cached_price = HavvenManager.from_fixed(total, scale=2) / HavvenManager.from_fixed(counted_vol)
+            self.version += 1
 
         self._last_cached_price_time = self.model_manager.time
         return self._cached_price
@@ -338,53 +915,39 @@ class OrderBook:
         # use old close price as new data for next tick, as all the other values are updated when needed
         self.candle_data.append([self.candle_data[-1][1]] * 4)
 
-        self.volume_data.append(Dec(0))
-        for item in reversed(self.history):
-            if item.completion_time != self.model_manager.time:
-                break
-            self.volume_data[-1] += item.quantity
+        volume = self.trade_window.volume(self.model_manager.time)
+        # a tick without trades has a volume of exactly zero, rather than zero to the fixed point precision
+        self.volume_data.append(HavvenManager.from_fixed(volume) if volume else Dec(0))
 
         self.price_data.append(self.price)
 
-    def _bid_bucket_add(self, price: Dec, quantity: Dec) -> None:
-        """
-        Add a quantity to the bid bucket for a price,
-        adding a new bucket if none exists.
-        """
-        if price in self.bid_price_buckets:
-            self.bid_price_buckets[price] += quantity
-        else:
-            self.bid_price_buckets[price] = quantity
+    @property
+    def total_bid_quantity(self) -> Dec:
+        """The total quantity of the base currency demanded by all bids."""
+        return self.bids.quantity
 
-    def _bid_bucket_deduct(self, price: Dec, quantity: Dec) -> None:
-        """
-        Deduct a quantity from the bid bucket for a price,
-        removing the bucket if it is emptied.
-        """
-        if self.bid_price_buckets[price] == quantity:
-            self.bid_price_buckets.pop(price)
-        else:
-            self.bid_price_buckets[price] -= quantity
+    @property
+    def total_bid_value(self) -> Dec:
+        """The total value in the quoted currency of all bids, excluding fees."""
+        return self.bids.value
 
-    def _ask_bucket_add(self, price: Dec, quantity: Dec) -> None:
-        """
-        Add a quantity to the ask bucket for a price,
-        adding a new bucket if none exists.
-        """
-        if price in self.ask_price_buckets:
-            self.ask_price_buckets[price] += quantity
-        else:
-            self.ask_price_buckets[price] = quantity
+    @property
+    def total_ask_quantity(self) -> Dec:
+        """The total quantity of the base currency supplied by all asks."""
+        return self.asks.quantity
 
-    def _ask_bucket_deduct(self, price: Dec, quantity: Dec) -> None:
-        """
-        Deduct a quantity from the ask bucket for a price,
-        removing the bucket if it is emptied.
-        """
-        if self.ask_price_buckets[price] == quantity:
-            self.ask_price_buckets.pop(price)
-        else:
-            self.ask_price_buckets[price] -= quantity
+    @property
+    def total_ask_value(self) -> Dec:
+        """The total value in the quoted currency of all asks, excluding fees."""
+        return self.asks.value
+
+    def bid_depth(self) -> List[Tuple[float, float]]:
+        """Return the price and quantity demanded at each bid price as floats, highest price first."""
+        return self.bids.depth()
+
+    def ask_depth(self) -> List[Tuple[float, float]]:
+        """Return the price and quantity supplied at each ask price as floats, lowest price first."""
+        return self.asks.depth()
 
     def buyer_fee(self, price: Dec, quantity: Dec) -> Dec:
         """
@@ -430,7 +993,7 @@ class OrderBook:
         if agent.__getattribute__(f"available_{self.quoted}") < HavvenManager.round_decimal(price * quantity) + fee:
             return None
 
-        bid = Bid(price, quantity, fee, agent, self)
+        bid = self.bid_type(price, quantity, fee, agent, self)
 
         # Attempt to trade the bid immediately.
         self.match()
@@ -455,7 +1018,7 @@ class OrderBook:
         if agent.__getattribute__(f"available_{self.base}") < quantity + fee:
             return None
 
-        ask = Ask(price, quantity, fee, agent, self)
+        ask = self.ask_type(price, quantity, fee, agent, self)
 
         # Attempt to trade the ask immediately.
         self.match()
@@ -469,6 +1032,10 @@ class OrderBook:
         price = HavvenManager.round_decimal(self.price_to_buy_quantity(quantity))
         bid = self.bid(price, quantity, agent)
 
+        # a market buy must be matched straight away, even if matching is being deferred
+        if bid and self._deferral_depth > 0:
+            self._match()
+
         # cancel the bid if it isn't filled immediately, as a market buy/sell should
         # always be filled (unless the market dries up)
         if bid:
@@ -482,27 +1049,63 @@ class OrderBook:
         price = HavvenManager.round_decimal(self.price_to_sell_quantity(quantity))
         ask = self.ask(price, quantity, agent)
 
+        # a market sell must be matched straight away, even if matching is being deferred
+        if ask and self._deferral_depth > 0:
+            self._match()
+
         # cancel the ask if it isn't filled immediately, as a market buy/sell should
         # always be filled (unless the market dries up)
         if ask:
             ask.cancel()
         return ask
 
+    @contextmanager
+    def deferred_matching(self) -> Iterator["OrderBook"]:
+        """
+        Defer matching on this book until the end of the context, when a single match pass is run.
+
+        Orders submitted, updated, or cancelled within the context enter or leave the book immediately,
+        but no trades are made until the context exits, at which point the best bid and ask are repeatedly
+        matched as usual, so price-time priority holds across the whole batch.
+        Market buys and sells are still matched immediately. Contexts may be nested,
+        in which case matching waits for the outermost one to exit.
+        """
+        self._deferral_depth += 1
+        try:
+            yield self
+        finally:
+            self._deferral_depth -= 1
+        if self._deferral_depth == 0 and self._match_pending:
+            self._match()
+
+    def submit_batch(self, agent: "ag.MarketPlayer",
+                     orders: Iterable[Tuple[str, Dec, Dec]],
+                     cancels: Iterable[LimitOrder] = ()) -> List[Optional[LimitOrder]]:
+        """
+        Cancel some of an agent's orders, then submit a number of new ones, matching only once at the end.
+        New orders are given as ("bid" or "ask", price, quantity) tuples, and the resulting orders
+        are returned in the same sequence, with None in place of any which could not be placed.
+        """
+        placed = []
+        with self.deferred_matching():
+            for order in cancels:
+                order.cancel()
+            for side, price, quantity in orders:
+                if side == "bid":
+                    placed.append(self.bid(price, quantity, agent))
+                elif side == "ask":
+                    placed.append(self.ask(price, quantity, agent))
+                else:
+                    raise Exception(f"Unknown order side {side}, expected bid or ask.")
+        return placed
+
     def price_to_buy_quantity(self, quantity: Dec) -> Dec:
         """
         The bid price to buy a certain quantity, ignoring fees.
         Note that this is an instantaneous metric which may be
         invalidated if intervening trades are made.
         """
-        # TODO: handle the null case properly, not just use self.price
-        cumulative = Dec(0)
-        price = self.price
-        for _price in self.ask_price_buckets:
-            price = _price
-            cumulative += self.ask_price_buckets[price]
-            if cumulative >= quantity:
-                break
-        return price
+        return self._price_for_quantity(self.asks, quantity)
 
     def price_to_sell_quantity(self, quantity: Dec) -> Dec:
         """
@@ -510,16 +1113,36 @@ class OrderBook:
         Note that this is an instantaneous metric which may be
         invalidated if intervening trades are made.
         """
+        return self._price_for_quantity(self.bids, quantity)
+
+    def _price_for_quantity(self, side: BookSide, quantity: Dec) -> Dec:
+        """
+        Return the price of the first level on a side at which the cumulative
+        quantity reaches the given quantity, or the last level if it never does.
+        """
+        # Read the price even when the side has levels, as with a rolling average
+        # this is what fixes the tick's cached price before any later trades.
         # TODO: handle the null case properly, not just use self.price
-        cumulative = Dec(0)
-        price = self.price
-        for _price in self.bid_price_buckets:
-            price = _price
-            cumulative += self.bid_price_buckets[price]
-            if cumulative >= quantity:
-                break
+        current = self.price
+        price = side.fill_price(quantity)
+        if price is None:
+            return current
         return price
 
+    def asks_not_higher_quantity(self, price: Dec) -> Dec:
+        """
+        Return the total quantity of the base currency offered by asks
+        whose prices are no higher than the given price.
+        """
+        return self.asks.fill_quantity(price)
+
+    def bids_not_lower_quantity(self, price: Dec) -> Dec:
+        """
+        Return the total quantity of the base currency sought by bids
+        whose prices are no lower than the given price.
+        """
+        return self.bids.fill_quantity(price)
+
     def asks_not_higher_base_quantity(self, price: Dec, quoted_capital: Optional[Dec] = None) -> Dec:
         """
         Return the quantity of base currency you would obtain offering no more
@@ -561,7 +1184,7 @@ class OrderBook:
         """
         Return the highest available buy price.
         """
-        return self.bids[0].price if (len(self.bids) > 0) else self.price
+        return self.bids.best.head.price if self.bids.best is not None else self.price
 
     def highest_bids(self) -> Iterable[Bid]:
         """
@@ -573,8 +1196,9 @@ class OrderBook:
         """
         Return the quantity of the base currency demanded at the highest bid price.
         """
-        # Enclose in Decimal constructor in case sum is 0.
-        return Dec(sum(b.quantity for b in self.highest_bids()))
+        if self.bids.best is None:
+            return Dec(0)
+        return self.bids.best.quantity
 
     def asks_not_higher(self, price: Dec) -> Iterable[Bid]:
         """
@@ -586,7 +1210,7 @@ class OrderBook:
         """
         Return the lowest available sell price.
         """
-        return self.asks[0].price if (len(self.asks) > 0) else self.price
+        return self.asks.best.head.price if self.asks.best is not None else self.price
 
     def lowest_asks(self) -> Iterable[Bid]:
         """
@@ -598,8 +1222,9 @@ class OrderBook:
         """
         Return the quantity of the base currency supplied at the lowest ask price.
         """
-        # Enclose in Decimal constructor in case sum is 0.
-        return Dec(sum(a.quantity for a in self.lowest_asks()))
+        if self.asks.best is None:
+            return Dec(0)
+        return self.asks.best.quantity
 
     def spread(self) -> Dec:
         """
@@ -607,6 +1232,14 @@ class OrderBook:
         """
         return self.lowest_ask_price() - self.highest_bid_price()
 
+    def _crossed(self) -> bool:
+        """
+        Return True iff there are both bids and asks,
+        and the best of them overlap in price, so that they can be matched.
+        """
+        bids, asks = self.bids.best, self.asks.best
+        return bids is not None and asks is not None and asks.price <= bids.price
+
     def spread_median(self) -> Dec:
         lowest_ask = self.lowest_ask_price()
         highest_bid = self.highest_bid_price()
@@ -618,6 +1251,26 @@ class OrderBook:
             return lowest_ask
         return (highest_bid + lowest_ask) / 2
 
+    def order(self, order_id: int) -> Optional[LimitOrder]:
+        """Return the live order on this book with the given id, or None if there is none."""
+        return self.orders.get(order_id)
+
+    def orders_for(self, agent: "ag.MarketPlayer") -> Dict[int, LimitOrder]:
+        """Return an agent's live orders on this book by id, in the order they were listed."""
+        return {order_id: order for order_id, order in agent.orders.items() if order.book is self}
+
+    def _list(self, order: LimitOrder) -> None:
+        """Give a new order the next id, and enter it in this book's and its issuer's records."""
+        order.order_id = self.model_manager.next_order_id
+        self.model_manager.next_order_id += 1
+        self.orders[order.order_id] = order
+        order.issuer.orders[order.order_id] = order
+
+    def _unlist(self, order: LimitOrder) -> None:
+        """Strike an order from this book's and its issuer's records."""
+        del self.orders[order.order_id]
+        del order.issuer.orders[order.order_id]
+
     def add_new_bid(self, bid: Bid) -> None:
         """
         Add a new Bid. This should be called only in the Bid constructor.
@@ -631,14 +1284,13 @@ class OrderBook:
             return
 
         # Update the issuer's unavailable quote value.
-        bid.issuer.__dict__[f"unavailable_{self.quoted}"] += bid.quantity * bid.price + bid.fee
+        key = f"unavailable_{self.quoted}"
+        setattr(bid.issuer, key, getattr(bid.issuer, key) + (bid.quantity * bid.price + bid.fee))
 
-        # Add to the issuer and book's records
-        bid.issuer.orders.append(bid)
-        self.bids.add(bid)
-
-        # Update the cumulative price totals with the new quantity.
-        self._bid_bucket_add(bid.price, bid.quantity)
+        # Add to the issuer and book's records,
+        # updating the cumulative price totals with the new quantity.
+        self._list(bid)
+        self.bids.add(bid, bid.price, bid.quantity)
 
         # Advance time
         self.step()
@@ -681,35 +1333,30 @@ class OrderBook:
 
         # Update the unavailable quantities for this bid,
         # deducting the old and crediting the new.
-        bid.issuer.__dict__[f"unavailable_{self.quoted}"] += \
-            (HavvenManager.round_decimal(new_quantity * new_price) + new_fee) - \
-            (HavvenManager.round_decimal(bid.quantity * bid.price) + bid.fee)
+        key = f"unavailable_{self.quoted}"
+        setattr(bid.issuer, key, getattr(bid.issuer, key) +
+                ((HavvenManager.round_decimal(new_quantity * new_price) + new_fee) -
+                 (HavvenManager.round_decimal(bid.quantity * bid.price) + bid.fee)))
 
         if bid.price == new_price:
-            # We may assume the current price is already recorded,
-            # so no need to call _bid_bucket_add_ which checks before
-            # inserting. Something is wrong if the key is not found.
-            self.bid_price_buckets[new_price] += (new_quantity - bid.quantity)
+            # The order keeps its place in the queue at its price,
+            # so just adjust that level by the change in quantity.
+            self.bids.adjust(bid, new_quantity - bid.quantity)
 
             # As the price is unchanged, order book position need not be
             # updated, just set the quantity and fee.
             bid.quantity = new_quantity
             bid.fee = new_fee
         else:
-            # Deduct the old quantity from its price bucket,
-            # and add the new quantity into the appropriate bucket.
-            self._bid_bucket_deduct(bid.price, bid.quantity)
-            self._bid_bucket_add(new_price, new_quantity)
-
-            # Since the price changed, update the bid's position
-            # in the book.
-            self.bids.remove(bid)
+            # Since the price changed, move the bid from its old
+            # price level to the back of the queue at its new price.
+            self.bids.remove(bid, bid.quantity)
             bid.price = new_price
             bid.quantity = new_quantity
             bid.fee = new_fee
             # Only set the time if the price was updated.
             bid.time = self.time
-            self.bids.add(bid)
+            self.bids.add(bid, new_price, new_quantity)
 
         # Advance time.
         self.step()
@@ -723,14 +1370,13 @@ class OrderBook:
             return
 
         # Free up tokens occupied by this bid.
-        bid.issuer.__dict__[f"unavailable_{self.quoted}"] -= bid.quantity * bid.price + bid.fee
-
-        # Remove this order's remaining quantity from its price bucket
-        self._bid_bucket_deduct(bid.price, bid.quantity)
+        key = f"unavailable_{self.quoted}"
+        setattr(bid.issuer, key, getattr(bid.issuer, key) - (bid.quantity * bid.price + bid.fee))
 
-        # Delete the order from the ask list and issuer.
-        self.bids.remove(bid)
-        bid.issuer.orders.remove(bid)
+        # Delete the order from its price level, removing its remaining quantity,
+        # and from the issuer.
+        self.bids.remove(bid, bid.quantity)
+        self._unlist(bid)
         bid.active = False
         bid.quantity = Dec(0)
         self.step()
@@ -749,14 +1395,13 @@ class OrderBook:
             return
 
         # Update the issuer's unavailable base value.
-        ask.issuer.__dict__[f"unavailable_{self.base}"] += ask.quantity + ask.fee
-
-        # Add to the issuer and book's records.
-        ask.issuer.orders.append(ask)
-        self.asks.add(ask)
+        key = f"unavailable_{self.base}"
+        setattr(ask.issuer, key, getattr(ask.issuer, key) + (ask.quantity + ask.fee))
 
-        # Update the cumulative price totals with the new quantity.
-        self._ask_bucket_add(ask.price, ask.quantity)
+        # Add to the issuer and book's records,
+        # updating the cumulative price totals with the new quantity.
+        self._list(ask)
+        self.asks.add(ask, ask.price, ask.quantity)
 
         # Advance time.
         self.step()
@@ -799,34 +1444,28 @@ class OrderBook:
 
         # Update the unavailable quantities for this ask,
         # deducting the old and crediting the new.
-        ask.issuer.__dict__[f"unavailable_{self.base}"] += \
-            (new_quantity + new_fee) - (ask.quantity + ask.fee)
+        key = f"unavailable_{self.base}"
+        setattr(ask.issuer, key, getattr(ask.issuer, key) + ((new_quantity + new_fee) - (ask.quantity + ask.fee)))
 
         if ask.price == new_price:
-            # We may assume the current price is already recorded,
-            # so no need to call _ask_bucket_add_ which checks before
-            # inserting. Something is wrong if the key is not found.
-            self.ask_price_buckets[new_price] += (new_quantity - ask.quantity)
+            # The order keeps its place in the queue at its price,
+            # so just adjust that level by the change in quantity.
+            self.asks.adjust(ask, new_quantity - ask.quantity)
 
             # As the price is unchanged, order book position need not be
             # updated, just set the quantity and fee.
             ask.quantity = new_quantity
             ask.fee = new_fee
         else:
-            # Deduct the old quantity from its price bucket,
-            # and add the new quantity into the appropriate bucket.
-            self._ask_bucket_deduct(ask.price, ask.quantity)
-            self._ask_bucket_add(new_price, new_quantity)
-
-            # Since the price changed, update the ask's position
-            # in the book.
-            self.asks.remove(ask)
+            # Since the price changed, move the ask from its old
+            # price level to the back of the queue at its new price.
+            self.asks.remove(ask, ask.quantity)
             ask.price = new_price
             ask.quantity = new_quantity
             ask.fee = new_fee
             # Only set the timestep if the price was updated.
             ask.time = self.time
-            self.asks.add(ask)
+            self.asks.add(ask, new_price, new_quantity)
 
         # Advance time.
         self.step()
@@ -840,61 +1479,183 @@ class OrderBook:
             return
 
         # Free up tokens occupied by this bid.
-        ask.issuer.__dict__[f"unavailable_{self.base}"] -= ask.quantity + ask.fee
+        key = f"unavailable_{self.base}"
+        setattr(ask.issuer, key, getattr(ask.issuer, key) - (ask.quantity + ask.fee))
 
-        # Remove this order's remaining quantity from its price bucket.
-        self._ask_bucket_deduct(ask.price, ask.quantity)
-
-        # Delete order from the ask list and issuer.
-        self.asks.remove(ask)
-        try:
-            ask.issuer.orders.remove(ask)
-        except ValueError:
-            # TODO: fix ask still existing on orderbooks even though removed from issuer
-            # Seems like order.cancel() might be the issue, even though it all seems fine?
-            pass
+        # Delete the order from its price level, removing its remaining quantity,
+        # and from the issuer.
+        self.asks.remove(ask, ask.quantity)
+        self._unlist(ask)
 
         ask.active = False
         ask.quantity = Dec(0)
         self.step()
         ask.issuer.notify_cancelled(ask)
 
+    def trade(self, entry: Union[TradeRecord, int]) -> Union[TradeRecord, LoggedTrade]:
+        """
+        Return the trade for an entry of the history,
+        reading it back from the trade log if it is stored there.
+        """
+        if isinstance(entry, TradeRecord):
+            return entry
+        return self.trade_log.record(entry)
+
+    def _record_trade(self, trade: TradeRecord) -> None:
+        """Save a completed trade in the history and price totals, and notify its participants."""
+        if self.trade_log is None:
+            self.history.append(trade)
+        else:
+            trade.log_id = self.trade_log.append(trade)
+            self.history.append(trade.log_id)
+        self.trade_window.add(trade.completion_time, trade.price, trade.quantity)
+        self._last_trade_price = trade.price
+        self.version += 1
+
+        if trade.seller == trade.buyer:
+            trade.seller.notify_trade(trade)
+        else:
+            trade.seller.notify_trade(trade)
+            trade.buyer.notify_trade(trade)
+
     def match(self) -> None:
-        """Match bids with asks and perform any trades that can be made."""
+        """
+        Match bids with asks and perform any trades that can be made.
+        If matching is being deferred, this is put off until the deferral ends.
+        """
+        if self._deferral_depth > 0:
+            self._match_pending = True
+            return
+        self._match()
+
+    def _match(self) -> None:
+        """Match bids with asks and perform any trades that can be made, regardless of deferral."""
+        self._match_pending = False
         prev_bid, prev_ask = None, None
-        spread = Dec(0)
         # Repeatedly match the best pair of orders until no more matches can succeed.
         # Finish if there there are no orders left, or if the last match failed to remove any orders
         # This relies upon the bid and ask books being maintained ordered.
-        while spread <= 0 and len(self.bids) and len(self.asks):
+        while self._crossed():
             if prev_bid == self.bids[0] and prev_ask == self.asks[0]:
                 raise Exception("Orders didn't fill even though spread <= 0")
 
+            # Fill the larger of the best orders against as many orders as possible in one sweep,
+            # falling back to matching the best pair on its own.
+            if self.sweeper is not None and self._sweep():
+                prev_bid, prev_ask = None, None
+                continue
+
             # Attempt to match the highest bid with the lowest ask.
             prev_bid, prev_ask = self.bids[0], self.asks[0]
             trade = self.matcher(prev_bid, prev_ask)
 
             # If a trade was made, then save it in the history.
             if trade is not None:
-                self.history.append(trade)
-                if trade.seller == trade.buyer:
-                    trade.seller.notify_trade(trade)
+                self._record_trade(trade)
+                self._update_candle(trade.price)
+
+    def _update_candle(self, price: Dec) -> None:
+        """Update the current tick's closing, high and low prices with a new trade."""
+        # update closing price every time there is a new trade
+        self.candle_data[-1][1] = price
+
+        # if the price is higher than max, update
+        if price > self.candle_data[-1][2]:
+            self.candle_data[-1][2] = price
+
+        # if price lower than min, update
+        if price < self.candle_data[-1][3]:
+            self.candle_data[-1][3] = price
+
+    def _sweep(self) -> bool:
+        """
+        Fill the larger of the best bid and ask against successive orders on the other side,
+        as far as the sweeper allows, then settle the orders and record the trades in bulk.
+        The results are identical to matching each pair in turn.
+        Return True iff any trades were made.
+        """
+        bid, ask = self.bids[0], self.asks[0]
+        if bid.quantity > ask.quantity:
+            taker, resting = bid, self.asks
+        elif ask.quantity > bid.quantity:
+            taker, resting = ask, self.bids
+        else:
+            return False
+
+        # A single pair is cheaper to leave to the matcher.
+        if len(resting) < 2:
+            return False
+        second = resting.best.head._next or resting.levels.peekitem(1)[1].head
+        if (second.price > taker.price) if taker is bid else (second.price < taker.price):
+            return False
+
+        fills = self.sweeper(self, taker)
+        if not fills:
+            return False
+
+        # The resting orders are each touched once, so update them as the matcher would.
+        # All but the last are filled completely, and so are just cancelled.
+        taker_is_bid = isinstance(taker, Bid)
+        for fill in fills:
+            if taker_is_bid:
+                if fill.quantity == fill.ask.quantity:
+                    self.cancel_ask(fill.ask)
                 else:
-                    trade.seller.notify_trade(trade)
-                    trade.buyer.notify_trade(trade)
-
-                # update closing price every time there is a new trade
-                self.candle_data[-1][1] = trade.price
-
-                # if the price is higher than max, update
-                if trade.price > self.candle_data[-1][2]:
-                    self.candle_data[-1][2] = trade.price
-
-                # if price lower than min, update
-                if trade.price < self.candle_data[-1][3]:
-                    self.candle_data[-1][3] = trade.price
-
-            spread = self.spread()
+                    fill.ask.update_quantity(fill.ask.quantity - fill.quantity, fill.ask.fee - fill.ask_fee)
+            else:
+                if fill.quantity == fill.bid.quantity:
+                    self.cancel_bid(fill.bid)
+                else:
+                    fill.bid.update_quantity(fill.bid.quantity - fill.quantity, fill.bid.fee - fill.bid_fee)
+
+        # The matcher would update the taker after each fill, changing its issuer's
+        # unavailable balance by the difference between what the order held before and after.
+        # Those differences telescope, so the total change is computed directly.
+        # The sums are exact, as all quantities and fees are already rounded.
+        price = taker.price
+        taker_fees = [fill.bid_fee if taker_is_bid else fill.ask_fee for fill in fills]
+        quantity = HavvenManager.round_decimal(taker.quantity - sum(fill.quantity for fill in fills))
+        fee = HavvenManager.round_decimal(taker.fee - sum(taker_fees))
+        if taker_is_bid:
+            held = HavvenManager.round_decimal(taker.quantity * price) + taker.fee
+        else:
+            held = taker.quantity + taker.fee
+        if quantity <= 0:
+            # The final fill cancels the order, freeing whatever it still held, unrounded.
+            last_quantity = fills[-1].quantity
+            last_fee = taker.fee - sum(taker_fees[:-1])
+            if taker_is_bid:
+                unavailable = (HavvenManager.round_decimal(last_quantity * price) + last_fee) - held - \
+                    (last_quantity * price + last_fee)
+            else:
+                unavailable = -held
+        elif taker_is_bid:
+            unavailable = (HavvenManager.round_decimal(quantity * price) + fee) - held
+        else:
+            unavailable = (quantity + fee) - held
+        self.time += len(fills)
+
+        side = self.bids if taker_is_bid else self.asks
+        key = f"unavailable_{self.quoted if taker_is_bid else self.base}"
+        setattr(taker.issuer, key, getattr(taker.issuer, key) + unavailable)
+        if quantity <= 0:
+            side.remove(taker, taker.quantity)
+            self._unlist(taker)
+            taker.active = False
+            taker.quantity = Dec(0)
+            taker.issuer.notify_cancelled(taker)
+        else:
+            side.adjust(taker, quantity - taker.quantity)
+            taker.quantity = quantity
+            taker.fee = fee
+
+        for fill in fills:
+            trade = TradeRecord(fill.bid.issuer, fill.ask.issuer, self,
+                                fill.price, fill.quantity, fill.bid_fee, fill.ask_fee,
+                                self.model_manager.time, fill.bid, fill.ask)
+            self._record_trade(trade)
+            self._update_candle(trade.price)
+        return True
 
     def do_single_match(self) -> TradeRecord:
         """Match the top bid with the lowest ask for testing step by step."""
@@ -904,13 +1665,358 @@ class OrderBook:
 
             # If a trade was made, then save it in the history.
             if trade is not None:
-                self.history.append(trade)
-                if trade.seller == trade.buyer:
-                    trade.seller.notify_trade(trade)
-                else:
-                    trade.seller.notify_trade(trade)
-                    trade.buyer.notify_trade(trade)
+                self._record_trade(trade)
 
             return trade
 
         raise Exception("Either no bids or no asks in orderbook, when attempting to do single match")
+
+
+class FixedPointOrderBook(OrderBook):
+    """
+    An order book which holds the prices, quantities and fees of its orders and price levels
+    as integer counts of the smallest currency unit, rather than as Decimals.
+
+    Orders are still placed, updated and read through the same Decimal interface as the Decimal book,
+    converting exactly to and from the integers, and agents' balances are still Decimals.
+    The book's own bookkeeping is done in integer arithmetic, rounding as round_decimal would,
+    and it should be matched and swept by functions which work in integers too,
+    with fills giving their prices, quantities and fees in units.
+    As every price, quantity and fee in a book is already rounded to the currency precision,
+    the results are identical to those of the Decimal book.
+    """
+
+    bid_type: type = FixedPointBid
+    """The kind of bid placed on this book."""
+
+    ask_type: type = FixedPointAsk
+    """The kind of ask placed on this book."""
+
+    def __init__(self, model_manager: "HavvenManager",
+                 base: str,
+                 quote: str,
+                 matcher: Matcher,
+                 quoted_fee: Callable[[Dec], Dec],
+                 base_fee: Callable[[Dec], Dec],
+                 quoted_qty_rcvd: Callable[[Dec], Dec],
+                 base_qty_rcvd: Callable[[Dec], Dec],
+                 sweeper: Optional[Sweeper] = None) -> None:
+        super().__init__(model_manager, base, quote, matcher, quoted_fee, base_fee,
+                         quoted_qty_rcvd, base_qty_rcvd, sweeper)
+        self.bids = FixedPointBookSide(descending=True)
+        self.asks = FixedPointBookSide(descending=False)
+        self.bid_price_buckets = FixedPointPriceBuckets(self.bids)
+        self.ask_price_buckets = FixedPointPriceBuckets(self.asks)
+
+    @property
+    def total_bid_quantity(self) -> Dec:
+        """The total quantity of the base currency demanded by all bids."""
+        return HavvenManager.from_fixed(self.bids.quantity)
+
+    @property
+    def total_bid_value(self) -> Dec:
+        """The total value in the quoted currency of all bids, excluding fees."""
+        return HavvenManager.from_fixed(self.bids.value, scale=2)
+
+    @property
+    def total_ask_quantity(self) -> Dec:
+        """The total quantity of the base currency supplied by all asks."""
+        return HavvenManager.from_fixed(self.asks.quantity)
+
+    @property
+    def total_ask_value(self) -> Dec:
+        """The total value in the quoted currency of all asks, excluding fees."""
+        return HavvenManager.from_fixed(self.asks.value, scale=2)
+
+    def highest_bid_quantity(self) -> Dec:
+        """
+        Return the quantity of the base currency demanded at the highest bid price.
+        """
+        if self.bids.best is None:
+            return Dec(0)
+        return HavvenManager.from_fixed(self.bids.best.quantity)
+
+    def lowest_ask_quantity(self) -> Dec:
+        """
+        Return the quantity of the base currency supplied at the lowest ask price.
+        """
+        if self.asks.best is None:
+            return Dec(0)
+        return HavvenManager.from_fixed(self.asks.best.quantity)
+
+    def add_new_bid(self, bid: FixedPointBid) -> None:
+        """
+        Add a new Bid. This should be called only in the Bid constructor.
+        Price, quantity, and issuer are assumed already to have been set
+        in the LimitOrder super constructor.
+        """
+        if not bid.active:
+            return
+
+        # Hold the unrounded value of the bid, as the Decimal book does.
+        held = bid.quantity_units * bid.price_units + bid.fee_units * HavvenManager.fixed_point_scale
+        key = f"unavailable_{self.quoted}"
+        setattr(bid.issuer, key, getattr(bid.issuer, key) + HavvenManager.from_fixed(held, scale=2))
+
+        self._list(bid)
+        self.bids.add(bid, bid.price_units, bid.quantity_units)
+        self.step()
+
+    def update_bid(self, bid: FixedPointBid,
+                   new_price: Dec,
+                   new_quantity: Dec,
+                   fee: Optional[Dec] = None) -> None:
+        """
+        Update a Bid's details in the book, recomputing fees, cached quantities,
+        and the user's unavailable currency total.
+        If fee is not None, then update the fee directly, rather than recomputing it.
+        """
+        if not bid.active:
+            return
+        self.update_bid_units(bid, HavvenManager.to_fixed(new_price), HavvenManager.to_fixed(new_quantity),
+                              None if fee is None else HavvenManager.to_fixed(fee))
+
+    def update_bid_units(self, bid: FixedPointBid,
+                         new_price: int,
+                         new_quantity: int,
+                         fee: Optional[int] = None) -> None:
+        """
+        Update a Bid as update_bid does, given its new price, quantity and fee in units.
+        """
+        if not bid.active:
+            return
+
+        if bid.price_units == new_price and bid.quantity_units == new_quantity:
+            if fee is None or fee == bid.fee_units:
+                return
+            else:
+                print(bid)
+                raise Exception("Fee changed, but price and quantity are unchanged...")
+
+        if new_quantity <= 0:
+            self.cancel_bid(bid)
+            return
+
+        new_fee = fee
+        if fee is None:
+            new_fee = HavvenManager.to_fixed(self.buyer_fee(HavvenManager.from_fixed(new_price),
+                                                            HavvenManager.from_fixed(new_quantity)))
+
+        key = f"unavailable_{self.quoted}"
+        change = (HavvenManager.fixed_product(new_quantity, new_price) + new_fee) - \
+            (HavvenManager.fixed_product(bid.quantity_units, bid.price_units) + bid.fee_units)
+        setattr(bid.issuer, key, getattr(bid.issuer, key) + HavvenManager.from_fixed(change))
+
+        if bid.price_units == new_price:
+            self.bids.adjust(bid, new_quantity - bid.quantity_units)
+            bid.quantity_units = new_quantity
+            bid.fee_units = new_fee
+        else:
+            self.bids.remove(bid, bid.quantity_units)
+            bid.price_units = new_price
+            bid.quantity_units = new_quantity
+            bid.fee_units = new_fee
+            bid.time = self.time
+            self.bids.add(bid, new_price, new_quantity)
+
+        self.step()
+
+    def cancel_bid(self, bid: FixedPointBid) -> None:
+        """
+        Remove a bid from the bid list, and update cached quantity.
+        """
+        if not bid.active:
+            return
+
+        held = bid.quantity_units * bid.price_units + bid.fee_units * HavvenManager.fixed_point_scale
+        key = f"unavailable_{self.quoted}"
+        setattr(bid.issuer, key, getattr(bid.issuer, key) - HavvenManager.from_fixed(held, scale=2))
+
+        self.bids.remove(bid, bid.quantity_units)
+        self._unlist(bid)
+        bid.active = False
+        bid.quantity_units = 0
+        self.step()
+        bid.issuer.notify_cancelled(bid)
+
+    def add_new_ask(self, ask: FixedPointAsk) -> None:
+        """
+        Add a new Ask. This should be called only in the Ask constructor.
+        Price, quantity, and issuer are assumed already to have been set
+        in the LimitOrder super constructor.
+        """
+        if not ask.active:
+            return
+
+        key = f"unavailable_{self.base}"
+        held = ask.quantity_units + ask.fee_units
+        setattr(ask.issuer, key, getattr(ask.issuer, key) + HavvenManager.from_fixed(held))
+
+        self._list(ask)
+        self.asks.add(ask, ask.price_units, ask.quantity_units)
+        self.step()
+
+    def update_ask(self, ask: FixedPointAsk,
+                   new_price: Dec,
+                   new_quantity: Dec,
+                   fee: Optional[Dec] = None) -> None:
+        """
+        Update an Ask's details in the book, recomputing fees, cached quantities,
+        and the user's unavailable currency totals.
+        If fee is not None, then update the fee directly, rather than recomputing it.
+        """
+        if not ask.active:
+            return
+        self.update_ask_units(ask, HavvenManager.to_fixed(new_price), HavvenManager.to_fixed(new_quantity),
+                              None if fee is None else HavvenManager.to_fixed(fee))
+
+    def update_ask_units(self, ask: FixedPointAsk,
+                         new_price: int,
+                         new_quantity: int,
+                         fee: Optional[int] = None) -> None:
+        """
+        Update an Ask as update_ask does, given its new price, quantity and fee in units.
+        """
+        if not ask.active:
+            return
+
+        if ask.price_units == new_price and ask.quantity_units == new_quantity:
+            if fee is None or fee == ask.fee_units:
+                return
+            else:
+                print(ask)
+                raise Exception("Fee changed, but price and quantity are unchanged...")
+
+        if new_quantity <= 0:
+            self.cancel_ask(ask)
+            return
+
+        new_fee = fee
+        if fee is None:
+            new_fee = HavvenManager.to_fixed(self.seller_fee(HavvenManager.from_fixed(new_price),
+                                                             HavvenManager.from_fixed(new_quantity)))
+
+        key = f"unavailable_{self.base}"
+        change = (new_quantity + new_fee) - (ask.quantity_units + ask.fee_units)
+        setattr(ask.issuer, key, getattr(ask.issuer, key) + HavvenManager.from_fixed(change))
+
+        if ask.price_units == new_price:
+            self.asks.adjust(ask, new_quantity - ask.quantity_units)
+            ask.quantity_units = new_quantity
+            ask.fee_units = new_fee
+        else:
+            self.asks.remove(ask, ask.quantity_units)
+            ask.price_units = new_price
+            ask.quantity_units = new_quantity
+            ask.fee_units = new_fee
+            ask.time = self.time
+            self.asks.add(ask, new_price, new_quantity)
+
+        self.step()
+
+    def cancel_ask(self, ask: FixedPointAsk) -> None:
+        """
+        Remove an ask from the ask list, and update cached quantity.
+        """
+        if not ask.active:
+            return
+
+        key = f"unavailable_{self.base}"
+        held = ask.quantity_units + ask.fee_units
+        setattr(ask.issuer, key, getattr(ask.issuer, key) - HavvenManager.from_fixed(held))
+
+        self.asks.remove(ask, ask.quantity_units)
+        self._unlist(ask)
+        ask.active = False
+        ask.quantity_units = 0
+        self.step()
+        ask.issuer.notify_cancelled(ask)
+
+    def _sweep(self) -> bool:
+        """
+        Fill the larger of the best bid and ask against successive orders on the other side,
+        as OrderBook._sweep does, with the sweeper's fills and the orders' bookkeeping in units.
+        Return True iff any trades were made.
+        """
+        bid, ask = self.bids[0], self.asks[0]
+        if bid.quantity_units > ask.quantity_units:
+            taker, resting = bid, self.asks
+        elif ask.quantity_units > bid.quantity_units:
+            taker, resting = ask, self.bids
+        else:
+            return False
+
+        if len(resting) < 2:
+            return False
+        second = resting.best.head._next or resting.levels.peekitem(1)[1].head
+        if (second.price_units > taker.price_units) if taker is bid else (second.price_units < taker.price_units):
+            return False
+
+        fills = self.sweeper(self, taker)
+        if not fills:
+            return False
+
+        taker_is_bid = isinstance(taker, Bid)
+        for fill in fills:
+            if taker_is_bid:
+                if fill.quantity == fill.ask.quantity_units:
+                    self.cancel_ask(fill.ask)
+                else:
+                    self.update_ask_units(fill.ask, fill.ask.price_units, fill.ask.quantity_units - fill.quantity,
+                                          fill.ask.fee_units - fill.ask_fee)
+            else:
+                if fill.quantity == fill.bid.quantity_units:
+                    self.cancel_bid(fill.bid)
+                else:
+                    self.update_bid_units(fill.bid, fill.bid.price_units, fill.bid.quantity_units - fill.quantity,
+                                          fill.bid.fee_units - fill.bid_fee)
+
+        # The taker's unavailable balance changes as in OrderBook._sweep, computed exactly in units,
+        # with the unrounded value freed by a final cancellation in units squared.
+        scale = HavvenManager.fixed_point_scale
+        price = taker.price_units
+        taker_fees = [fill.bid_fee if taker_is_bid else fill.ask_fee for fill in fills]
+        quantity = taker.quantity_units - sum(fill.quantity for fill in fills)
+        fee = taker.fee_units - sum(taker_fees)
+        if taker_is_bid:
+            held = HavvenManager.fixed_product(taker.quantity_units, price) + taker.fee_units
+        else:
+            held = taker.quantity_units + taker.fee_units
+        if quantity <= 0:
+            last_quantity = fills[-1].quantity
+            last_fee = taker.fee_units - sum(taker_fees[:-1])
+            if taker_is_bid:
+                unavailable = HavvenManager.from_fixed(
+                    ((HavvenManager.fixed_product(last_quantity, price) + last_fee) - held) * scale -
+                    (last_quantity * price + last_fee * scale), scale=2)
+            else:
+                unavailable = HavvenManager.from_fixed(-held)
+        elif taker_is_bid:
+            unavailable = HavvenManager.from_fixed((HavvenManager.fixed_product(quantity, price) + fee) - held)
+        else:
+            unavailable = HavvenManager.from_fixed((quantity + fee) - held)
+        self.time += len(fills)
+
+        side = self.bids if taker_is_bid else self.asks
+        key = f"unavailable_{self.quoted if taker_is_bid else self.base}"
+        setattr(taker.issuer, key, getattr(taker.issuer, key) + unavailable)
+        if quantity <= 0:
+            side.remove(taker, taker.quantity_units)
+            self._unlist(taker)
+            taker.active = False
+            taker.quantity_units = 0
+            taker.issuer.notify_cancelled(taker)
+        else:
+            side.adjust(taker, quantity - taker.quantity_units)
+            taker.quantity_units = quantity
+            taker.fee_units = fee
+
+        from_fixed = HavvenManager.from_fixed
+        for fill in fills:
+            trade = TradeRecord(fill.bid.issuer, fill.ask.issuer, self,
+                                from_fixed(fill.price), from_fixed(fill.quantity),
+                                from_fixed(fill.bid_fee), from_fixed(fill.ask_fee),
+                                self.model_manager.time, fill.bid, fill.ask)
+            self._record_trade(trade)
+            self._update_candle(trade.price)
+        return True
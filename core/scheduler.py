@@ -0,0 +1,133 @@
+"""scheduler.py: The scheduler which activates the agents of the Havven model each step."""
+
+import heapq
+from typing import Dict, Iterator, List, Tuple
+
+from mesa.time import RandomActivation
+
+import agents as ag
+
+
+class HavvenActivation(RandomActivation):
+    """
+    Activates agents in a random order per step,
+    informing the Havven manager as agents are added and removed.
+
+    Agents may be put to sleep until a later step, and are not activated,
+    or even shuffled, until they wake, when they catch up on the steps they slept through.
+    If skipping idle agents, each agent is put to sleep after its step
+    for as many steps as it reports being idle.
+    Agents may also be activated in batches by type: the order of the types,
+    and of the agents within each type, is shuffled each step.
+
+    All shuffling draws on the model's random generator, so the activation order
+    is reproducible from its seed. With no agents asleep and no batching,
+    the order is exactly that of mesa's RandomActivation.
+    """
+
+    until_woken: int = 2 ** 62
+    """A number of idle steps long enough that an agent sleeps until something wakes it."""
+
+    def __init__(self, model, skip_idle_agents: bool = False, batch_agent_types: bool = False) -> None:
+        super().__init__(model)
+        self.skip_idle_agents = skip_idle_agents
+        self.batch_agent_types = batch_agent_types
+
+        self.sleeping: Dict[int, int] = {}
+        """The step each sleeping agent wakes at, by unique id."""
+        self.asleep_from: Dict[int, int] = {}
+        """The first step each sleeping agent sleeps through, by unique id."""
+        self._wake_times: List[Tuple[int, int]] = []
+        """A heap of wake steps and unique ids, some stale, for finding agents due to wake."""
+        self.stepping: bool = False
+        """Whether agents are being activated for the current step."""
+
+    def add(self, agent: "ag.MarketPlayer") -> None:
+        super().add(agent)
+        self.model.manager.add_agent(agent)
+
+    def remove(self, agent: "ag.MarketPlayer") -> None:
+        super().remove(agent)
+        self.sleeping.pop(agent.unique_id, None)
+        self.asleep_from.pop(agent.unique_id, None)
+        self.model.manager.remove_agent(agent)
+
+    def sleep(self, agent: "ag.MarketPlayer", steps: int) -> None:
+        """
+        Skip the given agent for the given number of steps,
+        starting with the next step to begin.
+        """
+        if steps <= 0:
+            return
+        wake_time = self.next_step + steps
+        if agent.unique_id not in self.sleeping:
+            self.asleep_from[agent.unique_id] = self.next_step
+        self.sleeping[agent.unique_id] = wake_time
+        heapq.heappush(self._wake_times, (wake_time, agent.unique_id))
+
+    def wake(self, agent: "ag.MarketPlayer") -> None:
+        """Activate a sleeping agent again from the next step it would be activated in."""
+        if self.sleeping.pop(agent.unique_id, None) is not None:
+            self._catch_up(agent.unique_id)
+
+    def is_asleep(self, agent: "ag.MarketPlayer") -> bool:
+        return agent.unique_id in self.sleeping
+
+    @property
+    def next_step(self) -> int:
+        """The next step to begin, after the current one if agents are being activated."""
+        return self.steps + (1 if self.stepping else 0)
+
+    def _catch_up(self, unique_id: int) -> None:
+        """Have an agent which has just woken catch up on the steps it slept through."""
+        self._agents[unique_id].catch_up(self.next_step - self.asleep_from.pop(unique_id))
+
+    def _wake_due(self) -> None:
+        """Wake every agent due to wake by this step."""
+        while self._wake_times and self._wake_times[0][0] <= self.steps:
+            wake_time, unique_id = heapq.heappop(self._wake_times)
+            # Agents woken early, or put back to sleep, have left stale entries behind.
+            if self.sleeping.get(unique_id) == wake_time:
+                del self.sleeping[unique_id]
+                self._catch_up(unique_id)
+
+    def step(self) -> None:
+        """Activate each awake agent once, in random order."""
+        self._wake_due()
+        self.stepping = True
+        try:
+            for agent in self.agent_buffer(shuffled=True):
+                agent.step()
+                if self.skip_idle_agents and agent.unique_id in self._agents:
+                    self.sleep(agent, agent.idle_steps())
+        finally:
+            self.stepping = False
+        self.steps += 1
+        self.time += 1
+
+    def agent_buffer(self, shuffled: bool = False) -> Iterator["ag.MarketPlayer"]:
+        """
+        Yield the awake agents, in random order if shuffled, and in batches by type if batching.
+        Agents may be added, removed, or put to sleep while this runs.
+        """
+        if self.sleeping:
+            agent_keys = [key for key in self._agents if key not in self.sleeping]
+        else:
+            agent_keys = list(self._agents.keys())
+
+        if self.batch_agent_types:
+            batches: Dict[type, List[int]] = {}
+            for key in agent_keys:
+                batches.setdefault(type(self._agents[key]), []).append(key)
+            ordered_batches = list(batches.values())
+            if shuffled:
+                self.model.random.shuffle(ordered_batches)
+                for batch in ordered_batches:
+                    self.model.random.shuffle(batch)
+            agent_keys = [key for batch in ordered_batches for key in batch]
+        elif shuffled:
+            self.model.random.shuffle(agent_keys)
+
+        for key in agent_keys:
+            if key in self._agents and key not in self.sleeping:
+                yield self._agents[key]
@@ -233,7 +233,7 @@ def make_server() -> "tornado.web.Application":
             # the None value will randomize the data on every model reset
             # until the values are changed by the user
             agent_fraction_selector = UserSettableParameter(
-                'agent_fractions', "Agent fraction selector", None
+                'agent_fractions', "Agent fraction selector", None, seed=settings['Model']['seed']
             )
         else:
             agent_fractions = settings['Agents']['AgentFractions']
@@ -250,7 +250,8 @@ def make_server() -> "tornado.web.Application":
             "Havven Model",
             {
                 "num_agents": n_slider,
-                'agent_fractions': agent_fraction_selector
+                'agent_fractions': agent_fraction_selector,
+                'seed': settings['Model']['seed']
             }
         )
     return server
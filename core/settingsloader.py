@@ -26,7 +26,14 @@ def get_defaults():
             "fps_default": 15,
             # limit how many steps can be generated in the non-cached version
             "cap_realtime_steps": False,
-            "max_steps": 1500
+            "max_steps": 1500,
+            # compress the steps of cached datasets on disk, trading some CPU for disk space
+            "cache_compressed": False,
+            # the disk space, in megabytes, past which the least recently used old versions of cached datasets
+            # are removed; the current versions are always kept
+            "cache_budget_mb": 2048,
+            # how many steps of a cached dataset to send ahead of a playing client
+            "cache_prefetch_steps": 40
         },
         "Model": {
             # Number of agents for the model to have
@@ -34,7 +41,17 @@ def get_defaults():
             "num_agents_min": 20,
             "num_agents": 50,
             # Randomise the agent fractions
-            "random_agents": False
+            "random_agents": False,
+            # The seed for every random draw in the model, so runs can be replayed.
+            # None seeds each run differently.
+            "seed": None,
+            # A directory to stream the statistics collected to, in chunks of steps,
+            # so that memory use stays bounded in long runs. Empty keeps them all in memory.
+            "collector_output_dir": "",
+            "collector_chunk_steps": 1000,
+            # How often, in steps, the statistics are collected. 0 collects them only
+            # in the final step of a headless run, for runs which need only the final values.
+            "collector_interval": 1
         },
         "Fees": {
             # how long between fee distributions
@@ -56,7 +73,9 @@ def get_defaults():
                 "nomin_fee_level": Dec("0.005"),
                 "havven_fee_level": Dec("0.005"),
                 "fiat_fee_level": Dec("0.005")
-            }
+            },
+            # compute fee payouts over float arrays, rather than exactly, which is faster with many agents
+            "float_fee_distribution": False
         },
 
         "Mint": {
@@ -91,7 +110,14 @@ def get_defaults():
             # initial supply of nomins (to help with some calculations)
             "nomin_supply": Dec("0"),
             "rolling_avg_time_window": 0,
-            "use_volume_weighted_avg": False
+            "use_volume_weighted_avg": False,
+            # keep every trade record in the order books and players, rather than only the most recent
+            "retain_trade_history": False,
+            # log trades in arrays rather than keeping records of them, to save memory
+            "columnar_trade_log": False,
+            # hold order book prices and quantities as integer counts of the smallest currency unit,
+            # and match them in integer arithmetic, rather than in Decimals
+            "fixed_point_orderbook": False
         },
 
         "Agents": {
@@ -104,6 +130,14 @@ def get_defaults():
             "liquidation_parameter": Dec('0.01'),
             # do actors run profit taking logic
             "profit_taking": True,
+            # put agents to sleep for as long as they report being idle after each step,
+            # instead of activating them every step
+            "skip_idle_agents": False,
+            # activate agents in batches by type, shuffling the types and the agents in each
+            "batch_agent_types": False,
+            # keep agents' balances in a columnar store of arrays, computing
+            # population-wide statistics over whole columns at once
+            "columnar_agent_state": False,
             # add a havven foundation for setting initial parameters for copt
             "havven_foundation_enabled": True,
             "havven_foundation_settings": {
@@ -179,6 +213,8 @@ def parse_config(defaults, config):
                 settings[item] = defaults[item]
         elif type(defaults[item]) == str:
             settings[item] = str(defaults[item])
+        elif defaults[item] is None:
+            settings[item] = None if config[item] is None else int(config[item])
         else:
             raise Exception(f"Error: unexpected type in defaults {type(defaults[item])}")
     return settings
@@ -1,12 +1,12 @@
 """stats.py: Functions for extracting aggregate information from the Havven model."""
 
+from decimal import Decimal as Dec
 from statistics import stdev
-from typing import List, Any
-
-from mesa.datacollection import DataCollector
+from typing import List, Any, Dict, Optional, Sequence, Union
 
 import agents
 from core import model
+from core.datacollector import ColumnarDataCollector
 
 
 def mean(values: List[Any]):
@@ -15,6 +15,36 @@ def mean(values: List[Any]):
     return 0
 
 
+def wealths(havven_model: "model.HavvenModel", players: List["agents.MarketPlayer"]) -> Sequence[Union[Dec, float]]:
+    """
+    Return the wealth of each of the given players,
+    computed as floats over whole columns at once if the model keeps an agent store.
+    """
+    if havven_model.agent_store is None:
+        return [a.wealth() for a in players]
+    return havven_model.agent_store.wealth(
+        players,
+        havven_model.market_manager.havven_fiat_market.price,
+        havven_model.market_manager.nomin_fiat_market.price
+    )
+
+
+def profit_fractions(havven_model: "model.HavvenModel",
+                     players: List["agents.MarketPlayer"]) -> Sequence[Union[Dec, float]]:
+    """
+    Return the profit fraction of each of the given players,
+    computed as floats over whole columns at once if the model keeps an agent store.
+    """
+    if havven_model.agent_store is None:
+        return [a.profit_fraction() for a in players]
+    return havven_model.agent_store.profit_fraction(
+        players,
+        havven_model.manager.time,
+        havven_model.market_manager.havven_fiat_market.price,
+        havven_model.market_manager.nomin_fiat_market.price
+    )
+
+
 def _profit_excluded(name: str) -> bool:
     """
     True iff the agent's profit should be is excluded
@@ -30,25 +60,25 @@ def mean_profit_fraction(havven_model: "model.HavvenModel") -> float:
     """
     if len(havven_model.schedule.agents) == 0:
         return 0
-    return float(mean([a.profit_fraction() for a in havven_model.schedule.agents
-                       if not _profit_excluded(a)]))
+    return float(mean(profit_fractions(havven_model, [a for a in havven_model.schedule.agents
+                                                      if not _profit_excluded(a)])))
 
 
 def mean_agent_profit_fraction(name: str, havven_model: "model.HavvenModel"):
     if len(havven_model.agent_manager.agents[name]) == 0:
         return 0
-    return float(mean([a.profit_fraction() for a in havven_model.agent_manager.agents[name]]))
+    return float(mean(profit_fractions(havven_model, havven_model.agent_manager.agents[name])))
 
 
 def wealth_sd(havven_model: "model.HavvenModel") -> float:
     """Return the standard deviation of wealth in the market."""
-    return float(stdev([a.wealth() for a in havven_model.schedule.agents]))
+    return float(stdev(list(wealths(havven_model, havven_model.schedule.agents))))
 
 
 def gini(havven_model: "model.HavvenModel") -> float:
     """Return the gini coefficient in the market."""
     n = len(havven_model.schedule.agents)
-    s_wealth = sorted([a.wealth() for a in havven_model.schedule.agents])
+    s_wealth = sorted(wealths(havven_model, havven_model.schedule.agents))
     total_wealth = float(sum(s_wealth))
     if total_wealth == 0 or n == 0:
         return 0
@@ -61,7 +91,7 @@ def max_wealth(havven_model: "model.HavvenModel") -> float:
     if len(havven_model.schedule.agents) == 0:
         return 0
 
-    return float(max([a.wealth() for a in havven_model.schedule.agents]))
+    return float(max(wealths(havven_model, havven_model.schedule.agents)))
 
 
 def min_wealth(havven_model: "model.HavvenModel") -> float:
@@ -69,48 +99,48 @@ def min_wealth(havven_model: "model.HavvenModel") -> float:
     if len(havven_model.schedule.agents) == 0:
         return 0
 
-    return float(min([a.wealth() for a in havven_model.schedule.agents]))
+    return float(min(wealths(havven_model, havven_model.schedule.agents)))
 
 
 def fiat_demand(havven_model: "model.HavvenModel") -> float:
     """Return the total quantity of fiat presently being bought in the marketplace."""
-    havvens = float(sum([ask.quantity * ask.price for ask in havven_model.market_manager.havven_fiat_market.asks]))
-    nomins = float(sum([ask.quantity * ask.price for ask in havven_model.market_manager.nomin_fiat_market.asks]))
+    havvens = float(havven_model.market_manager.havven_fiat_market.total_ask_value)
+    nomins = float(havven_model.market_manager.nomin_fiat_market.total_ask_value)
     return havvens + nomins
 
 
 def fiat_supply(havven_model: "model.HavvenModel") -> float:
     """Return the total quantity of fiat presently being sold in the marketplace."""
-    havvens = float(sum([bid.quantity * bid.price for bid in havven_model.market_manager.havven_fiat_market.bids]))
-    nomins = float(sum([bid.quantity * bid.price for bid in havven_model.market_manager.nomin_fiat_market.bids]))
+    havvens = float(havven_model.market_manager.havven_fiat_market.total_bid_value)
+    nomins = float(havven_model.market_manager.nomin_fiat_market.total_bid_value)
     return havvens + nomins
 
 
 def havven_demand(havven_model: "model.HavvenModel") -> float:
     """Return the total quantity of havvens presently being bought in the marketplace."""
-    nomins = float(sum([bid.quantity for bid in havven_model.market_manager.havven_nomin_market.bids]))
-    fiat = float(sum([bid.quantity for bid in havven_model.market_manager.havven_fiat_market.bids]))
+    nomins = float(havven_model.market_manager.havven_nomin_market.total_bid_quantity)
+    fiat = float(havven_model.market_manager.havven_fiat_market.total_bid_quantity)
     return nomins + fiat
 
 
 def havven_supply(havven_model: "model.HavvenModel") -> float:
     """Return the total quantity of havvens presently being sold in the marketplace."""
-    nomins = float(sum([ask.quantity for ask in havven_model.market_manager.havven_fiat_market.asks]))
-    fiat = float(sum([ask.quantity for ask in havven_model.market_manager.havven_nomin_market.asks]))
+    nomins = float(havven_model.market_manager.havven_fiat_market.total_ask_quantity)
+    fiat = float(havven_model.market_manager.havven_nomin_market.total_ask_quantity)
     return nomins + fiat
 
 
 def nomin_demand(havven_model: "model.HavvenModel") -> float:
     """Return the total quantity of nomins presently being bought in the marketplace."""
-    havvens = float(sum([ask.quantity * ask.price for ask in havven_model.market_manager.havven_nomin_market.asks]))
-    fiat = float(sum([bid.quantity for bid in havven_model.market_manager.nomin_fiat_market.bids]))
+    havvens = float(havven_model.market_manager.havven_nomin_market.total_ask_value)
+    fiat = float(havven_model.market_manager.nomin_fiat_market.total_bid_quantity)
     return havvens + fiat
 
 
 def nomin_supply(havven_model: "model.HavvenModel") -> float:
     """Return the total quantity of nomins presently being sold in the marketplace."""
-    havvens = float(sum([bid.quantity * bid.price for bid in havven_model.market_manager.havven_nomin_market.bids]))
-    fiat = float(sum([ask.quantity for ask in havven_model.market_manager.nomin_fiat_market.asks]))
+    havvens = float(havven_model.market_manager.havven_nomin_market.total_bid_value)
+    fiat = float(havven_model.market_manager.nomin_fiat_market.total_ask_quantity)
     return havvens + fiat
 
 
@@ -122,7 +152,14 @@ def escrowed_havvens(havven_model: "model.HavvenModel") -> float:
     )
 
 
-def create_datacollector() -> DataCollector:
+def create_datacollector(output_dir: Optional[str] = None, chunk_steps: int = 1000,
+                         interval: int = 1, intervals: Optional[Dict[str, int]] = None) -> ColumnarDataCollector:
+    """
+    Create the collector of the model's statistics, streaming them to chunks in output_dir
+    every chunk_steps steps if given a directory, or otherwise keeping them all in memory.
+    Each reporter is evaluated every interval steps, or only in the final step of a run if interval is
+    ColumnarDataCollector.at_end, unless given its own interval, by name, in intervals.
+    """
     base_reporters = {
         "0": lambda x: 0,  # Note: workaround for showing labels (more info server.py)
         "1": lambda x: 1,
@@ -152,7 +189,11 @@ def create_datacollector() -> DataCollector:
         "Fiat Demand": fiat_demand,
         "Fiat Supply": fiat_supply,
         "Fee Pool": lambda h: float(h.manager.nomins),
-        "Fees Distributed": lambda h: float(h.fee_manager.fees_distributed),
+        "Fees Distributed": lambda h: float(h.fee_manager.fees_distributed)
+    }
+
+    # Only the latest of these is kept, for the visualisation of each market.
+    order_book_reporters = {
         "NominFiatOrderBook": lambda h: h.market_manager.nomin_fiat_market,
         "HavvenFiatOrderBook": lambda h: h.market_manager.havven_fiat_market,
         "HavvenNominOrderBook": lambda h: h.market_manager.havven_nomin_market
@@ -165,9 +206,18 @@ def create_datacollector() -> DataCollector:
 
     base_reporters.update(agent_reporters)
 
-    return DataCollector(
+    reporter_intervals = {name: interval for name in [*base_reporters, *order_book_reporters, "Agents"]}
+    reporter_intervals.update(intervals or {})
+    # The max nomin issuers read these every step, so they are always collected.
+    reporter_intervals.update({"Havven Supply": 1, "Fiat Supply": 1})
+
+    return ColumnarDataCollector(
         model_reporters=base_reporters,
+        object_reporters=order_book_reporters,
         agent_reporters={
             "Agents": lambda a: a,
-        }
+        },
+        output_dir=output_dir,
+        chunk_steps=chunk_steps,
+        intervals=reporter_intervals
     )
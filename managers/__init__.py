@@ -5,5 +5,6 @@ Classes for holding onto values and functions for the model and agents
 from .havvenmanager import HavvenManager
 from .feemanager import FeeManager
 from .marketmanager import MarketManager
+from .agentstore import AgentStore
 from .agentmanager import AgentManager
 from .mint import Mint
@@ -1,7 +1,8 @@
 from decimal import Decimal as Dec
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import agents as ag
+from .agentstore import AgentStore
 
 
 class AgentManager:
@@ -19,6 +20,7 @@ class AgentManager:
         :param agent_settings: dict holding values from setting file
          - init_value: the initial value from which to calculate agent endowments.
          - agent_minimum: the minimum number of each type of agent to include in the simulation. 1 by default.
+         - columnar_agent_state: whether to keep agents' balances in a columnar AgentStore.
         """
 
         self.wealth_parameter = agent_settings['wealth_parameter']
@@ -29,6 +31,11 @@ class AgentManager:
         # A reference to the Havven sim itself.
         self.havven_model = havven_model
 
+        # The store of agents' balances, if they are kept in columns.
+        # Agents find it on the model as they are created, so it must be in place before any are.
+        self.store: Optional[AgentStore] = AgentStore() if agent_settings['columnar_agent_state'] else None
+        self.havven_model.agent_store = self.store
+
         # Lists of each type of agent.
         self.agents: Dict[str, List[ag.MarketPlayer]] = {
             name: [] for name in ag.player_names
@@ -0,0 +1,81 @@
+from decimal import Decimal as Dec
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+import agents
+from .havvenmanager import HavvenManager
+
+
+class AgentStore:
+    """
+    A columnar store of players' balances, with one float64 NumPy array per balance,
+    and one row per player.
+
+    Players keep their exact Decimal balances themselves, and mirror each balance
+    into its column as it is set, so population-wide statistics can be computed
+    as array operations, rather than by going through each player.
+    The arrays grow geometrically as players are added.
+    """
+
+    columns = ("fiat", "havvens", "nomins", "issued_nomins", "burning_fiat",
+               "unavailable_fiat", "unavailable_havvens", "unavailable_nomins",
+               "wage_parameter", "initial_wealth")
+    """The balances, and the parameters needed to value them, kept for each player."""
+
+    def __init__(self, capacity: int = 64) -> None:
+        self.size: int = 0
+        self.players: List["agents.MarketPlayer"] = []
+        self.data: Dict[str, np.ndarray] = {column: np.zeros(capacity) for column in self.columns}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, player: "agents.MarketPlayer") -> int:
+        """Give a player a new row with zero balances, returning its index."""
+        if self.size == len(self.data["fiat"]):
+            for column in self.columns:
+                self.data[column] = np.concatenate([self.data[column], np.zeros(self.size)])
+        self.players.append(player)
+        self.size += 1
+        return self.size - 1
+
+    def column(self, name: str) -> np.ndarray:
+        """Return a view of a balance for every player, in the order they were added."""
+        return self.data[name][:self.size]
+
+    @staticmethod
+    def rows(players: Iterable["agents.MarketPlayer"]) -> np.ndarray:
+        """Return the rows of the given players."""
+        return np.fromiter((player.store_row for player in players), dtype=np.intp)
+
+    def _fiat_value(self, rows: np.ndarray, fiat: np.ndarray, havven_price: Dec, nomin_price: Dec) -> np.ndarray:
+        """
+        The fiat value of the havvens and unissued nomins in the given rows, plus the given fiat,
+        as HavvenModel.fiat_value computes it.
+        All of a player's havvens count, whether escrowed or not, so escrow need not be computed.
+        """
+        havvens = self.data["havvens"][rows]
+        nomins = self.data["nomins"][rows] - self.data["issued_nomins"][rows]
+        return havvens * float(havven_price) + nomins * float(nomin_price) + fiat
+
+    def wealth(self, players: Iterable["agents.MarketPlayer"],
+               havven_price: Dec, nomin_price: Dec) -> np.ndarray:
+        """Return the wealth of each of the given players at the given fiat prices, as MarketPlayer.wealth does."""
+        rows = self.rows(players)
+        return self._fiat_value(rows, self.data["fiat"][rows], havven_price, nomin_price)
+
+    def profit_fraction(self, players: Iterable["agents.MarketPlayer"], time: int,
+                        havven_price: Dec, nomin_price: Dec) -> np.ndarray:
+        """
+        Return the profit of each of the given players as a fraction of their initial wealth,
+        at the given time and fiat prices, as MarketPlayer.profit_fraction does.
+        """
+        rows = self.rows(players)
+        initial_wealth = self.data["initial_wealth"][rows]
+        fiat = self.data["fiat"][rows] - self.data["wage_parameter"][rows] * time
+        profit = self._fiat_value(rows, fiat, havven_price, nomin_price) - initial_wealth
+        fractions = np.zeros(len(rows))
+        np.divide(profit, initial_wealth, out=fractions,
+                  where=np.round(initial_wealth, HavvenManager.currency_precision) != 0)
+        return fractions
@@ -1,5 +1,9 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from decimal import Decimal as Dec
+from itertools import accumulate
+from operator import sub
+
+import numpy as np
 
 import agents
 from .havvenmanager import HavvenManager
@@ -22,6 +26,7 @@ class FeeManager:
          - stable_fiat_fee_level: the fee rate for fiat
          - stable_nomin_issuance_fee: the fee rate for nomin issuance
          - stable_nomin_redemption_fee: the fee rate for nomin redemption
+         - float_fee_distribution: whether to compute fee payouts over float arrays, rather than exactly
         """
         self.model_manager = model_manager
 
@@ -51,10 +56,25 @@ class FeeManager:
             self.fiat_hedge_fee_rate = Dec(fee_settings['hedging_fee_settings']['fiat_fee_level'])
             self.hedge_length = fee_settings['hedging_fee_settings']['hedge_length']
 
+        self.float_fee_distribution: bool = fee_settings['float_fee_distribution']
+
+        # Incremented whenever the fees collected change, so values derived from them can be cached.
+        self.version: int = 0
+
         self.fees_distributed = Dec(0)
         self.last_fees_collected = Dec(1)  # start at 1 so no 0 value of havvens
         self.was_distributed = False
 
+    @property
+    def last_fees_collected(self) -> Dec:
+        """The fees collected over the last fee period."""
+        return self._last_fees_collected
+
+    @last_fees_collected.setter
+    def last_fees_collected(self, value: Dec) -> None:
+        self._last_fees_collected = value
+        self.version += 1
+
     def collect_hedge_fees(self, actor):
         if self.use_hedging_fee:
             nom_fee = self.nomin_hedge_fee_rate * actor.nomins / self.hedge_length
@@ -148,32 +168,53 @@ class FeeManager:
             self.model_manager.nomins -= nom_to_distribute
 
     def distribute_fees_using_collateralisation_targets(self, schedule_agents: List["agents.MarketPlayer"], copt: Dec, cmax: Dec):
+        """
+        Distribute currently held nomins to holders of havvens, in proportion to their havvens
+        weighted by a multiplier which peaks when their collateralisation is at copt,
+        and falls to zero at no issuance and at cmax.
+
+        The payouts are computed exactly, in Decimal, unless using float fee distribution,
+        in which case they are computed for every agent at once over float arrays,
+        and so are only as accurate as a float, before being rounded to the currency precision.
+        Either way, the pool is drawn down by each payout in turn, in exact Decimal arithmetic,
+        so that it, and the fees distributed, reconcile exactly with the agents' credits.
+        """
         if copt == 0:
             return
         pre_nomins = self.model_manager.nomins
 
-        # calculate alpha_base
-        abase = 0
-        for agent in schedule_agents:
-            ci = agent.collateralisation
-            if ci <= copt:
-                fee_mult = ci / copt
-            elif copt < ci <= cmax:
-                fee_mult = (cmax - ci) / (cmax - copt)
-            else:
-                fee_mult = 0
-            abase += agent.havvens * fee_mult
+        if self.float_fee_distribution:
+            payees, payouts = self._float_payouts(schedule_agents, copt, cmax, pre_nomins)
+        else:
+            payees, payouts = self._exact_payouts(schedule_agents, copt, cmax, pre_nomins)
 
-        if abase <= 0:
+        if payees is None:
             self.last_fees_collected = self.model_manager.nomins - self.last_fees_collected
             print("Skipping fee distribution, no ci is in the 0->cmax range")
             return
 
+        # The pool before each payout, and after the last.
+        pool = list(accumulate(payouts, sub, initial=pre_nomins))
+        paid = next((i for i in range(len(payouts)) if pool[i] < 0), len(payouts))
+
         pre_distribute = self.fees_distributed
+        self._credit_nomins(payees[:paid], payouts[:paid])
+        self.model_manager.nomins = pool[paid]
+        self.fees_distributed = sum(payouts[:paid], pre_distribute)
+        if paid < len(payouts):
+            print(pre_distribute, self.fees_distributed, self.model_manager.nomins)
+            raise Exception("Model manager has less than 0 nomins when distributing fees")
+        self.last_fees_collected = self.fees_distributed - pre_distribute
+
+    @staticmethod
+    def _exact_payouts(schedule_agents: List["agents.MarketPlayer"], copt: Dec, cmax: Dec,
+                       pre_nomins: Dec) -> Tuple[Optional[List["agents.MarketPlayer"]], List[Dec]]:
+        """
+        The payout to each agent, in exact Decimal arithmetic, with the agents paid,
+        or None for the agents if no agent's collateralisation is in the 0->cmax range.
+        """
+        weights = []
         for agent in schedule_agents:
-            if self.model_manager.nomins < 0:
-                print(pre_distribute, self.fees_distributed, self.model_manager.nomins)
-                raise Exception("Model manager has less than 0 nomins when distributing fees")
             ci = agent.collateralisation
             if ci <= copt:
                 fee_mult = ci / copt
@@ -181,10 +222,64 @@ class FeeManager:
                 fee_mult = (cmax - ci) / (cmax - copt)
             else:
                 fee_mult = 0
+            weights.append(agent.havvens * fee_mult)
 
-            qty = (agent.havvens * fee_mult / abase * pre_nomins) * Dec('0.995')
+        # calculate alpha_base
+        abase = sum(weights)
+        if abase <= 0:
+            return None, []
+        return schedule_agents, [(weight / abase * pre_nomins) * Dec('0.995') for weight in weights]
 
-            agent.nomins += qty
-            self.model_manager.nomins -= qty
-            self.fees_distributed += qty
-        self.last_fees_collected = self.fees_distributed - pre_distribute
+    def _float_payouts(self, schedule_agents: List["agents.MarketPlayer"], copt: Dec, cmax: Dec,
+                       pre_nomins: Dec) -> Tuple[Optional[List["agents.MarketPlayer"]], List[Dec]]:
+        """
+        The payout to each agent paid anything, computed over float arrays and rounded to the currency precision,
+        with the agents paid, or None for the agents if no agent's collateralisation is in the 0->cmax range.
+        """
+        havvens, issued_nomins = self._holdings(schedule_agents)
+        collateralisation = self._collateralisation(havvens, issued_nomins)
+
+        # The multiplier is ci/copt up to copt, falling linearly to 0 at cmax, and 0 beyond.
+        c_opt, c_max = float(copt), float(cmax)
+        fee_mult = np.zeros(len(havvens))
+        below = collateralisation <= c_opt
+        between = ~below & (collateralisation <= c_max)
+        fee_mult[below] = collateralisation[below] / c_opt
+        fee_mult[between] = (c_max - collateralisation[between]) / (c_max - c_opt)
+
+        # calculate alpha_base
+        weights = havvens * fee_mult
+        abase = weights.sum()
+        if abase <= 0:
+            return None, []
+
+        # Payouts are rounded to whole units of the currency precision, and only the agents paid anything are kept.
+        units = np.rint(weights / abase * (float(pre_nomins) * 0.995 * HavvenManager.fixed_point_scale))
+        paying = np.flatnonzero(units)
+        return ([schedule_agents[i] for i in paying],
+                [HavvenManager.from_fixed(int(unit)) for unit in units[paying]])
+
+    def _holdings(self, schedule_agents: List["agents.MarketPlayer"]) -> Tuple[np.ndarray, np.ndarray]:
+        """Gather the havvens and issued nomins of the given agents into float arrays."""
+        store = self.model_manager.model.agent_store
+        if store is None:
+            count = len(schedule_agents)
+            return (np.fromiter((agent.havvens for agent in schedule_agents), dtype=float, count=count),
+                    np.fromiter((agent.issued_nomins for agent in schedule_agents), dtype=float, count=count))
+        rows = store.rows(schedule_agents)
+        return store.data["havvens"][rows], store.data["issued_nomins"][rows]
+
+    def _collateralisation(self, havvens: np.ndarray, issued_nomins: np.ndarray) -> np.ndarray:
+        """The collateralisation of each holding, as MarketPlayer.collateralisation computes it, as floats."""
+        market_manager = self.model_manager.model.market_manager
+        nomin_price = float(market_manager.nomin_fiat_market.price)
+        havven_price = float(market_manager.havven_fiat_market.price)
+        collateralisation = np.zeros(len(havvens))
+        issuing = (havvens != 0) & (issued_nomins != 0)
+        collateralisation[issuing] = (issued_nomins[issuing] * nomin_price) / (havvens[issuing] * havven_price)
+        return collateralisation
+
+    def _credit_nomins(self, schedule_agents: List["agents.MarketPlayer"], quantities: List[Dec]) -> None:
+        """Credit each of the given agents with the corresponding quantity of nomins."""
+        for agent, quantity in zip(schedule_agents, quantities):
+            agent.nomins += quantity
@@ -1,6 +1,9 @@
 from decimal import getcontext, ROUND_HALF_UP
 from decimal import Decimal as Dec
-from typing import Dict, Any
+from operator import attrgetter
+from typing import Dict, Any, Set
+
+from sortedcontainers import SortedKeyList
 
 
 class HavvenManager:
@@ -14,6 +17,9 @@ class HavvenManager:
     The decimal context precision should be significantly higher than this.
     """
 
+    fixed_point_scale = 10 ** currency_precision
+    """The number of integer units in a single unit of currency in fixed point representation."""
+
     def __init__(
             self,
             havven_settings: Dict[str, Any],
@@ -26,6 +32,9 @@ class HavvenManager:
          - rolling_avg_time_window: the amount of steps to consider when calculating the
          rolling price average
          - use_volume_weighted_avg: whether to use volume in calculating the rolling price average
+         - retain_trade_history: whether order books and players should keep every trade, rather than just recent ones
+         - columnar_trade_log: whether order books should log trades in NumPy arrays, rather than as objects
+         - fixed_point_orderbook: whether order books should hold prices and quantities as scaled integers
         """
         # Set the decimal rounding mode
         getcontext().rounding = ROUND_HALF_UP
@@ -33,6 +42,9 @@ class HavvenManager:
         # Initiate Time
         self.time: int = 0
 
+        # Orders on every book are numbered from a single sequence, in the order they were listed.
+        self.next_order_id: int = 0
+
         # Money Supply
         self.havven_supply = Dec(havven_settings['havven_supply'])
         self.nomin_supply = Dec(havven_settings['nomin_supply'])
@@ -47,8 +59,24 @@ class HavvenManager:
         self.volume_weighted_average: bool = havven_settings['use_volume_weighted_avg']
         """Whether to calculate the rolling average taking into account the volume of the trades"""
 
+        self.retain_trade_history: bool = havven_settings['retain_trade_history']
+        """Whether order books keep a record of every trade made, rather than only the most recent"""
+
+        self.columnar_trade_log: bool = havven_settings['columnar_trade_log']
+        """Whether order books log trades in arrays, with the history and agents holding only indices"""
+
+        self.fixed_point_orderbook: bool = havven_settings['fixed_point_orderbook']
+        """Whether order books keep their prices and quantities as scaled integers, and match them as such"""
+
         self.model = model
 
+        # The scheduled agents which have issued nomins, ordered by how many,
+        # and the total of their havvens. These are kept up to date as agents are scheduled,
+        # issue and burn nomins, and gain and lose havvens, so active havvens need not be recounted.
+        self.scheduled_agents: Set["agents.MarketPlayer"] = set()
+        self.issuers = SortedKeyList(key=attrgetter('issued_nomins'))
+        self.issuer_havvens: Dec = Dec(0)
+
     @classmethod
     def round_float(cls, value: float) -> Dec:
         """
@@ -68,9 +96,95 @@ class HavvenManager:
         """
         return round(value, cls.currency_precision)
 
+    @classmethod
+    def to_fixed(cls, value: Dec) -> int:
+        """
+        Convert a Decimal to an integer count of the smallest currency unit,
+        rounding it to the precision setting first.
+        This is exact for any value which has already been rounded with round_decimal.
+        """
+        return int(round(Dec(value), cls.currency_precision).scaleb(cls.currency_precision))
+
+    @classmethod
+    def from_fixed(cls, units: int, scale: int = 1) -> Dec:
+        """
+        Convert an integer count of the smallest currency unit back into a Decimal.
+        The product of two fixed point values should be converted with a scale of 2.
+        """
+        return Dec(units).scaleb(-cls.currency_precision * scale)
+
+    @classmethod
+    def fixed_product(cls, a: int, b: int) -> int:
+        """
+        Multiply two fixed point values, rounding the product back to a fixed point value
+        exactly as round_decimal would round the product of the equivalent Decimals,
+        with ties going away from zero under the rounding mode set above.
+        """
+        product = a * b
+        half = cls.fixed_point_scale // 2
+        if product < 0:
+            return -((half - product) // cls.fixed_point_scale)
+        return (product + half) // cls.fixed_point_scale
+
+    def add_agent(self, agent: "agents.MarketPlayer") -> None:
+        """Start counting an agent which has been added to the schedule."""
+        self.scheduled_agents.add(agent)
+        self.count_issuer(agent)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        This manager's state for pickling, as in a model snapshot.
+        The issuers are kept as a plain list, in order, as sorting them while unpickling would read
+        the issued nomins of agents which may not be restored yet. Call sort_issuers once they are.
+        """
+        state = self.__dict__.copy()
+        state['issuers'] = list(self.issuers)
+        return state
+
+    def sort_issuers(self) -> None:
+        """Sort the issuers by their issued nomins again, after unpickling."""
+        self.issuers = SortedKeyList(self.issuers, key=attrgetter('issued_nomins'))
+
+    def remove_agent(self, agent: "agents.MarketPlayer") -> None:
+        """Stop counting an agent which has been removed from the schedule."""
+        self.uncount_issuer(agent)
+        self.scheduled_agents.discard(agent)
+
+    def count_issuer(self, agent: "agents.MarketPlayer") -> None:
+        """Add an agent to the issuers, if it is scheduled and has issued nomins."""
+        if agent.issued_nomins > 0 and agent in self.scheduled_agents:
+            self.issuers.add(agent)
+            self.issuer_havvens += agent.havvens
+
+    def uncount_issuer(self, agent: "agents.MarketPlayer") -> None:
+        """Remove an agent from the issuers, if it is among them. Call this before its issued nomins change."""
+        if agent.issued_nomins > 0 and agent in self.scheduled_agents:
+            self.issuers.remove(agent)
+            self.issuer_havvens -= agent.havvens
+
+    def havvens_changed(self, agent: "agents.MarketPlayer", change: Dec) -> None:
+        """Account for a change in an agent's havvens."""
+        if agent.issued_nomins > 0 and agent in self.scheduled_agents:
+            self.issuer_havvens += change
+
+    def _active_havvens(self) -> Dec:
+        """
+        The total havvens of scheduled agents with escrowed havvens.
+        Escrow increases with issuance, so if the smallest issuer has havvens in escrow,
+        then exactly the issuers do, and their running total can be used.
+        Otherwise, such as when cmax is not yet positive, every agent is checked.
+        """
+        mint = self.model.mint
+        if mint.cmax > 0:
+            if not self.issuers:
+                return Dec(0)
+            if mint.escrowed_havvens(self.issuers[0]) > 0:
+                return self.issuer_havvens
+        return sum(i.havvens for i in self.model.schedule.agents if i.escrowed_havvens > 0)
+
     @property
     def active_havvens(self):
-        active_havvens = sum(i.havvens for i in self.model.schedule.agents if i.escrowed_havvens > 0)
+        active_havvens = self._active_havvens()
         if active_havvens > 0:
             return active_havvens
         # give some initial value if there are no active ones
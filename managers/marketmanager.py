@@ -1,5 +1,5 @@
 from decimal import Decimal as Dec
-from typing import Optional, Callable
+from typing import Optional, Callable, Dict, List, Tuple
 
 import agents as ag
 from core import orderbook as ob
@@ -21,28 +21,39 @@ class MarketManager:
         # If a book is X_Y_market, then X is the base currency,
         #   Y is the quote currency.
         # That is, buyers hold Y and sellers hold X.
-        self.havven_nomin_market = ob.OrderBook(
-            model_manager, "havvens", "nomins", self.havven_nomin_match,
+        # Fixed point books are all matched and swept in integer units, rather than in Decimals.
+        fixed_point = model_manager.fixed_point_orderbook
+        book_type = ob.FixedPointOrderBook if fixed_point else ob.OrderBook
+        sweeper = self.fixed_point_sweep if fixed_point else self.sweep
+        self.havven_nomin_market = book_type(
+            model_manager, "havvens", "nomins", self.fixed_point_match if fixed_point else self.havven_nomin_match,
             self.fee_manager.transferred_nomins_fee,
             self.fee_manager.transferred_havvens_fee,
             self.fee_manager.transferred_nomins_received,
-            self.fee_manager.transferred_havvens_received
+            self.fee_manager.transferred_havvens_received,
+            sweeper
         )
-        self.havven_fiat_market = ob.OrderBook(
-            model_manager, "havvens", "fiat", self.havven_fiat_match,
+        self.havven_fiat_market = book_type(
+            model_manager, "havvens", "fiat", self.fixed_point_match if fixed_point else self.havven_fiat_match,
             self.fee_manager.transferred_fiat_fee,
             self.fee_manager.transferred_havvens_fee,
             self.fee_manager.transferred_fiat_received,
-            self.fee_manager.transferred_havvens_received
+            self.fee_manager.transferred_havvens_received,
+            sweeper
         )
-        self.nomin_fiat_market = ob.OrderBook(
-            model_manager, "nomins", "fiat", self.nomin_fiat_match,
+        self.nomin_fiat_market = book_type(
+            model_manager, "nomins", "fiat", self.fixed_point_match if fixed_point else self.nomin_fiat_match,
             self.fee_manager.transferred_fiat_fee,
             self.fee_manager.transferred_nomins_fee,
             self.fee_manager.transferred_fiat_received,
-            self.fee_manager.transferred_nomins_received
+            self.fee_manager.transferred_nomins_received,
+            sweeper
         )
 
+        # The results of each conversion, by book and whether the conversion divides by its price,
+        # with the book version they were computed at.
+        self._conversion_cache: Dict[Tuple["ob.OrderBook", bool], Tuple[int, Dict[Dec, Dec]]] = {}
+
     def __bid_ask_match(
             self, bid: "ob.Bid", ask: "ob.Ask",
             bid_success: Callable[["ag.MarketPlayer", Dec, Dec], bool],
@@ -134,6 +145,217 @@ class MarketManager:
                                     self.transfer_fiat,
                                     self.transfer_nomins)
 
+    def fixed_point_match(self, bid: "ob.FixedPointBid",
+                          ask: "ob.FixedPointAsk") -> Optional["ob.TradeRecord"]:
+        """
+        Match a bid and ask on a fixed point book, exactly as __bid_ask_match would,
+          but computing the trade in integer units, in the book's own currencies.
+        Cancel any orders which an agent cannot afford to service.
+        Return a TradeRecord object if the match succeeded, otherwise None.
+        """
+        if ask.price_units > bid.price_units:
+            return None
+
+        price = ask.price_units if ask.time < bid.time else bid.price_units
+        quantity = min(ask.quantity_units, bid.quantity_units)
+        bid_fee = self.__prorated_fee(quantity, bid.quantity_units, bid.fee_units)
+        ask_fee = self.__prorated_fee(quantity, ask.quantity_units, ask.fee_units)
+        buy_val = HavvenManager.fixed_product(quantity, price)
+
+        book = ask.book
+        fail = False
+        if not 0 <= buy_val + bid_fee <= HavvenManager.to_fixed(getattr(bid.issuer, book.quoted)):
+            bid.cancel()
+            fail = True
+        if not 0 <= quantity + ask_fee <= HavvenManager.to_fixed(getattr(ask.issuer, book.base)):
+            ask.cancel()
+            fail = True
+        if fail:
+            return None
+        self.__fixed_point_transfer(bid.issuer, ask.issuer, book.quoted, buy_val, bid_fee)
+        self.__fixed_point_transfer(ask.issuer, bid.issuer, book.base, quantity, ask_fee)
+
+        book.update_bid_units(bid, bid.price_units, bid.quantity_units - quantity, bid.fee_units - bid_fee)
+        book.update_ask_units(ask, ask.price_units, ask.quantity_units - quantity, ask.fee_units - ask_fee)
+        from_fixed = HavvenManager.from_fixed
+        return ob.TradeRecord(bid.issuer, ask.issuer, book,
+                              from_fixed(price), from_fixed(quantity), from_fixed(bid_fee), from_fixed(ask_fee),
+                              self.model_manager.time, bid, ask)
+
+    @staticmethod
+    def __prorated_fee(quantity: int, order_quantity: int, order_fee: int) -> int:
+        """
+        The part of an order's fee charged for filling some of its quantity, all in units.
+        A partial fill's share is computed with the same Decimal operations as __bid_ask_match,
+          so that it rounds identically.
+        """
+        if quantity == order_quantity:
+            return order_fee
+        return int(round((Dec(quantity) / Dec(order_quantity)) * Dec(order_fee), 0))
+
+    def __fixed_point_transfer(self, sender: "ag.MarketPlayer", recipient: "ag.MarketPlayer",
+                               currency: str, quantity: int, fee: int) -> None:
+        """
+        Transfer a quantity and fee given in units of a currency, as the transfer functions do,
+          assuming it has already been checked to succeed.
+        """
+        setattr(sender, currency, getattr(sender, currency) - HavvenManager.from_fixed(quantity + fee))
+        setattr(recipient, currency, getattr(recipient, currency) + HavvenManager.from_fixed(quantity))
+        setattr(self.model_manager, currency, getattr(self.model_manager, currency) + HavvenManager.from_fixed(fee))
+
+    @staticmethod
+    def trades_passively(agent: "ag.MarketPlayer") -> bool:
+        """
+        True iff the agent does nothing on being notified of trades and cancellations
+        but record them, so that notifying it late cannot change the outcome of other trades.
+        """
+        kind = type(agent)
+        return kind.notify_trade is ag.MarketPlayer.notify_trade and \
+            kind.notify_cancelled is ag.MarketPlayer.notify_cancelled
+
+    def sweep(self, book: "ob.OrderBook", taker: "ob.LimitOrder") -> List["ob.Fill"]:
+        """
+        Fill the taker, the best order on its side of the book, against successive resting orders
+          on the other side, computing each fill exactly as __bid_ask_match would,
+          and performing the transfers in aggregate per counterparty.
+        Stop before any pair whose transfers would fail, or which involves an agent
+          that reacts to its trades, leaving that pair to the matcher.
+        The orders themselves are left for the book to update.
+        Return the fills that were made.
+        """
+        if not self.trades_passively(taker.issuer):
+            return []
+
+        taker_is_bid = isinstance(taker, ob.Bid)
+        quoted, base = book.quoted, book.base
+
+        # The balances of each agent involved, as they would be after each transfer in turn.
+        balances: Dict[Tuple["ag.MarketPlayer", str], Dec] = {}
+
+        def balance(agent: "ag.MarketPlayer", currency: str) -> Dec:
+            return balances.get((agent, currency), getattr(agent, currency))
+
+        quoted_fees = getattr(self.model_manager, quoted)
+        base_fees = getattr(self.model_manager, base)
+        taker_quantity, taker_fee = taker.quantity, taker.fee
+        fills = []
+
+        for resting in (book.asks if taker_is_bid else book.bids):
+            if not self.trades_passively(resting.issuer):
+                break
+            if taker_is_bid:
+                bid, ask = taker, resting
+                bid_quantity, bid_order_fee = taker_quantity, taker_fee
+                ask_quantity, ask_order_fee = ask.quantity, ask.fee
+            else:
+                bid, ask = resting, taker
+                bid_quantity, bid_order_fee = bid.quantity, bid.fee
+                ask_quantity, ask_order_fee = taker_quantity, taker_fee
+            if ask.price > bid.price:
+                break
+
+            price = ask.price if ask.time < bid.time else bid.price
+            quantity = HavvenManager.round_decimal(min(ask_quantity, bid_quantity))
+            bid_fee = HavvenManager.round_decimal((quantity / bid_quantity) * bid_order_fee)
+            ask_fee = HavvenManager.round_decimal((quantity / ask_quantity) * ask_order_fee)
+            buy_val = HavvenManager.round_decimal(quantity * price)
+
+            buyer_quoted = balance(bid.issuer, quoted)
+            seller_base = balance(ask.issuer, base)
+            if not 0 <= buy_val + bid_fee <= HavvenManager.round_decimal(buyer_quoted) or \
+                    not 0 <= quantity + ask_fee <= HavvenManager.round_decimal(seller_base):
+                break
+
+            balances[(bid.issuer, quoted)] = buyer_quoted - (buy_val + bid_fee)
+            balances[(ask.issuer, quoted)] = balance(ask.issuer, quoted) + buy_val
+            quoted_fees += bid_fee
+            balances[(ask.issuer, base)] = seller_base - (quantity + ask_fee)
+            balances[(bid.issuer, base)] = balance(bid.issuer, base) + quantity
+            base_fees += ask_fee
+            fills.append(ob.Fill(bid, ask, price, quantity, bid_fee, ask_fee))
+
+            # Carry on only while the taker has some quantity left.
+            taker_quantity = HavvenManager.round_decimal(taker_quantity - quantity)
+            taker_fee = HavvenManager.round_decimal(taker_fee - (bid_fee if taker_is_bid else ask_fee))
+            if taker_quantity <= 0:
+                break
+
+        if fills:
+            for (agent, currency), value in balances.items():
+                setattr(agent, currency, value)
+            setattr(self.model_manager, quoted, quoted_fees)
+            setattr(self.model_manager, base, base_fees)
+        return fills
+
+    def fixed_point_sweep(self, book: "ob.FixedPointOrderBook", taker: "ob.FixedPointOrder") -> List["ob.Fill"]:
+        """
+        Sweep a fixed point book exactly as sweep does, computing each fill as fixed_point_match would,
+          and returning fills whose prices, quantities and fees are in units.
+        """
+        if not self.trades_passively(taker.issuer):
+            return []
+
+        taker_is_bid = isinstance(taker, ob.Bid)
+        quoted, base = book.quoted, book.base
+        from_fixed, to_fixed = HavvenManager.from_fixed, HavvenManager.to_fixed
+
+        balances: Dict[Tuple["ag.MarketPlayer", str], Dec] = {}
+
+        def balance(agent: "ag.MarketPlayer", currency: str) -> Dec:
+            return balances.get((agent, currency), getattr(agent, currency))
+
+        quoted_fees = getattr(self.model_manager, quoted)
+        base_fees = getattr(self.model_manager, base)
+        taker_quantity, taker_fee = taker.quantity_units, taker.fee_units
+        fills = []
+
+        for resting in (book.asks if taker_is_bid else book.bids):
+            if not self.trades_passively(resting.issuer):
+                break
+            if taker_is_bid:
+                bid, ask = taker, resting
+                bid_quantity, bid_order_fee = taker_quantity, taker_fee
+                ask_quantity, ask_order_fee = ask.quantity_units, ask.fee_units
+            else:
+                bid, ask = resting, taker
+                bid_quantity, bid_order_fee = bid.quantity_units, bid.fee_units
+                ask_quantity, ask_order_fee = taker_quantity, taker_fee
+            if ask.price_units > bid.price_units:
+                break
+
+            price = ask.price_units if ask.time < bid.time else bid.price_units
+            quantity = min(ask_quantity, bid_quantity)
+            bid_fee = self.__prorated_fee(quantity, bid_quantity, bid_order_fee)
+            ask_fee = self.__prorated_fee(quantity, ask_quantity, ask_order_fee)
+            buy_val = HavvenManager.fixed_product(quantity, price)
+
+            buyer_quoted = balance(bid.issuer, quoted)
+            seller_base = balance(ask.issuer, base)
+            if not 0 <= buy_val + bid_fee <= to_fixed(buyer_quoted) or \
+                    not 0 <= quantity + ask_fee <= to_fixed(seller_base):
+                break
+
+            # Balances are Decimals, and are updated in the same order as in sweep, so they round identically.
+            balances[(bid.issuer, quoted)] = buyer_quoted - from_fixed(buy_val + bid_fee)
+            balances[(ask.issuer, quoted)] = balance(ask.issuer, quoted) + from_fixed(buy_val)
+            quoted_fees += from_fixed(bid_fee)
+            balances[(ask.issuer, base)] = seller_base - from_fixed(quantity + ask_fee)
+            balances[(bid.issuer, base)] = balance(bid.issuer, base) + from_fixed(quantity)
+            base_fees += from_fixed(ask_fee)
+            fills.append(ob.Fill(bid, ask, price, quantity, bid_fee, ask_fee))
+
+            taker_quantity -= quantity
+            taker_fee -= bid_fee if taker_is_bid else ask_fee
+            if taker_quantity <= 0:
+                break
+
+        if fills:
+            for (agent, currency), value in balances.items():
+                setattr(agent, currency, value)
+            setattr(self.model_manager, quoted, quoted_fees)
+            setattr(self.model_manager, base, base_fees)
+        return fills
+
     def transfer_fiat_success(self, sender: "ag.MarketPlayer",
                               quantity: Dec, fee: Dec) -> bool:
         """True iff the sender could successfully send a quantity of fiat."""
@@ -194,29 +416,48 @@ class MarketManager:
             return True
         return False
 
+    def _convert(self, book: "ob.OrderBook", quantity: Dec, divide: bool) -> Dec:
+        """
+        Multiply or divide a quantity by the price of the given book,
+        reusing the result while the book's version is unchanged.
+        """
+        # Read the price first, as this may update the book's version.
+        price = book.price
+        key = (book, divide)
+        cached = self._conversion_cache.get(key)
+        if cached is None or cached[0] != book.version:
+            cached = (book.version, {})
+            self._conversion_cache[key] = cached
+        results = cached[1]
+        result = results.get(quantity)
+        if result is None:
+            result = HavvenManager.round_decimal(quantity / price if divide else quantity * price)
+            results[quantity] = result
+        return result
+
     def havvens_to_nomins(self, quantity: Dec) -> Dec:
         """Convert a quantity of havvens to its equivalent quantity in nomins."""
-        return HavvenManager.round_decimal(quantity * self.havven_nomin_market.price)
+        return self._convert(self.havven_nomin_market, quantity, False)
 
     def havvens_to_fiat(self, quantity: Dec) -> Dec:
         """Convert a quantity of havvens to its equivalent quantity in fiat."""
-        return HavvenManager.round_decimal(quantity * self.havven_fiat_market.price)
+        return self._convert(self.havven_fiat_market, quantity, False)
 
     def nomins_to_havvens(self, quantity: Dec) -> Dec:
         """Convert a quantity of nomins to its equivalent quantity in havvens."""
-        return HavvenManager.round_decimal(quantity / self.havven_nomin_market.price)
+        return self._convert(self.havven_nomin_market, quantity, True)
 
     def nomins_to_fiat(self, quantity: Dec) -> Dec:
         """Convert a quantity of nomins to its equivalent quantity in fiat."""
-        return HavvenManager.round_decimal(quantity * self.nomin_fiat_market.price)
+        return self._convert(self.nomin_fiat_market, quantity, False)
 
     def fiat_to_havvens(self, quantity: Dec) -> Dec:
         """Convert a quantity of fiat to its equivalent quantity in havvens."""
-        return HavvenManager.round_decimal(quantity / self.havven_fiat_market.price)
+        return self._convert(self.havven_fiat_market, quantity, True)
 
     def fiat_to_nomins(self, quantity: Dec) -> Dec:
         """Convert a quantity of fiat to its equivalent quantity in nomins."""
-        return HavvenManager.round_decimal(quantity / self.nomin_fiat_market.price)
+        return self._convert(self.nomin_fiat_market, quantity, True)
 
     @property
     def active_havven_value(self) -> Dec:
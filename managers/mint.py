@@ -1,5 +1,5 @@
 from decimal import Decimal as Dec
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
 import agents
 
@@ -22,6 +22,14 @@ class Mint:
         self.market_manager = market_manager
         self.fee_manager = fee_manager
 
+        # Incremented whenever copt or cmax change, so values derived from them can be cached.
+        self.version: int = 0
+
+        # The intrinsic havven value, with the fee manager version it was computed at.
+        self._intrinsic_value_cache: Tuple[int, Dec] = (-1, Dec(0))
+        # Each agent's escrowed havvens, with the versions and issued nomins they were computed from.
+        self._escrow_cache: Dict["agents.MarketPlayer", Tuple[Tuple[int, int, int], Dec, Dec]] = {}
+
         self.discretionary_burning = mint_settings['discretionary_burning']
 
         self.fixed_cmax = mint_settings['fixed_cmax']
@@ -50,10 +58,28 @@ class Mint:
 
         self.non_discretionary_cap_buffer: Dec = mint_settings['non_discretionary_cap_buffer']
 
-        self.copt: Dec = Dec(-1)
+        self.copt = Dec(-1)
+        self.cmax = Dec(-1)
+
+    @property
+    def copt(self) -> Dec:
         """Optimal collateralisation ratio"""
-        self.cmax: Dec = Dec(-1)
+        return self._copt
+
+    @copt.setter
+    def copt(self, value: Dec) -> None:
+        self._copt = value
+        self.version += 1
+
+    @property
+    def cmax(self) -> Dec:
         """Maximal collateralisation value"""
+        return self._cmax
+
+    @cmax.setter
+    def cmax(self, value: Dec) -> None:
+        self._cmax = value
+        self.version += 1
 
     def add_issuance_controller(self, issuance_controller: 'agents.IssuanceController'):
         self.issuance_controller = issuance_controller
@@ -88,14 +114,24 @@ class Mint:
         The current number of escrowed havvens that the agent has
         Can be greater then their number of available havvens
         """
-        return HavvenManager.round_decimal(
+        # Read the price first, as this may update the book's version.
+        price = self.market_manager.nomin_fiat_market.price
+        version = (self.version, self.fee_manager.version, self.market_manager.nomin_fiat_market.version)
+        issued_nomins = agent.issued_nomins
+        cached = self._escrow_cache.get(agent)
+        if cached is not None and cached[0] == version and cached[1] is issued_nomins:
+            return cached[2]
+
+        escrowed = HavvenManager.round_decimal(
             (
-                agent.issued_nomins *
-                self.market_manager.nomin_fiat_market.price /
+                issued_nomins *
+                price /
                 self.intrinsic_havven_value /
                 self.cmax
             )
         )
+        self._escrow_cache[agent] = (version, issued_nomins, escrowed)
+        return escrowed
 
     def max_issuance_rights(self, agent: "agents.MarketPlayer") -> Dec:
         """
@@ -194,8 +230,13 @@ class Mint:
 
     @property
     def intrinsic_havven_value(self) -> Dec:
+        version, value = self._intrinsic_value_cache
+        if version == self.fee_manager.version:
+            return value
         fees = self.fee_manager.last_fees_collected
-        return max(Dec(0.1), fees/(self.havven_manager.havven_supply * Dec('0.0001')))
+        value = max(Dec(0.1), fees/(self.havven_manager.havven_supply * Dec('0.0001')))
+        self._intrinsic_value_cache = (self.fee_manager.version, value)
+        return value
 
     @property
     def global_nomin_value(self) -> Dec:
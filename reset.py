@@ -1,6 +1,7 @@
 from core import settingsloader
 from core import cachehandler
 import os
+import shutil
 
 if __name__ == "__main__":
     x = input("Clear and refresh settings.json (y/[any])? ")
@@ -9,7 +10,9 @@ if __name__ == "__main__":
         os.remove("settings.json")
         settings = settingsloader.load_settings()
 
-    x = input("Clear and refresh cache_data.pkl (y/[any])? ")
+    x = input("Clear and refresh the cached datasets (y/[any])? ")
     if x.lower() in ['y', 'yes']:
-        data = cachehandler.generate_new_caches({})
-        cachehandler.save_data(data)
+        shutil.rmtree(cachehandler.CACHE_DIR, ignore_errors=True)
+        settings = settingsloader.load_settings()
+        codec = "zlib" if settings['Server']['cache_compressed'] else "none"
+        cachehandler.generate_new_caches(cachehandler.load_saved(), codec=codec, defaults=settings)
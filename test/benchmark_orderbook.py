@@ -0,0 +1,254 @@
+"""
+benchmark_orderbook: throughput and memory benchmarks for the order book.
+
+Each scenario drives a book with a synthetic flow of orders, and reports the
+orders and matches processed per second, along with the peak memory allocated.
+Results are compared against a stored baseline, and the run fails if any
+scenario is slower, or uses more memory, than the baseline allows.
+Throughput depends on the machine, so the baseline should be recorded
+on the same machine as the runs it is compared with.
+
+Run from the repository root with:
+    python -m test.benchmark_orderbook
+and pass --save-baseline to record the current results as the new baseline.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from decimal import Decimal as Dec
+from typing import Any, Callable, Dict, List, Tuple
+
+import agents as ag
+from core import settingsloader, model
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+"""The default location of the stored baseline results."""
+
+
+def make_book(fixed_point: bool) -> Tuple["model.HavvenModel", Any]:
+    """Create a model without agents, returning it with its havven/fiat book."""
+    settings = settingsloader.get_defaults()
+    settings['Havven']['fixed_point_orderbook'] = fixed_point
+    settings['Havven']['retain_trade_history'] = True
+    model_settings = settings['Model']
+    model_settings['agent_fractions'] = settings['Agents']['AgentFractions']
+    model_settings['num_agents'] = 0
+    settings['Agents']['agent_minimum'] = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        havven_model = model.HavvenModel(
+            model_settings, settings['Fees'], settings['Agents'], settings['Havven'], settings['Mint']
+        )
+    for item in havven_model.schedule.agents:
+        havven_model.schedule.remove(item)
+    return havven_model, havven_model.market_manager.havven_fiat_market
+
+
+def make_players(havven_model: "model.HavvenModel", count: int) -> List["ag.MarketPlayer"]:
+    """Add players with effectively unlimited fiat and havvens."""
+    players = []
+    for i in range(count):
+        player = ag.MarketPlayer(1000 + i, havven_model, fiat=Dec(10 ** 9), havvens=Dec(10 ** 9))
+        havven_model.agent_manager.add(player)
+        players.append(player)
+    return players
+
+
+def random_price(rng: random.Random, low: int, high: int) -> Dec:
+    """A price with up to four decimal places in [low, high] hundredths."""
+    return Dec(rng.randint(low * 100, high * 100)) / Dec(10000)
+
+
+def deep_book(havven_model, book, players, rng, scale) -> int:
+    """Build a deep book of resting orders across many price levels, none of which cross."""
+    orders = 0
+    for _ in range(scale):
+        player = rng.choice(players)
+        player.place_havven_fiat_bid(Dec(rng.randint(1, 1000)) / 100, random_price(rng, 50, 99))
+        player.place_havven_fiat_ask(Dec(rng.randint(1, 1000)) / 100, random_price(rng, 101, 150))
+        orders += 2
+    return orders
+
+
+def cancel_churn(havven_model, book, players, rng, scale) -> int:
+    """Market makers repeatedly cancel and re-place both legs around a drifting price over a resting book."""
+    orders = deep_book(havven_model, book, players, rng, scale // 10)
+    makers = players[:10]
+    quotes: Dict[int, List] = {maker.unique_id: [] for maker in makers}
+    mid = Dec(1)
+    for i in range(scale):
+        maker = makers[i % len(makers)]
+        for order in quotes[maker.unique_id]:
+            if order is not None:
+                order.cancel()
+                orders += 1
+        mid = max(Dec('0.995'), min(Dec('1.005'), mid + Dec(rng.randint(-5, 5)) / 10000))
+        quotes[maker.unique_id] = [
+            maker.place_havven_fiat_bid(Dec(rng.randint(1, 100)), mid - Dec('0.005')),
+            maker.place_havven_fiat_ask(Dec(rng.randint(1, 100)), mid + Dec('0.005'))
+        ]
+        orders += 2
+    return orders
+
+
+def crossing_sweeps(havven_model, book, players, rng, scale) -> int:
+    """Large orders sweep through many levels of resting orders on the other side."""
+    orders = 0
+    for i in range(scale):
+        player = rng.choice(players)
+        if i % 50 == 49:
+            if i % 100 == 99:
+                player.place_havven_fiat_bid(Dec(rng.randint(500, 1500)), Dec(2))
+            else:
+                player.place_havven_fiat_ask(Dec(rng.randint(500, 1500)), Dec('0.5'))
+        elif i % 2:
+            player.place_havven_fiat_ask(Dec(rng.randint(1, 2000)) / 100, random_price(rng, 101, 130))
+        else:
+            player.place_havven_fiat_bid(Dec(rng.randint(1, 2000)) / 100, random_price(rng, 70, 99))
+        orders += 1
+    return orders
+
+
+def tiny_partial_fills(havven_model, book, players, rng, scale) -> int:
+    """Many tiny orders each partially fill a few large resting orders."""
+    orders = 0
+    for player in players[:5]:
+        player.place_havven_fiat_ask(Dec(10 ** 6), Dec(1))
+        orders += 1
+    for _ in range(scale):
+        rng.choice(players).place_havven_fiat_bid(Dec(rng.randint(1, 100)) / 10 ** 6, Dec(1))
+        orders += 1
+    return orders
+
+
+scenarios: Dict[str, Callable[..., int]] = {
+    "deep_book": deep_book,
+    "cancel_churn": cancel_churn,
+    "crossing_sweeps": crossing_sweeps,
+    "tiny_partial_fills": tiny_partial_fills,
+}
+"""Each scenario takes the model, book, players, a random generator, and a scale,
+and returns the number of orders it submitted or cancelled."""
+
+
+def run_scenario(name: str, fixed_point: bool, scale: int, repeat: int = 3, seed: int = 0) -> Dict[str, float]:
+    """
+    Run a scenario from the same seed several times, taking the least CPU time,
+    then once more under tracemalloc, and return its throughput and peak memory.
+    """
+    elapsed = None
+    for _ in range(repeat):
+        havven_model, book = make_book(fixed_point)
+        players = make_players(havven_model, 20)
+        start = time.process_time()
+        orders = scenarios[name](havven_model, book, players, random.Random(seed), scale)
+        duration = time.process_time() - start
+        elapsed = duration if elapsed is None else min(elapsed, duration)
+        matches = len(book.history)
+
+    havven_model, book = make_book(fixed_point)
+    players = make_players(havven_model, 20)
+    tracemalloc.start()
+    scenarios[name](havven_model, book, players, random.Random(seed), scale)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "orders": orders,
+        "matches": matches,
+        "seconds": elapsed,
+        "orders_per_sec": orders / elapsed,
+        "matches_per_sec": matches / elapsed,
+        "peak_memory": peak,
+    }
+
+
+def run_all(names: List[str], scale: int, books: List[str], repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """Run the named scenarios on each kind of book, returning results keyed by scenario/book."""
+    results = {}
+    for name in names:
+        for book in books:
+            results[f"{name}/{book}"] = run_scenario(name, book == "fixed", scale, repeat)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """
+    Return a description of each regression of the results against the baseline.
+    Throughput may fall, and memory may rise, by the tolerance fraction before it counts.
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        base = baseline[key]
+        for metric in ["orders_per_sec", "matches_per_sec"]:
+            if base[metric] > 0 and result[metric] < base[metric] * (1 - tolerance):
+                regressions.append(f"{key}: {metric} fell from {base[metric]:.0f} to {result[metric]:.0f}")
+        if result["peak_memory"] > base["peak_memory"] * (1 + tolerance):
+            regressions.append(f"{key}: peak_memory rose from {base['peak_memory']} to {result['peak_memory']}")
+    return regressions
+
+
+def report(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]) -> str:
+    """Format the results as a table, with ratios to the baseline where there is one."""
+    lines = [f"{'scenario':32} {'orders/s':>10} {'matches/s':>10} {'peak MiB':>9} {'vs baseline':>24}"]
+    for key, result in results.items():
+        versus = ""
+        if key in baseline:
+            base = baseline[key]
+            versus = f"{result['orders_per_sec'] / base['orders_per_sec']:.2f}x orders " \
+                     f"{result['peak_memory'] / base['peak_memory']:.2f}x mem"
+        lines.append(f"{key:32} {result['orders_per_sec']:10.0f} {result['matches_per_sec']:10.0f} "
+                     f"{result['peak_memory'] / 2 ** 20:9.2f} {versus:>24}")
+    return "\n".join(lines)
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the order book against a stored baseline.")
+    parser.add_argument("--scenario", action="append", choices=sorted(scenarios),
+                        help="a scenario to run, may be repeated (default: all)")
+    parser.add_argument("--book", action="append", choices=["decimal", "fixed"],
+                        help="the kind of book to run on, may be repeated (default: both)")
+    parser.add_argument("--scale", type=int, default=5000, help="the size of each scenario")
+    parser.add_argument("--repeat", type=int, default=3, help="the number of timed runs, of which the fastest is kept")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="the baseline file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="the fraction by which results may be worse than the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="save these results as the baseline")
+    args = parser.parse_args(argv)
+
+    results = run_all(args.scenario or list(scenarios), args.scale, args.book or ["decimal", "fixed"], args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        if stored.get("scale") == args.scale:
+            baseline = stored["results"]
+        else:
+            print(f"Baseline was recorded at scale {stored.get('scale')}, not comparing.")
+
+    print(report(results, baseline))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"scale": args.scale, "results": results}, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
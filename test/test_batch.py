@@ -0,0 +1,65 @@
+import json
+from decimal import Decimal as Dec
+
+import pytest
+
+from core import batch, settingsloader
+
+SPEC = {
+    "max_steps": 3,
+    "seeds": [1, 2],
+    "settings": {"Model.num_agents": 20},
+    "sweep": {
+        "Fees.transfer_fee_settings.nomin_fee_level": ["0.002", 0.005],
+        "Agents.profit_taking": [True, "false"]
+    }
+}
+
+
+def test_set_setting_converts_to_the_setting_type():
+    settings = settingsloader.get_defaults()
+    batch.set_setting(settings, "Fees.transfer_fee_settings.nomin_fee_level", 0.005)
+    batch.set_setting(settings, "Model.num_agents", "30")
+    batch.set_setting(settings, "Agents.profit_taking", "False")
+    batch.set_setting(settings, "Agents.AgentFractions.Banker", 7)
+    assert settings['Fees']['transfer_fee_settings']['nomin_fee_level'] == Dec('0.005')
+    assert settings['Model']['num_agents'] == 30
+    assert settings['Agents']['profit_taking'] is False
+    assert settings['Agents']['AgentFractions']['Banker'] == 7
+
+    for path in ["Model.no_such_setting", "Nowhere.num_agents", "Fees.transfer_fee_settings"]:
+        with pytest.raises(Exception):
+            batch.set_setting(settings, path, 1)
+
+
+def test_sweep_expands_every_combination_per_seed():
+    runs = batch.expand_sweep(SPEC)
+    assert len(runs) == 8
+    assert len({batch.run_key(run) for run in runs}) == 8
+    assert all(run["settings"]["Model.num_agents"] == 20 for run in runs)
+    assert [run["seed"] for run in runs] == [1, 2] * 4
+
+
+def test_sweep_runs_across_processes_and_resumes(tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    assert batch.run_sweep(SPEC, output, jobs=2) == 8
+
+    with open(output) as f:
+        results = [json.loads(line) for line in f]
+    assert sorted(batch.run_key(r) for r in results) == sorted(batch.run_key(r) for r in batch.expand_sweep(SPEC))
+
+    # Runs in worker processes are the same as runs made here, from the same seed.
+    for result in results[:2]:
+        run = {"settings": result["settings"], "seed": result["seed"]}
+        again = batch.run_model(run, SPEC["max_steps"])
+        assert (again["steps"], again["error"], again["reporters"]) == \
+            (result["steps"], result["error"], result["reporters"])
+        assert result["reporters"]["Nomin Price"] > 0
+
+    # Resuming makes only the runs missing from the output.
+    with open(output, "w") as f:
+        f.writelines(json.dumps(result) + "\n" for result in results[:5])
+    assert batch.run_sweep(SPEC, output, jobs=2, resume=True) == 3
+    with open(output) as f:
+        assert len(f.readlines()) == 8
+    assert batch.run_sweep(SPEC, output, jobs=2, resume=True) == 0
@@ -0,0 +1,24 @@
+import pytest
+
+from test import benchmark_orderbook as bench
+
+
+@pytest.mark.parametrize('name', sorted(bench.scenarios))
+def test_scenarios_run(name):
+    results = bench.run_all([name], 120, ["decimal", "fixed"], repeat=1)
+    decimal, fixed = results[f"{name}/decimal"], results[f"{name}/fixed"]
+    assert decimal["orders"] == fixed["orders"] > 0
+    assert decimal["matches"] == fixed["matches"]
+    assert decimal["peak_memory"] > 0
+    if name in ["crossing_sweeps", "tiny_partial_fills"]:
+        assert decimal["matches"] > 0
+
+
+def test_compare_flags_regressions():
+    baseline = {"a/decimal": {"orders_per_sec": 100, "matches_per_sec": 0, "peak_memory": 1000}}
+    assert bench.compare({"a/decimal": {"orders_per_sec": 80, "matches_per_sec": 0, "peak_memory": 1200}},
+                         baseline, 0.25) == []
+    assert len(bench.compare({"a/decimal": {"orders_per_sec": 70, "matches_per_sec": 0, "peak_memory": 1300}},
+                             baseline, 0.25)) == 2
+    assert bench.compare({"b/fixed": {"orders_per_sec": 1, "matches_per_sec": 0, "peak_memory": 10 ** 9}},
+                         baseline, 0.25) == []
@@ -0,0 +1,87 @@
+import json
+import tempfile
+
+import tornado.testing
+import tornado.websocket
+
+from core import settingsloader
+from core.cachestore import CacheStore
+from visualization.cached_server import CachedDataHandler, CachedModularServer
+
+
+def make_data_handler(path, steps):
+    """A data handler serving a single dataset of the given number of steps, without generating it."""
+    store = CacheStore(path)
+    writer = store.create("key", "Dataset", "", {}, steps, chunk_steps=4)
+    for step in range(steps):
+        writer.append({"step": step})
+    writer.close()
+
+    data_handler = CachedDataHandler.__new__(CachedDataHandler)
+    data_handler.default_settings = settingsloader.get_defaults()
+    data_handler.store = store
+    data_handler.keys = {"Dataset": "key"}
+    return data_handler
+
+
+def test_step_ranges_are_clipped_to_the_dataset(tmp_path):
+    data_handler = make_data_handler(str(tmp_path), 10)
+    assert data_handler.get_steps("Dataset", 0, 3) == [{"step": 0}, {"step": 1}, {"step": 2}]
+    # The range may run past the last step, which is included.
+    assert data_handler.get_steps("Dataset", 8, 20) == [{"step": 8}, {"step": 9}]
+    assert data_handler.get_steps("Dataset", 10, 20) is False
+    assert data_handler.get_steps("Dataset", 3, 3) is False
+    assert data_handler.get_steps("Missing", 0, 1) is False
+    assert data_handler.get_step("Dataset", 9) == {"step": 9} and data_handler.get_step("Dataset", 10) is False
+
+
+class TestCachedSocketHandler(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        settings = settingsloader.get_defaults()
+        settings['Server']['fps_max'] = 50
+        settings['Server']['cache_prefetch_steps'] = 4
+        app = CachedModularServer(settings, [], "Test")
+        app.verbose = False
+        self.tmp_dir = self.enterContext(tempfile.TemporaryDirectory())
+        app.cached_data_handler = make_data_handler(self.tmp_dir, 10)
+        return app
+
+    async def connect(self):
+        return await tornado.websocket.websocket_connect(f"ws://127.0.0.1:{self.get_http_port()}/ws")
+
+    async def read(self, connection):
+        return json.loads(await connection.read_message())
+
+    @tornado.testing.gen_test
+    async def test_range_request(self):
+        connection = await self.connect()
+        connection.write_message(json.dumps({"type": "get_steps", "dataset": "Dataset", "step_start": 7, "step_end": 12}))
+        # The stored JSON of each step is sent as it is.
+        message = await connection.read_message()
+        assert message == '{"type":"viz_state","dataset":"Dataset","data":[[8,{"step":7}],[9,{"step":8}],[10,{"step":9}]]}'
+
+        connection.write_message(json.dumps({"type": "get_steps", "dataset": "Dataset", "step": 10}))
+        assert (await self.read(connection))["type"] == "end"
+
+    @tornado.testing.gen_test
+    async def test_prefetch_pushes_steps_until_the_end(self):
+        connection = await self.connect()
+        connection.write_message(json.dumps({"type": "prefetch", "dataset": "Dataset", "step": 2, "fps": 100}))
+        message = await self.read(connection)
+        assert [step for step, _ in message["data"]] == [3, 4, 5, 6]
+
+        pushed = []
+        message = await self.read(connection)
+        while message["type"] == "viz_state":
+            pushed.extend(step for step, _ in message["data"])
+            message = await self.read(connection)
+        assert pushed == [7, 8, 9, 10] and message["type"] == "end"
+
+    @tornado.testing.gen_test
+    async def test_stopped_prefetch_pushes_no_more(self):
+        connection = await self.connect()
+        connection.write_message(json.dumps({"type": "prefetch", "dataset": "Dataset", "step": 0, "fps": 1}))
+        assert len((await self.read(connection))["data"]) == 4
+        connection.write_message(json.dumps({"type": "stop_prefetch"}))
+        connection.write_message(json.dumps({"type": "get_steps", "dataset": "Dataset", "step_start": 4, "step_end": 5}))
+        assert (await self.read(connection))["data"] == [[5, {"step": 4}]]
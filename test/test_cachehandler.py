@@ -0,0 +1,75 @@
+import copy
+import os
+
+import pytest
+
+from core import cachehandler, settingsloader
+from core.cachestore import CacheStore
+
+get_defaults = settingsloader.get_defaults
+
+
+def defaults_without_bankers():
+    settings = get_defaults()
+    del settings['Agents']['AgentFractions']['Banker']
+    return settings
+
+
+@pytest.fixture
+def items(monkeypatch):
+    """Two short, seeded runs without bankers, in place of the cached datasets."""
+    monkeypatch.setattr(settingsloader, "get_defaults", defaults_without_bankers)
+    items = [copy.deepcopy(item) for item in cachehandler.run_settings if item['name'] in
+             ("Balanced", "Low number of Nomin Shorters")]
+    for item in items:
+        item['max_steps'] = 25
+        item['settings']['Model']['seed'] = 7
+    monkeypatch.setattr(cachehandler, "run_settings", items)
+    return items
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_datasets_are_generated_across_processes(tmp_path, items):
+    store = cachehandler.generate_new_caches(CacheStore(str(tmp_path)), chunk_steps=10, jobs=2)
+    keys = cachehandler.dataset_keys(chunk_steps=10)
+    assert all(store.is_complete(key) and store.steps(key) == 25 for key in keys.values())
+    assert len(store.get_step(keys["Balanced"], 24)) == len(store.get_step(keys["Balanced"], 0))
+
+    # Only a dataset whose settings changed is generated again, as a new version beside the old.
+    items[0]['settings']['Model']['seed'] = 8
+    changed = cachehandler.dataset_keys(chunk_steps=10)
+    assert changed["Balanced"] != keys["Balanced"] and changed[items[1]['name']] == keys[items[1]['name']]
+    assert cachehandler.dataset_keys(chunk_steps=10, codec="zlib")["Balanced"] != changed["Balanced"]
+
+    modified = os.stat(os.path.join(store.dataset_path(keys[items[1]['name']]), "meta.json")).st_mtime_ns
+    cachehandler.generate_new_caches(store, chunk_steps=10, jobs=2)
+    assert set(keys.values()) | set(changed.values()) == set(store.datasets)
+    assert store.is_complete(changed["Balanced"])
+    assert os.stat(os.path.join(store.dataset_path(keys[items[1]['name']]), "meta.json")).st_mtime_ns == modified
+
+
+def test_interrupted_dataset_resumes_from_its_last_chunk(tmp_path, items):
+    item = items[0]
+    key = cachehandler.generate_dataset(str(tmp_path / "whole"), item, chunk_steps=10)
+
+    done = []
+
+    def interrupt_at_step_15(steps):
+        done.append(steps)
+        if sum(done) == 15:
+            raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        cachehandler.generate_dataset(str(tmp_path / "resumed"), item, 10, "none", interrupt_at_step_15)
+    assert CacheStore(str(tmp_path / "resumed")).steps(key) == 10
+
+    progress = []
+    cachehandler.generate_dataset(str(tmp_path / "resumed"), item, 10, "none", progress.append)
+    assert progress[0] == 10 and sum(progress) == 25
+
+    whole, resumed = CacheStore(str(tmp_path / "whole")), CacheStore(str(tmp_path / "resumed"))
+    assert resumed.is_complete(key)
+    assert resumed.get_steps(key, 0, 25) == whole.get_steps(key, 0, 25)
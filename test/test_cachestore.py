@@ -0,0 +1,117 @@
+import json
+import os
+
+import pytest
+
+from core.cachestore import CacheStore
+
+
+def step_data(step):
+    """Data shaped like a step of the visualisation's elements."""
+    return [[step, step / 2], {"step": step, "name": f"step {step}"}, [[1.5, 2.25], step * 3]]
+
+
+def write_dataset(store, key, steps, codec="none", chunk_steps=3, close=True):
+    writer = store.create(key, key.title(), f"{key} description", {"Model": {"num_agents": 10}}, steps, chunk_steps, codec)
+    for step in range(steps):
+        writer.append(step_data(step))
+    if close:
+        writer.close()
+    return writer
+
+
+@pytest.mark.parametrize("codec", CacheStore.codecs)
+def test_steps_are_read_back_as_written(tmp_path, codec):
+    store = CacheStore(str(tmp_path))
+    write_dataset(store, "some-dataset", 7, codec)
+
+    assert store.steps("some-dataset") == 7 and store.is_complete("some-dataset")
+    assert [store.get_step("some-dataset", step) for step in range(7)] == [step_data(step) for step in range(7)]
+    assert store.get_steps("some-dataset", 2, 5) == [step_data(step) for step in range(2, 5)]
+    assert store.get_steps("some-dataset", 5, 100) == [step_data(5), step_data(6)]
+    assert store.get_step("some-dataset", 7) is None and store.get_step("missing", 0) is None
+    # Steps are read back as the compact JSON they were stored as.
+    assert store.get_step_json("some-dataset", 3) == json.dumps(step_data(3), separators=(",", ":")).encode()
+
+    # Two full chunks and the partly full last one.
+    files = sorted(os.listdir(store.dataset_path("some-dataset")))
+    assert files == [f"chunk_{n:06d}.{ext}" for n in range(3) for ext in ("bin", "idx.npy")] + ["meta.json"]
+
+
+def test_reopened_store_reads_only_descriptions(tmp_path):
+    write_dataset(CacheStore(str(tmp_path)), "some-dataset", 5, "zlib")
+
+    store = CacheStore(str(tmp_path), max_open_chunks=1)
+    assert store.datasets["some-dataset"]["description"] == "some-dataset description"
+    assert store.datasets["some-dataset"]["settings"] == {"Model": {"num_agents": 10}}
+    assert not store._open_chunks
+
+    assert store.get_step("some-dataset", 4) == step_data(4)
+    assert store.get_step("some-dataset", 0) == step_data(0)
+    assert list(store._open_chunks) == [("some-dataset", 0)]
+
+
+def test_datasets_are_written_independently(tmp_path):
+    store = CacheStore(str(tmp_path))
+    write_dataset(store, "first", 4)
+    first_meta = os.path.join(store.dataset_path("first"), "meta.json")
+    modified = os.stat(first_meta).st_mtime_ns
+
+    write_dataset(store, "second", 4)
+    store.remove("second")
+    write_dataset(store, "third", 2)
+
+    assert os.stat(first_meta).st_mtime_ns == modified
+    assert sorted(CacheStore(str(tmp_path)).datasets) == ["first", "third"]
+    assert store.get_step("first", 3) == step_data(3)
+
+
+def test_unfinished_dataset_keeps_its_full_chunks(tmp_path):
+    write_dataset(CacheStore(str(tmp_path)), "unfinished", 7, close=False)
+
+    store = CacheStore(str(tmp_path))
+    assert not store.is_complete("unfinished")
+    assert store.steps("unfinished") == 6
+    assert store.get_step("unfinished", 5) == step_data(5) and store.get_step("unfinished", 6) is None
+
+    with pytest.raises(Exception):
+        store.create("bad-codec", "Bad Codec", "", {}, 1, codec="lzma")
+
+
+def test_unfinished_dataset_resumes_from_its_last_checkpoint(tmp_path):
+    store = CacheStore(str(tmp_path))
+    writer = store.create("unfinished", "Unfinished", "", {}, 10, chunk_steps=3)
+    for step in range(8):
+        writer.append(step_data(step), lambda: f"after {writer.steps}".encode())
+    # Only the latest complete chunk's checkpoint is kept.
+    assert [path.name for path in tmp_path.glob("*/checkpoint_*")] == ["checkpoint_000000006.bin"]
+
+    store = CacheStore(str(tmp_path))
+    writer, checkpoint = store.resume("unfinished")
+    assert (writer.steps, checkpoint) == (6, b"after 6")
+    for step in range(6, 10):
+        writer.append(step_data(step))
+    writer.close()
+
+    store = CacheStore(str(tmp_path))
+    assert store.is_complete("unfinished")
+    assert store.get_steps("unfinished", 0, 10) == [step_data(step) for step in range(10)]
+    assert not list(tmp_path.glob("*/checkpoint_*"))
+    with pytest.raises(Exception):
+        store.resume("unfinished")
+
+
+def test_least_recently_used_datasets_are_evicted_over_budget(tmp_path):
+    store = CacheStore(str(tmp_path))
+    for key in ["old", "older", "current", "recent"]:
+        write_dataset(store, key, 6)
+    for last_used, key in enumerate(["older", "old", "current", "recent"]):
+        store.datasets[key]["last_used"] = last_used
+        store.write_meta(store.datasets[key])
+    sizes = {key: store.size(key) for key in store.datasets}
+    assert all(sizes.values())
+
+    assert store.evict(sum(sizes.values())) == []
+    assert store.evict(sizes["current"] + sizes["recent"], keep=["current"]) == ["older", "old"]
+    assert store.evict(0, keep=["current"]) == ["recent"]
+    assert sorted(CacheStore(str(tmp_path)).datasets) == ["current"]
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from core.datacollector import ColumnarDataCollector, load_chunks
+
+
+def make_counter():
+    """A stand-in for a model, with a count and two agents, and a collector of it."""
+    counter = SimpleNamespace(count=0, schedule=SimpleNamespace(agents=[
+        SimpleNamespace(unique_id=1, value=10), SimpleNamespace(unique_id=2, value=20)
+    ]))
+    reporters = {
+        "Count": lambda c: c.count,
+        "Half": lambda c: c.count / 2
+    }
+    return counter, reporters
+
+
+def collect_counts(collector, counter, steps):
+    for _ in range(steps):
+        counter.count += 1
+        collector.collect(counter)
+
+
+def test_collector_grows_its_columns():
+    counter, reporters = make_counter()
+    collector = ColumnarDataCollector(
+        reporters, object_reporters={"Schedule": lambda c: c.schedule},
+        agent_reporters={"Value": lambda a: a.value}, capacity=2
+    )
+    collect_counts(collector, counter, 5)
+
+    assert collector.steps == collector.size == 5
+    assert list(collector.series("Count")) == [1, 2, 3, 4, 5]
+    assert collector.series("Half").dtype == np.float64
+    assert collector.latest("Count") == 5 and collector.latest_values() == {"Count": 5, "Half": 2.5}
+    assert collector.latest("Schedule") is counter.schedule
+    assert collector.agent_records("Value") == [(1, 10), (2, 20)]
+
+    frame = collector.get_model_vars_dataframe()
+    assert list(frame.index) == [0, 1, 2, 3, 4]
+    assert list(frame["Half"]) == [0.5, 1, 1.5, 2, 2.5]
+
+
+def test_collector_streams_chunks(tmp_path):
+    counter, reporters = make_counter()
+    collector = ColumnarDataCollector(reporters, output_dir=str(tmp_path), chunk_steps=4)
+    collect_counts(collector, counter, 10)
+
+    # Only the steps since the last full chunk are held in memory.
+    assert (collector.steps, collector.size) == (10, 2)
+    assert len(list(tmp_path.iterdir())) == 2
+    assert collector.latest("Count") == 10
+    assert list(collector.series("Count")) == list(range(1, 11))
+
+    collector.flush()
+    assert collector.size == 0
+    chunks = load_chunks(str(tmp_path))
+    assert list(chunks["Step"]) == list(range(10))
+    assert list(chunks["Half"]) == [n / 2 for n in range(1, 11)]
+    assert list(collector.get_model_vars_dataframe()["Count"]) == list(range(1, 11))
+
+
+def test_reporters_are_evaluated_at_their_intervals():
+    counter, reporters = make_counter()
+    calls = []
+    reporters["Called"] = lambda c: calls.append(c.count) or len(calls)
+    collector = ColumnarDataCollector(
+        reporters, object_reporters={"Count Object": lambda c: c.count},
+        agent_reporters={"Value": lambda a: a.value},
+        intervals={"Half": 2, "Called": ColumnarDataCollector.at_end, "Count Object": 3,
+                   "Value": ColumnarDataCollector.at_end}
+    )
+    collect_counts(collector, counter, 5)
+
+    assert list(collector.series("Count")) == [1, 2, 3, 4, 5]
+    assert np.array_equal(collector.series("Half"), [0.5, np.nan, 1.5, np.nan, 2.5], equal_nan=True)
+    assert calls == [] and np.isnan(collector.series("Called")).all()
+    assert collector.latest("Count Object") == 4
+    assert collector.agent_records("Value") == []
+
+    collector.final_step = 5
+    collect_counts(collector, counter, 1)
+    assert calls == [6]
+    assert collector.latest_values() == {"Count": 6, "Half": 3, "Called": 1}
+    assert list(collector.series("Half")[-1:]) == [3] and list(collector.series("Called")[-1:]) == [1]
+    assert collector.latest("Count Object") == 6
+    assert collector.agent_records("Value") == [(1, 10), (2, 20)]
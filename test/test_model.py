@@ -1,6 +1,12 @@
+import random
 from decimal import Decimal as Dec
 
-from core import model
+import numpy as np
+
+import agents as ag
+from core import model, orderbook, settingsloader, stats
+from test.test_orderbook import make_model_from_defaults, add_funded_players
+from managers.havvenmanager import HavvenManager as hm
 
 
 def test_fiat_value():
@@ -69,3 +75,514 @@ def test_fee_distribution_period():
     assert(prenomins <= postdistrib)
     assert(havven_model.manager.nomins == Dec(0))
 
+
+
+def test_fee_distribution_follows_collateralisation_targets():
+    for columnar_agent_state in [False, True]:
+        for float_fee_distribution in [False, True]:
+            havven_model = make_model_from_defaults(columnar_agent_state)
+            manager = havven_model.manager
+            fee_manager = havven_model.fee_manager
+            fee_manager.float_fee_distribution = float_fee_distribution
+            copt, cmax = Dec('0.2'), Dec('0.4')
+            under, between, over, _ = add_funded_players(havven_model, 4)
+            under.issued_nomins = Dec(1000)
+            between.issued_nomins = Dec(3000)
+            over.issued_nomins = Dec(5000)
+            manager.nomins = Dec(1000)
+            players = havven_model.schedule.agents
+            before = [p.nomins for p in players]
+
+            fee_mult = {under: under.collateralisation / copt,
+                        between: (cmax - between.collateralisation) / (cmax - copt)}
+            assert under.collateralisation <= copt < between.collateralisation <= cmax < over.collateralisation
+            abase = sum(p.havvens * fee_mult.get(p, 0) for p in players)
+
+            fee_manager.distribute_fees_using_collateralisation_targets(players, copt, cmax)
+
+            credits = [p.nomins - b for p, b in zip(players, before)]
+            expected = [(p.havvens * fee_mult.get(p, 0) / abase * Dec(1000)) * Dec('0.995') for p in players]
+            if float_fee_distribution:
+                # Payouts are computed in floats and rounded to the currency precision.
+                assert all(abs(c - e) <= e * Dec('1E-12') + Dec('1E-8') for c, e in zip(credits, expected))
+                assert all(c == hm.round_decimal(c) for c in credits)
+                assert abs(manager.nomins - Dec(5)) <= Dec('1E-7')
+            else:
+                assert credits == expected
+                assert manager.nomins == Dec(5)
+            # Either way, the pool and the fees distributed reconcile exactly with the credits.
+            assert fee_manager.fees_distributed == fee_manager.last_fees_collected == sum(credits)
+            assert manager.nomins == Dec(1000) - sum(credits)
+
+            # Once every agent is over cmax, nothing is distributed.
+            under.issued_nomins = between.issued_nomins = Dec(5000)
+            fee_manager.distribute_fees_using_collateralisation_targets(players, copt, cmax)
+            assert fee_manager.fees_distributed == sum(credits)
+            assert manager.nomins == Dec(1000) - sum(credits)
+
+
+def distribute_fees_one_agent_at_a_time(havven_model, copt, cmax):
+    """Distribute fees using collateralisation targets, as they were originally, paying each agent in turn."""
+    manager = havven_model.manager
+    fee_manager = havven_model.fee_manager
+    agents = havven_model.schedule.agents
+    pre_nomins = manager.nomins
+
+    def fee_mult(ci):
+        if ci <= copt:
+            return ci / copt
+        elif copt < ci <= cmax:
+            return (cmax - ci) / (cmax - copt)
+        return 0
+
+    abase = 0
+    for agent in agents:
+        abase += agent.havvens * fee_mult(agent.collateralisation)
+
+    pre_distribute = fee_manager.fees_distributed
+    for agent in agents:
+        qty = (agent.havvens * fee_mult(agent.collateralisation) / abase * pre_nomins) * Dec('0.995')
+        agent.nomins += qty
+        manager.nomins -= qty
+        fee_manager.fees_distributed += qty
+    fee_manager.last_fees_collected = fee_manager.fees_distributed - pre_distribute
+
+
+def test_exact_fee_distribution_matches_paying_one_agent_at_a_time():
+    copt, cmax = Dec('0.2'), Dec('0.4')
+    # The larger pool is beyond what a float can count in units of the currency precision.
+    for pool in [Dec('1234.56789'), Dec('123456789012.3456789')]:
+        results = []
+        for distribute in [None, distribute_fees_one_agent_at_a_time]:
+            havven_model = make_model_from_defaults()
+            rng = random.Random(3)
+            for player in add_funded_players(havven_model, 40):
+                player.havvens = Dec(rng.randint(1, 10 ** 6)) / Dec(100)
+                player.issued_nomins = Dec(rng.randint(0, 10 ** 5)) / Dec(100)
+            havven_model.manager.nomins = pool
+            if distribute is None:
+                havven_model.fee_manager.distribute_fees_using_collateralisation_targets(
+                    havven_model.schedule.agents, copt, cmax)
+            else:
+                distribute(havven_model, copt, cmax)
+            results.append(([p.nomins for p in havven_model.schedule.agents], havven_model.manager.nomins,
+                            havven_model.fee_manager.fees_distributed, havven_model.fee_manager.last_fees_collected))
+        assert results[0] == results[1]
+        assert any(nomins > 0 for nomins in results[0][0])
+
+
+def test_activation_order_is_seeded_and_matches_mesa():
+    havven_model = make_model_from_defaults()
+    players = add_funded_players(havven_model, 6)
+    schedule = havven_model.schedule
+
+    havven_model.reset_randomizer(7)
+    order = [agent.unique_id for agent in schedule.agent_buffer(shuffled=True)]
+    expected = list(schedule._agents.keys())
+    random.Random(7).shuffle(expected)
+    assert order == expected
+    assert sorted(order) == sorted(p.unique_id for p in players)
+
+
+def record_activations(players):
+    """Replace each player's step with one recording its activations, returning the record."""
+    activated = []
+    for player in players:
+        player.step = lambda player=player: activated.append(player)
+    return activated
+
+
+def test_sleeping_agents_are_skipped_until_they_wake():
+    havven_model = make_model_from_defaults()
+    alice, bob, charlie = add_funded_players(havven_model, 3)
+    schedule = havven_model.schedule
+    activated = record_activations([alice, bob, charlie])
+
+    schedule.sleep(alice, 2)
+    schedule.sleep(bob, 5)
+    for _ in range(2):
+        schedule.step()
+        assert activated == [charlie]
+        activated.clear()
+    assert schedule.is_asleep(alice)
+
+    schedule.step()
+    assert set(activated) == {alice, charlie}
+    activated.clear()
+
+    schedule.wake(bob)
+    schedule.sleep(charlie, 1)
+    schedule.remove(alice)
+    schedule.step()
+    assert activated == [bob]
+    assert not schedule.is_asleep(alice)
+
+
+def test_agents_activate_in_batches_by_type():
+    havven_model = make_model_from_defaults()
+    players = add_funded_players(havven_model, 4)
+    for unique_id in range(4):
+        randomizer = ag.Randomizer(2000 + unique_id, havven_model)
+        havven_model.schedule.add(randomizer)
+        players.append(randomizer)
+    schedule = havven_model.schedule
+    schedule.batch_agent_types = True
+
+    for seed in range(5):
+        havven_model.reset_randomizer(seed)
+        types = [type(agent) for agent in schedule.agent_buffer(shuffled=True)]
+        assert len(types) == 8
+        assert types[:4] == [types[0]] * 4 and types[4:] == [types[4]] * 4 and types[0] != types[4]
+
+
+def test_idle_agents_sleep_until_woken():
+    havven_model = make_model_from_defaults()
+    schedule = havven_model.schedule
+    schedule.skip_idle_agents = True
+    alice, = add_funded_players(havven_model, 1)
+    controller = havven_model.agent_manager.add_issuance_controller()
+    controller.issuance_orders = []
+    controller.burn_orders = []
+
+    schedule.step()
+    assert schedule.is_asleep(controller) and not schedule.is_asleep(alice)
+    controller.place_burn_order(Dec(1), alice)
+    assert not schedule.is_asleep(controller)
+    schedule.step()
+    assert controller.burn_orders[0]['trade'] is not None
+    assert not schedule.is_asleep(controller)
+
+
+def test_sleeping_agents_catch_up_on_their_wages():
+    havven_model = make_model_from_defaults()
+    schedule = havven_model.schedule
+    alice, bob = add_funded_players(havven_model, 2)
+    alice.wage_parameter = bob.wage_parameter = Dec(3)
+    record_activations([alice, bob])
+
+    schedule.sleep(alice, 4)
+    schedule.step()
+    schedule.sleep(bob, 10)
+    schedule.step()
+    schedule.wake(bob)
+    for _ in range(3):
+        schedule.step()
+    assert not schedule.is_asleep(alice) and not schedule.is_asleep(bob)
+    # Steps are replaced, so wages are only paid for the steps slept through.
+    assert alice.fiat == Dec(10000) + 4 * Dec(3)
+    assert bob.fiat == Dec(10000) + Dec(3)
+
+
+def test_merchants_sleep_until_they_restock():
+    havven_model = make_model_from_defaults()
+    schedule = havven_model.schedule
+    schedule.skip_idle_agents = True
+    merchant = ag.Merchant(3000, havven_model)
+    havven_model.schedule.add(merchant)
+    merchant.setup(Dec(100), Dec(10), Dec(0))
+    merchant.restock_tick_rate = 5
+
+    activated = []
+    step = merchant.step
+    merchant.step = lambda: (activated.append(schedule.steps), step())
+    for _ in range(12):
+        schedule.step()
+    assert activated == [0, 5, 11]
+    assert merchant.last_restock == 0
+    # The merchant is paid a wage for every step, and its stock is already full.
+    assert merchant.fiat == Dec(100) + 12 * Dec(10)
+
+
+def test_market_makers_sleep_between_bets():
+    havven_model = make_model_from_defaults()
+    maker = ag.MarketMaker(3000, havven_model)
+    havven_model.schedule.add(maker)
+    maker.trade_market = maker.nomin_fiat_market
+    maker.setup(Dec(100), Dec(10), Dec(0))
+    maker.last_bet_end = 4
+    assert maker.idle_steps() == maker.minimal_wait - 4
+    maker.catch_up(maker.idle_steps())
+    assert maker.last_bet_end == maker.minimal_wait and maker.idle_steps() == 0
+
+    maker.last_bet_end = 4
+    maker.trade_market = maker.havven_nomin_market
+    assert maker.idle_steps() == 0
+
+
+def test_market_makers_match_their_bets_in_one_pass():
+    havven_model = make_model_from_defaults()
+    maker = ag.MarketMaker(3000, havven_model)
+    havven_model.schedule.add(maker)
+    maker.trade_market = maker.havven_fiat_market
+    maker.setup(Dec(100), Dec(0), Dec(0))
+    maker.last_bet_end = maker.minimal_wait
+    book = maker.trade_market
+    book.price_data.append(Dec('1.1'))
+
+    passes = []
+    match = book._match
+    book._match = lambda: (passes.append(len(book.bids) + len(book.asks)), match())
+    maker.step()
+    assert maker.current_bet is not None
+    # The bid and ask are both in the book before they are matched.
+    assert passes == [2]
+
+
+def scan_active_havvens(havven_model):
+    """Total the havvens of scheduled agents with escrowed havvens, by checking every agent."""
+    active = sum(i.havvens for i in havven_model.schedule.agents if i.escrowed_havvens > 0)
+    return active if active > 0 else havven_model.manager.havven_supply
+
+
+def test_active_havvens_follow_agents():
+    havven_model = make_model_from_defaults()
+    manager = havven_model.manager
+    market_manager = havven_model.market_manager
+    alice, bob, charlie = add_funded_players(havven_model, 3)
+    assert havven_model.mint.cmax > 0
+    assert manager.active_havvens == scan_active_havvens(havven_model) == manager.havven_supply
+
+    alice.issued_nomins = Dec(100)
+    bob.issued_nomins = Dec(50)
+    assert manager.active_havvens == scan_active_havvens(havven_model) == Dec(20000)
+
+    # Transfers and trades move havvens between active and inactive agents.
+    market_manager.transfer_havvens(alice, charlie, Dec(1234), Dec(1))
+    bob.place_havven_fiat_ask(Dec(10), Dec(1))
+    charlie.place_havven_fiat_bid(Dec(10), Dec(1))
+    assert manager.active_havvens == scan_active_havvens(havven_model)
+
+    # Burning every nomin makes an agent inactive, and removing it from the schedule discounts it.
+    bob.issued_nomins -= Dec(50)
+    assert manager.active_havvens == scan_active_havvens(havven_model) == alice.havvens
+    charlie.issued_nomins = Dec(1)
+    havven_model.schedule.remove(alice)
+    assert manager.active_havvens == scan_active_havvens(havven_model) == charlie.havvens
+
+    # Issuance too small to leave any havvens in escrow doesn't count.
+    bob.issued_nomins = Dec('0.00000001')
+    havven_model.mint.cmax = Dec(1000)
+    assert bob.escrowed_havvens == 0
+    assert manager.active_havvens == scan_active_havvens(havven_model) == charlie.havvens
+
+
+def fresh_escrowed_havvens(havven_model, agent):
+    """Compute an agent's escrowed havvens without any caching."""
+    mint = havven_model.mint
+    intrinsic_value = max(Dec(0.1), havven_model.fee_manager.last_fees_collected /
+                          (havven_model.manager.havven_supply * Dec('0.0001')))
+    return havven_model.manager.round_decimal(
+        agent.issued_nomins * havven_model.market_manager.nomin_fiat_market.price / intrinsic_value / mint.cmax
+    )
+
+
+def test_cached_escrow_follows_its_inputs():
+    havven_model = make_model_from_defaults()
+    alice, bob = add_funded_players(havven_model, 2)
+    alice.nomins = Dec(100)
+    alice.issued_nomins = Dec(50)
+    book = havven_model.market_manager.nomin_fiat_market
+
+    def check():
+        assert alice.escrowed_havvens == fresh_escrowed_havvens(havven_model, alice)
+        assert havven_model.mint.escrowed_havvens(alice) is alice.escrowed_havvens
+
+    check()
+    version = book.version
+    alice.place_nomin_fiat_ask(Dec(10), Dec('1.2'))
+    assert book.version == version
+    bob.place_nomin_fiat_bid(Dec(10), Dec('1.2'))
+    assert book.version > version
+    check()
+
+    alice.issued_nomins += Dec(5)
+    check()
+    havven_model.mint.cmax = havven_model.mint.cmax * 2
+    check()
+    havven_model.fee_manager.last_fees_collected = Dec(5000)
+    check()
+
+
+def test_cached_conversions_follow_book_prices():
+    havven_model = make_model_from_defaults()
+    alice, bob = add_funded_players(havven_model, 2)
+    market_manager = havven_model.market_manager
+    book = market_manager.havven_fiat_market
+    quantity = Dec('12.5')
+
+    def check():
+        price = book.price
+        assert market_manager.havvens_to_fiat(quantity) == hm.round_decimal(quantity * price)
+        assert market_manager.fiat_to_havvens(quantity) == hm.round_decimal(quantity / price)
+
+    check()
+    assert market_manager.havvens_to_fiat(quantity) is market_manager.havvens_to_fiat(quantity)
+    alice.place_havven_fiat_ask(Dec(10), Dec('1.3'))
+    bob.place_havven_fiat_bid(Dec(10), Dec('1.3'))
+    assert book.price == Dec('1.3')
+    check()
+
+
+def run_model(columnar_agent_state=False, steps=20, seed=None, columnar_trade_log=False, havven_settings=None,
+              **collector_settings):
+    """Run a model without bankers from the default settings for the given steps, the last being final."""
+    settings = settingsloader.get_defaults()
+    settings['Agents']['columnar_agent_state'] = columnar_agent_state
+    settings['Havven']['columnar_trade_log'] = columnar_trade_log
+    settings['Havven'].update(havven_settings or {})
+    model_settings = settings['Model']
+    model_settings['seed'] = seed
+    model_settings['collector_chunk_steps'] = 8
+    model_settings.update(collector_settings)
+    model_settings['agent_fractions'] = {
+        name: fraction for name, fraction in settings['Agents']['AgentFractions'].items() if name != "Banker"
+    }
+    havven_model = model.HavvenModel(
+        model_settings,
+        settings['Fees'],
+        settings['Agents'],
+        settings['Havven'],
+        settings['Mint']
+    )
+    havven_model.datacollector.final_step = steps
+    for _ in range(steps):
+        havven_model.step()
+    return havven_model
+
+
+def test_agent_store_matches_agent_attributes():
+    assert run_model(False, steps=0).agent_store is None
+    havven_model = run_model(True)
+    store = havven_model.agent_store
+    players = havven_model.schedule.agents
+    # The havven foundation holds balances without being scheduled.
+    assert len(store) == len(players) + 1
+
+    for player in players:
+        assert store.players[player.store_row] is player
+        for column in store.columns:
+            assert float(getattr(player, column)) == store.column(column)[player.store_row]
+
+    # Values computed over the columns are floats, within rounding of those computed player by player.
+    assert np.allclose(stats.wealths(havven_model, players), [float(a.wealth()) for a in players])
+    assert np.allclose(stats.profit_fractions(havven_model, players), [float(a.profit_fraction()) for a in players],
+                       atol=1e-8)
+    reporters = [stats.gini, stats.max_wealth, stats.min_wealth, stats.mean_profit_fraction]
+    columnar = [reporter(havven_model) for reporter in reporters]
+    havven_model.agent_store = None
+    assert np.allclose([reporter(havven_model) for reporter in reporters], columnar, atol=1e-8)
+
+
+def test_runs_from_the_same_seed_are_identical():
+    def trajectory(havven_model):
+        return ([(a.unique_id, a.fiat, a.havvens, a.nomins, a.issued_nomins) for a in havven_model.schedule.agents],
+                {name: list(havven_model.datacollector.series(name))
+                 for name in havven_model.datacollector.model_reporters})
+
+    first = run_model(seed=5)
+    # Draws from the global generator in between don't disturb a seeded model.
+    random.random()
+    assert trajectory(run_model(seed=5)) == trajectory(first)
+    assert trajectory(run_model(seed=6)) != trajectory(first)
+
+
+def walked_price_for_quantity(book, side, quantity):
+    """The price to fill a quantity, found by walking the levels of a side after reading the book's price."""
+    price = book.price
+    cumulative = Dec(0)
+    buckets = book.ask_price_buckets if side is book.asks else book.bid_price_buckets
+    for price, level_quantity in buckets.items():
+        cumulative += level_quantity
+        if cumulative >= quantity:
+            break
+    return price
+
+
+def test_fill_prices_leave_rolling_prices_as_walking_the_book_does(monkeypatch):
+    settings = {'rolling_avg_time_window': 20}
+    fill_curve = step_states(run_model(seed=8, havven_settings=settings), 20)
+    monkeypatch.setattr(orderbook.OrderBook, "_price_for_quantity", walked_price_for_quantity)
+    assert step_states(run_model(seed=8, havven_settings=settings), 20) == fill_curve
+
+
+def test_streamed_statistics_match_those_kept_in_memory(tmp_path):
+    kept = run_model(seed=7).datacollector
+    streamed = run_model(seed=7, collector_output_dir=str(tmp_path)).datacollector
+    assert streamed.size < streamed.steps == kept.steps
+    for name in kept.model_reporters:
+        assert list(streamed.series(name)) == list(kept.series(name))
+    assert streamed.get_model_vars_dataframe().equals(kept.get_model_vars_dataframe())
+
+
+def market_state(havven_model):
+    """The balances and live orders of every agent, and the prices of every market."""
+    markets = havven_model.market_manager
+    return (
+        [(a.unique_id, a.fiat, a.havvens, a.nomins, a.issued_nomins,
+          [(o.book.name, o.price, o.quantity) for o in a.orders.values()])
+         for a in havven_model.schedule.agents],
+        [(m.price, list(m.bid_price_buckets.items()), list(m.ask_price_buckets.items()))
+         for m in (markets.havven_nomin_market, markets.havven_fiat_market, markets.nomin_fiat_market)],
+        (havven_model.mint.copt, havven_model.mint.cmax, havven_model.fee_manager.fees_distributed)
+    )
+
+
+def step_states(havven_model, steps):
+    states = []
+    for _ in range(steps):
+        havven_model.step()
+        states.append(market_state(havven_model))
+    return states
+
+
+def test_restored_snapshots_carry_on_identically():
+    for columnar_agent_state in [False, True]:
+        havven_model = run_model(columnar_agent_state, seed=3)
+        snapshot = havven_model.snapshot()
+        restored = model.HavvenModel.restore(snapshot)
+        assert market_state(restored) == market_state(havven_model)
+        # Trade records are left out of the snapshot.
+        assert not any(a.trades for a in restored.schedule.agents)
+        assert step_states(restored, 10) == step_states(havven_model, 10)
+
+
+def trade_records(havven_model):
+    return [[(t.completion_time, t.price, t.quantity, t.buyer_id, t.seller_id) for t in a.trade_records()]
+            for a in havven_model.schedule.agents]
+
+
+def test_snapshots_can_keep_trade_history():
+    for columnar_trade_log in [False, True]:
+        havven_model = run_model(seed=5, columnar_trade_log=columnar_trade_log)
+        restored = model.HavvenModel.restore(havven_model.snapshot(history=True))
+        assert any(trade_records(havven_model))
+        assert trade_records(restored) == trade_records(havven_model)
+        assert not restored.snapshot_history and not havven_model.snapshot_history
+        assert step_states(restored, 5) == step_states(havven_model, 5)
+
+
+def test_forks_are_independent():
+    havven_model = run_model(seed=4)
+    same, other = havven_model.fork(), havven_model.fork(seed=40)
+    assert same.schedule.agents[0] is not havven_model.schedule.agents[0]
+
+    expected = step_states(havven_model, 10)
+    assert step_states(same, 10) == expected
+    assert step_states(other, 10) != expected
+
+
+def test_statistics_collected_at_intervals_end_with_the_same_values():
+    every_step = run_model(seed=8)
+    only_at_end = run_model(seed=8, collector_interval=0, collector_intervals={"Gini": 3})
+    assert market_state(only_at_end) == market_state(every_step)
+
+    collector = only_at_end.datacollector
+    gini = collector.series("Gini")
+    assert not np.isnan(gini[::3]).any() and np.isnan(gini[1::3]).all()
+    # The max nomin issuers read the supplies every step.
+    assert not np.isnan(collector.series("Havven Supply")).any()
+    assert np.isnan(collector.series("Max Wealth")[:-1]).all()
+
+    # Every statistic is collected in the final step.
+    assert collector.latest_values() == every_step.datacollector.latest_values()
+    assert collector.latest("NominFiatOrderBook") is only_at_end.market_manager.nomin_fiat_market
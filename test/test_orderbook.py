@@ -1,9 +1,11 @@
+import random
 from decimal import Decimal as Dec
 
 import pytest
 
 import agents as ag
 from core import settingsloader, model
+from core import orderbook as ob
 from managers.havvenmanager import HavvenManager as hm
 
 UID = 0
@@ -262,7 +264,7 @@ def nomin_fiat_ask_placement_check(initial, quantity, price, success):
     ask = place_nomin_fiat_ask(havven_model, alice, quantity, price, success)
     if success:
         assert ask is not None
-        assert alice.orders[0] == ask
+        assert list(alice.orders.values())[0] == ask
         # test to check matching to nothing raises an exception
         with pytest.raises(Exception):
             ask.book.do_single_match()
@@ -336,7 +338,7 @@ def nomin_fiat_bid_placement_check(initial, quantity, price, success):
     bid = place_nomin_fiat_bid(havven_model, alice, quantity, price, success)
     if success:
         assert bid is not None
-        assert alice.orders[0] == bid
+        assert list(alice.orders.values())[0] == bid
         # test to check matching to nothing raises an exception
         with pytest.raises(Exception):
             bid.book.do_single_match()
@@ -502,7 +504,7 @@ def nomin_fiat_ask_match_check(player_info):
         player.fiat = data['initial']
         bid = place_nomin_fiat_bid(havven_model, player, data['quant'], data['price'], True)
         assert bid is not None
-        assert player.orders[-1] == bid
+        assert list(player.orders.values())[-1] == bid
         with pytest.raises(Exception):
             bid.book.do_single_match()
         data['bid'] = bid
@@ -513,7 +515,7 @@ def nomin_fiat_ask_match_check(player_info):
 
     ask = place_nomin_fiat_ask(havven_model, alice, a_quant, a_price, True)
     assert ask is not None
-    assert alice.orders[-1] == ask
+    assert list(alice.orders.values())[-1] == ask
 
     a_last_nom = a_initial
     a_last_fiat = Dec(0)
@@ -647,3 +649,726 @@ TODO: testing continuous buying/selling for decimal imprecision
   - one test could be quantity and price are both 1/7, for 100 bids, matched with an ask of
       70, at the same price etc.
 """
+
+
+"""
+===========================================
+= Testing the fixed point order book
+===========================================
+
+The fixed point book keeps its prices and quantities as integers internally,
+but should behave identically to the Decimal book.
+The same sequence of random orders is run through both, and the results compared.
+"""
+
+
+@pytest.mark.parametrize('value', [
+    Dec(0), Dec(1), Dec('1.1'), Dec('-3.5'), Dec('0.00000001'),
+    Dec('123456789.12345678'), Dec('-0.99999999'), Dec('92233720368.54775807')
+])
+def test_fixed_point_round_trip(value):
+    units = hm.to_fixed(value)
+    assert isinstance(units, int)
+    assert units == value * hm.fixed_point_scale
+    assert hm.from_fixed(units) == value
+
+
+def test_to_fixed_rounds_to_currency_precision():
+    assert hm.to_fixed(Dec('0.0000000051')) == 1
+    assert hm.to_fixed(Dec('0.0000000049')) == 0
+    assert hm.to_fixed(Dec('1.123456785')) == hm.to_fixed(hm.round_decimal(Dec('1.123456785')))
+    assert hm.to_fixed(2) == 2 * hm.fixed_point_scale
+    assert hm.from_fixed(hm.to_fixed(Dec('1.5')) * hm.to_fixed(Dec('2.25')), scale=2) == Dec('3.375')
+
+
+def make_model_from_defaults(columnar_agent_state=False, **havven_settings):
+    """
+    Create a model without agents from the default settings,
+    overriding any of the Havven settings given.
+    """
+    settings = settingsloader.get_defaults()
+    settings['Havven'].update(havven_settings)
+    settings['Agents']['columnar_agent_state'] = columnar_agent_state
+    model_settings = settings['Model']
+    model_settings['agent_fractions'] = settings['Agents']['AgentFractions']
+    model_settings['num_agents'] = 0
+    settings['Agents']['agent_minimum'] = 0
+    havven_model = model.HavvenModel(
+        model_settings,
+        settings['Fees'],
+        settings['Agents'],
+        settings['Havven'],
+        settings['Mint']
+    )
+    for item in havven_model.schedule.agents:
+        havven_model.schedule.remove(item)
+    havven_model.agent_manager.agents = {"others": []}
+    return havven_model
+
+
+def add_funded_players(havven_model, count):
+    """Add players with plenty of fiat and havvens, numbered after any existing agents."""
+    players = []
+    first = 1000 + len(havven_model.schedule.agents)
+    for i in range(count):
+        player = ag.MarketPlayer(first + i, havven_model, fiat=Dec(10000), havvens=Dec(10000))
+        havven_model.agent_manager.add(player)
+        players.append(player)
+    return players
+
+
+def run_random_orders(havven_model, seed, actions=400):
+    """
+    Place, cancel, and market buy/sell random orders on the havven/fiat market,
+    and return a summary of the final state of the book and its players.
+    """
+    rng = random.Random(seed)
+    players = add_funded_players(havven_model, 5)
+    book = havven_model.market_manager.havven_fiat_market
+    for i in range(actions):
+        player = rng.choice(players)
+        action = rng.random()
+        price = Dec(rng.randint(90, 110)) / Dec(100)
+        quantity = Dec(rng.randint(1, 50000)) / Dec(1000)
+        if action < 0.4:
+            player.place_havven_fiat_bid(quantity, price)
+        elif action < 0.8:
+            player.place_havven_fiat_ask(quantity, price)
+        elif action < 0.9:
+            if player.orders:
+                rng.choice(list(player.orders.values())).cancel()
+        elif action < 0.95:
+            book.buy(quantity, player)
+        else:
+            book.sell(quantity, player)
+
+        if i % 20 == 19:
+            book.step_history()
+            havven_model.manager.time += 1
+
+    return {
+        "bids": list(book.bid_price_buckets.items()),
+        "asks": list(book.ask_price_buckets.items()),
+        "orders": [(o.price, o.quantity, o.fee, o.time) for o in list(book.bids) + list(book.asks)],
+        "trades": [(t.buyer_id, t.seller_id, t.price, t.quantity, t.bid_fee, t.ask_fee, t.completion_time)
+                   for t in map(book.trade, book.history)],
+        "players": [(p.fiat, p.havvens, p.unavailable_fiat, p.unavailable_havvens) for p in players],
+        "candles": book.candle_data,
+        "volume": book.volume_data,
+        "price": book.price,
+    }
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_fixed_point_book_matches_decimal_book(seed):
+    decimal_model = make_model_from_defaults()
+    fixed_model = make_model_from_defaults(fixed_point_orderbook=True)
+    assert type(decimal_model.market_manager.havven_fiat_market) is ob.OrderBook
+    assert type(fixed_model.market_manager.havven_fiat_market) is ob.FixedPointOrderBook
+
+    decimal_result = run_random_orders(decimal_model, seed)
+    fixed_result = run_random_orders(fixed_model, seed)
+    assert len(decimal_result["trades"]) > 0
+    assert decimal_result == fixed_result
+
+
+def run_random_fee_orders(havven_model, seed, actions=600):
+    """
+    Place, update, cancel, and market buy/sell random orders with unrounded quantities
+    on the havven/nomin market, where both sides pay fees, and return a summary
+    of the book's state, its trades, and everything its players hold.
+    """
+    rng = random.Random(seed)
+    players = []
+    for i in range(6):
+        player = ag.MarketPlayer(2000 + i, havven_model, fiat=Dec(1000),
+                                 havvens=Dec(rng.randint(1000, 5000)) / Dec(3), nomins=Dec(5000) / Dec(7))
+        havven_model.agent_manager.add(player)
+        players.append(player)
+    book = havven_model.market_manager.havven_nomin_market
+    for i in range(actions):
+        player = rng.choice(players)
+        action = rng.random()
+        price = Dec(rng.randint(90000000, 110000000)) / Dec(10 ** 8)
+        quantity = Dec(rng.randint(1, 10 ** 12)) / Dec(7 * 10 ** 9)
+        if action < 0.3:
+            player.place_havven_nomin_bid(quantity, price)
+        elif action < 0.6:
+            player.place_havven_nomin_ask(quantity, price)
+        elif action < 0.7:
+            if player.orders:
+                order = rng.choice(list(player.orders.values()))
+                order.update_price(order.price + Dec(rng.randint(-3, 3)) / Dec(100))
+        elif action < 0.8:
+            if player.orders:
+                order = rng.choice(list(player.orders.values()))
+                order.update_quantity(order.quantity * Dec(rng.randint(1, 15)) / Dec(11))
+        elif action < 0.85:
+            if player.orders:
+                rng.choice(list(player.orders.values())).cancel()
+        elif action < 0.9:
+            book.submit_batch(player, [("bid", price, quantity), ("ask", price + Dec('0.05'), quantity / 3)],
+                              list(player.orders.values())[:1])
+        elif action < 0.95:
+            book.buy(quantity, player)
+        else:
+            book.sell(quantity, player)
+
+        if i % 20 == 19:
+            book.step_history()
+            havven_model.manager.time += 1
+
+    return {
+        "bids": list(book.bid_price_buckets.items()),
+        "asks": list(book.ask_price_buckets.items()),
+        "totals": (book.total_bid_quantity, book.total_bid_value, book.total_ask_quantity, book.total_ask_value),
+        "depth": (book.bid_depth(), book.ask_depth()),
+        "orders": [(o.order_id, o.price, o.quantity, o.fee, o.time) for o in list(book.bids) + list(book.asks)],
+        "trades": [(t.buyer_id, t.seller_id, t.price, t.quantity, t.bid_fee, t.ask_fee, t.completion_time)
+                   for t in map(book.trade, book.history)],
+        "players": [(p.fiat, p.havvens, p.nomins, p.unavailable_havvens, p.unavailable_nomins) for p in players],
+        "fees": (havven_model.manager.havvens, havven_model.manager.nomins),
+        "candles": book.candle_data,
+        "price": book.price,
+        "time": book.time,
+    }
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 3])
+def test_fixed_point_book_matches_decimal_book_with_fees(seed):
+    decimal_result = run_random_fee_orders(make_model_from_defaults(), seed)
+    fixed_result = run_random_fee_orders(make_model_from_defaults(fixed_point_orderbook=True), seed)
+    assert len(decimal_result["trades"]) > 0
+    assert any(trade[4] and trade[5] for trade in decimal_result["trades"])
+    assert decimal_result == fixed_result
+
+
+def test_fixed_point_orders_hold_units():
+    havven_model = make_model_from_defaults(fixed_point_orderbook=True)
+    book = havven_model.market_manager.havven_nomin_market
+    alice = add_funded_players(havven_model, 1)[0]
+    alice.nomins = Dec(100)
+
+    bid = alice.place_havven_nomin_bid(Dec(10) / Dec(3), Dec('1.23456789'))
+    assert isinstance(bid, ob.FixedPointBid) and isinstance(bid, ob.Bid)
+    assert (bid.price_units, bid.quantity_units) == (123456789, 333333333)
+    assert bid.price == Dec('1.23456789') and bid.quantity == Dec('3.33333333')
+    assert bid.fee_units == hm.to_fixed(book.buyer_fee(bid.price, bid.quantity)) > 0
+    assert alice.unavailable_nomins == bid.quantity * bid.price + bid.fee
+
+    bid.update_quantity(Dec(1))
+    assert (bid.quantity_units, bid.fee_units) == (hm.fixed_point_scale, hm.to_fixed(book.buyer_fee(bid.price, 1)))
+    assert book.bids.levels[123456789].quantity == book.bids.quantity == hm.fixed_point_scale
+    bid.cancel()
+    assert (bid.quantity_units, len(book.bids), book.bids.quantity) == (0, 0, 0)
+
+
+@pytest.mark.parametrize('a, b', [
+    (1, 1), (5, 10 ** 7), (15, 10 ** 7), (-5, 10 ** 7), (-15, 10 ** 7),
+    (123456789, 987654321), (-123456789, 987654321), (10 ** 16 + 7, 3 * 10 ** 8 - 1)
+])
+def test_fixed_product_rounds_as_decimals_do(a, b):
+    assert hm.fixed_product(a, b) == hm.to_fixed(hm.round_decimal(hm.from_fixed(a) * hm.from_fixed(b)))
+
+
+def test_fixed_point_buckets():
+    havven_model = make_model_from_defaults(fixed_point_orderbook=True)
+    book = havven_model.market_manager.havven_fiat_market
+    alice, bob = add_funded_players(havven_model, 2)
+
+    alice.place_havven_fiat_bid(Dec('1.5'), Dec('0.9'))
+    alice.place_havven_fiat_bid(Dec('2.25'), Dec('0.9'))
+    bob.place_havven_fiat_bid(Dec(3), Dec('0.95'))
+
+    assert [(level.price, level.quantity) for level in book.bids.levels.values()] == \
+        [(95000000, 300000000), (90000000, 375000000)]
+    assert list(book.bid_price_buckets) == [Dec('0.95'), Dec('0.9')]
+    assert list(book.bid_price_buckets.values()) == [Dec(3), Dec('3.75')]
+    assert Dec('0.9') in book.bid_price_buckets
+    assert Dec('0.91') not in book.bid_price_buckets
+    assert book.bid_price_buckets[Dec('0.90')] == Dec('3.75')
+    assert len(book.ask_price_buckets) == 0
+
+    assert book.price_to_sell_quantity(Dec(3)) == Dec('0.95')
+    assert book.price_to_sell_quantity(Dec('3.00000001')) == Dec('0.9')
+    assert book.price_to_sell_quantity(Dec(100)) == Dec('0.9')
+    assert book.price_to_buy_quantity(Dec(1)) == book.price
+
+
+"""
+===========================================
+= Testing price levels
+===========================================
+
+Orders are held in a queue at each price, so the book's order should
+always be by price and then by time, however orders are added, updated, or cancelled.
+"""
+
+
+@pytest.mark.parametrize('fixed_point', [False, True])
+def test_price_level_queues(fixed_point):
+    havven_model = make_model_from_defaults(fixed_point_orderbook=fixed_point)
+    book = havven_model.market_manager.havven_fiat_market
+    alice, bob, charlie = add_funded_players(havven_model, 3)
+
+    a1 = alice.place_havven_fiat_ask(Dec(1), Dec('1.2'))
+    b1 = bob.place_havven_fiat_ask(Dec(2), Dec('1.1'))
+    c1 = charlie.place_havven_fiat_ask(Dec(3), Dec('1.1'))
+    a2 = alice.place_havven_fiat_ask(Dec(4), Dec('1.1'))
+    assert list(book.asks) == [b1, c1, a2, a1]
+    assert book.asks[0] is b1 and book.asks[3] is a1 and book.asks[-1] is a1
+    assert book.lowest_ask_price() == Dec('1.1')
+    assert book.lowest_ask_quantity() == Dec(9)
+
+    # Cancelling from the middle of a queue leaves the rest in order.
+    c1.cancel()
+    assert list(book.asks) == [b1, a2, a1]
+    assert book.ask_price_buckets[Dec('1.1')] == Dec(6)
+
+    # Changing only the quantity keeps an order's place in its queue.
+    b1.update_quantity(Dec('1.5'))
+    assert list(book.asks) == [b1, a2, a1]
+    assert book.ask_price_buckets[Dec('1.1')] == Dec('5.5')
+
+    # Changing the price moves the order to the back of the queue at its new price.
+    b1.update_price(Dec('1.2'))
+    assert list(book.asks) == [a2, a1, b1]
+    assert list(book.ask_price_buckets.items()) == [(Dec('1.1'), Dec(4)), (Dec('1.2'), Dec('2.5'))]
+
+    # Emptying the best level promotes the next one.
+    a2.cancel()
+    assert book.lowest_ask_price() == Dec('1.2')
+    assert book.lowest_ask_quantity() == Dec('2.5')
+    a1.cancel()
+    b1.cancel()
+    assert len(book.asks) == 0
+    assert len(book.ask_price_buckets) == 0
+    assert book.asks.best is None
+    assert book.lowest_ask_quantity() == Dec(0)
+    with pytest.raises(IndexError):
+        book.asks[0]
+
+
+@pytest.mark.parametrize('fixed_point', [False, True])
+def test_price_levels_match_in_time_order(fixed_point):
+    havven_model = make_model_from_defaults(fixed_point_orderbook=fixed_point)
+    book = havven_model.market_manager.havven_fiat_market
+    alice, bob, charlie = add_funded_players(havven_model, 3)
+
+    first = alice.place_havven_fiat_bid(Dec(2), Dec('0.9'))
+    second = bob.place_havven_fiat_bid(Dec(2), Dec('0.9'))
+    best = alice.place_havven_fiat_bid(Dec(1), Dec('0.95'))
+    assert book.highest_bid_price() == Dec('0.95')
+
+    charlie.place_havven_fiat_ask(Dec(2), Dec('0.9'))
+    assert [(t.buyer, t.quantity, t.price) for t in book.history] == \
+        [(alice, Dec(1), Dec('0.95')), (alice, Dec(1), Dec('0.9'))]
+    assert not best.active
+    assert list(book.bids) == [first, second]
+    assert first.quantity == Dec(1)
+    assert book.highest_bid_quantity() == Dec(3)
+
+
+"""
+===========================================
+= Testing the trade window
+===========================================
+
+Rolling prices and volumes are computed from per-tick running totals,
+and should agree with a direct computation from the full trade history.
+"""
+
+
+def test_trade_window_totals():
+    window = ob.TradeWindow(2)
+    window.add(0, Dec('1.5'), Dec(2))
+    window.add(0, Dec('0.5'), Dec(1))
+    window.add(1, Dec(2), Dec('0.25'))
+    assert window.volume(1) == hm.to_fixed(Dec('0.25'))
+    assert window.volume(2) == 0
+
+    assert window.totals(2, 2) == (3, hm.to_fixed(Dec(4)), hm.to_fixed(Dec(4)) * hm.fixed_point_scale,
+                                   hm.to_fixed(Dec('3.25')))
+    assert window.totals(2, 1)[:2] == (1, hm.to_fixed(Dec(2)))
+    assert window.totals(3, 2)[:2] == (1, hm.to_fixed(Dec(2)))
+    assert window.totals(4, 2) == (0, 0, 0, 0)
+    assert len(window.ticks) == 0
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_rolling_price_matches_history(weighted):
+    havven_model = make_model_from_defaults(rolling_avg_time_window=3, use_volume_weighted_avg=weighted,
+                                            retain_trade_history=True)
+    run_random_orders(havven_model, 4)
+    book = havven_model.market_manager.havven_fiat_market
+    time = havven_model.manager.time
+
+    for window in [1, 2, 3]:
+        recent = [t for t in book.history if t.completion_time >= time - window]
+        assert len(recent) > 0
+        if weighted:
+            expected = sum(t.price * t.quantity for t in recent) / sum(t.quantity for t in recent)
+            assert book.weighted_rolling_price_average(window) == expected
+        else:
+            expected = sum(t.price for t in recent) / len(recent)
+            assert book.rolling_price_average(window) == expected
+
+    assert book.volume_data[-1] == sum(t.quantity for t in book.history if t.completion_time == time - 1)
+
+    # a tick without trades has a volume of exactly zero
+    book.step_history()
+    assert str(book.volume_data[-1]) == "0"
+
+
+def test_trade_history_retention():
+    havven_model = make_model_from_defaults()
+    book = havven_model.market_manager.havven_fiat_market
+    assert book.history.maxlen == book.recent_history_length
+
+    assert all(player.trades.maxlen == book.recent_history_length for player in havven_model.schedule.agents)
+
+    havven_model = make_model_from_defaults(retain_trade_history=True)
+    assert havven_model.market_manager.havven_fiat_market.history.maxlen is None
+    assert all(player.trades.maxlen is None for player in havven_model.schedule.agents)
+
+
+def test_traded_totals_match_history():
+    havven_model = make_model_from_defaults(retain_trade_history=True)
+    run_random_orders(havven_model, 4)
+
+    for player in havven_model.schedule.agents:
+        expected = {}
+        for trade in player.trade_records():
+            key = (trade.book, trade.buyer is player)
+            expected[key] = expected.get(key, Dec(0)) + trade.quantity
+        assert player.traded == expected
+    assert any(player.traded for player in havven_model.schedule.agents)
+
+
+"""
+===========================================
+= Testing deferred matching
+===========================================
+
+Orders placed within deferred_matching() or submit_batch() should enter the book
+without trading, and then be matched in a single pass by price and then time.
+"""
+
+
+@pytest.mark.parametrize('fixed_point', [False, True])
+def test_deferred_matching(fixed_point):
+    havven_model = make_model_from_defaults(fixed_point_orderbook=fixed_point)
+    book = havven_model.market_manager.havven_fiat_market
+    alice, bob, charlie = add_funded_players(havven_model, 3)
+    ask = alice.place_havven_fiat_ask(Dec(1), Dec('0.9'))
+
+    with book.deferred_matching():
+        low = bob.place_havven_fiat_bid(Dec(1), Dec('1.0'))
+        with book.deferred_matching():
+            high = charlie.place_havven_fiat_bid(Dec(1), Dec('1.1'))
+        assert len(book.history) == 0
+        assert list(book.bids) == [high, low]
+
+    # The higher bid takes priority, even though it was placed later,
+    # and trades at the price of the earlier ask.
+    assert len(book.history) == 1
+    assert book.history[0].buyer is charlie
+    assert book.history[0].price == Dec('0.9')
+    assert not ask.active and not high.active
+    assert list(book.bids) == [low]
+
+
+def test_deferred_market_orders_match_immediately():
+    havven_model = make_model_from_defaults()
+    book = havven_model.market_manager.havven_fiat_market
+    alice, bob = add_funded_players(havven_model, 2)
+    alice.place_havven_fiat_ask(Dec(2), Dec('1.2'))
+
+    with book.deferred_matching():
+        bid = book.buy(Dec(1), bob)
+        assert len(book.history) == 1
+        assert not bid.active
+    assert bob.havvens == Dec(10000) + book.history[0].quantity
+
+
+def test_submit_batch():
+    havven_model = make_model_from_defaults()
+    book = havven_model.market_manager.havven_fiat_market
+    alice, bob = add_funded_players(havven_model, 2)
+    old_bid = alice.place_havven_fiat_bid(Dec(1), Dec('0.8'))
+    bob.place_havven_fiat_ask(Dec('0.5'), Dec('0.95'))
+
+    bid, ask = book.submit_batch(alice, [("bid", Dec('0.96'), Dec(2)), ("ask", Dec('1.05'), Dec(2))],
+                                 cancels=[old_bid])
+    assert not old_bid.active
+    assert bid.active and bid.quantity == Dec('1.5')
+    assert ask.active and book.lowest_ask_price() == Dec('1.05')
+    assert len(book.history) == 1
+    assert list(alice.orders.values()) == [bid, ask]
+
+    with pytest.raises(Exception):
+        book.submit_batch(alice, [("buy", Dec(1), Dec(1))])
+
+
+"""
+===========================================
+= Testing the fill curve
+===========================================
+
+Prices to fill a quantity, and quantities available at a price, come from a
+cumulative index over the price levels, and should agree with walking the book.
+"""
+
+
+def walk_price_to_fill(buckets, quantity, default):
+    cumulative = Dec(0)
+    price = default
+    for price, level_quantity in buckets.items():
+        cumulative += level_quantity
+        if cumulative >= quantity:
+            break
+    return price
+
+
+@pytest.mark.parametrize('fixed_point', [False, True])
+def test_fill_curve_matches_walk(fixed_point):
+    havven_model = make_model_from_defaults(fixed_point_orderbook=fixed_point)
+    run_random_orders(havven_model, 6)
+    book = havven_model.market_manager.havven_fiat_market
+    assert len(book.bid_price_buckets) > 1 and len(book.ask_price_buckets) > 1
+
+    for quantity in [Dec(0), Dec('0.000000001'), Dec(1), Dec('12.5'), Dec(50), Dec(10 ** 6)]:
+        assert book.price_to_buy_quantity(quantity) == \
+            walk_price_to_fill(book.ask_price_buckets, quantity, book.price)
+        assert book.price_to_sell_quantity(quantity) == \
+            walk_price_to_fill(book.bid_price_buckets, quantity, book.price)
+
+    for price in [Dec('0.5'), Dec('0.95'), Dec('0.955'), Dec('1'), Dec('1.05'), Dec('1.000000001'), Dec(2)]:
+        assert book.asks_not_higher_quantity(price) == sum(a.quantity for a in book.asks_not_higher(price))
+        assert book.bids_not_lower_quantity(price) == sum(b.quantity for b in book.bids_not_lower(price))
+
+
+def test_fill_curve_invalidation():
+    havven_model = make_model_from_defaults()
+    book = havven_model.market_manager.havven_fiat_market
+    alice, = add_funded_players(havven_model, 1)
+    assert book.price_to_buy_quantity(Dec(1)) == book.price
+    assert book.asks_not_higher_quantity(Dec(10)) == 0
+
+    first = alice.place_havven_fiat_ask(Dec(1), Dec('1.1'))
+    assert book.price_to_buy_quantity(Dec(2)) == Dec('1.1')
+    alice.place_havven_fiat_ask(Dec(1), Dec('1.2'))
+    assert book.price_to_buy_quantity(Dec(2)) == Dec('1.2')
+    first.update_quantity(Dec(3))
+    assert book.price_to_buy_quantity(Dec(2)) == Dec('1.1')
+    assert book.asks_not_higher_quantity(Dec('1.2')) == Dec(4)
+    first.cancel()
+    assert book.price_to_buy_quantity(Dec(2)) == Dec('1.2')
+    assert book.asks_not_higher_quantity(Dec('1.1')) == 0
+
+
+def test_fill_price_fixes_the_rolling_price_of_the_tick():
+    havven_model = make_model_from_defaults(rolling_avg_time_window=3)
+    book = havven_model.market_manager.havven_fiat_market
+    alice, bob = add_funded_players(havven_model, 2)
+    havven_model.manager.time += 1
+    alice.place_havven_fiat_ask(Dec(1), Dec('1.1'))
+    alice.place_havven_fiat_ask(Dec(1), Dec('1.3'))
+    bob.place_havven_fiat_bid(Dec(1), Dec('1.1'))
+
+    # Asking for a fill price reads the rolling price, which then holds for the rest of the tick.
+    assert book.price_to_buy_quantity(Dec(1)) == Dec('1.3')
+    bob.place_havven_fiat_bid(Dec(1), Dec('1.3'))
+    assert book.price == Dec('1.1')
+    havven_model.manager.time += 1
+    assert book.price == Dec('1.2')
+
+
+"""
+===========================================
+= Testing the trade log
+===========================================
+
+Orders and trades are slotted objects, and a book can log its trades
+in arrays, with the history and players keeping only indices into the log.
+"""
+
+
+def test_orders_and_trades_are_slotted():
+    havven_model = make_model_from_defaults()
+    alice, bob = add_funded_players(havven_model, 2)
+    ask = alice.place_havven_fiat_ask(Dec(1), Dec(1))
+    bid = bob.place_havven_fiat_bid(Dec(2), Dec(1))
+    trade = havven_model.market_manager.havven_fiat_market.history[0]
+    for item in [ask, bid, trade]:
+        assert not hasattr(item, "__dict__")
+        with pytest.raises(AttributeError):
+            item.unexpected_attribute = 0
+
+
+def test_trade_log_matches_records():
+    record_model = make_model_from_defaults()
+    log_model = make_model_from_defaults(columnar_trade_log=True)
+    run_random_orders(record_model, 7)
+    run_random_orders(log_model, 7)
+    record_book = record_model.market_manager.havven_fiat_market
+    log_book = log_model.market_manager.havven_fiat_market
+    assert record_book.trade_log is None
+    assert len(log_book.trade_log) == len(record_book.history) > 0
+
+    # The history holds indices into the log.
+    assert list(log_book.history) == list(range(len(log_book.trade_log)))
+    for record, index in zip(record_book.history, log_book.history):
+        logged = log_book.trade(index)
+        assert (logged.completion_time, logged.price, logged.quantity, logged.buyer_id,
+                logged.seller_id, logged.bid_fee, logged.ask_fee) == \
+            (record.completion_time, record.price, record.quantity, record.buyer_id,
+             record.seller_id, record.bid_fee, record.ask_fee)
+
+    prices = log_book.trade_log.float_column("price")
+    assert list(prices) == [float(t.price) for t in record_book.history]
+    assert list(log_book.trade_log.column("buyer")) == [t.buyer_id for t in record_book.history]
+
+    # Players keep references into the log, which read back as the same trades.
+    record_players = sorted(record_model.schedule.agents, key=lambda a: a.unique_id)
+    log_players = sorted(log_model.schedule.agents, key=lambda a: a.unique_id)
+    for record_player, log_player in zip(record_players, log_players):
+        assert all(isinstance(trade, tuple) for trade in log_player.trades)
+        assert [(t.price, t.quantity, t.buyer_id, t.seller_id) for t in log_player.trade_records()] == \
+            [(t.price, t.quantity, t.buyer_id, t.seller_id) for t in record_player.trade_records()]
+
+    with pytest.raises(IndexError):
+        log_book.trade_log.record(len(log_book.trade_log))
+
+
+def test_trade_log_grows():
+    havven_model = make_model_from_defaults(columnar_trade_log=True)
+    book = havven_model.market_manager.havven_fiat_market
+    book.trade_log = ob.TradeLog(book, capacity=2)
+    alice, bob = add_funded_players(havven_model, 2)
+    for i in range(5):
+        alice.place_havven_fiat_ask(Dec(1), Dec(1) + Dec(i) / 10)
+        bob.place_havven_fiat_bid(Dec(1), Dec(2))
+    assert len(book.trade_log) == 5
+    assert list(book.trade_log.column("price")) == [hm.to_fixed(Dec(1) + Dec(i) / 10) for i in range(5)]
+    assert list(book.trade_log.column("time")) == [0] * 5
+
+
+def without_sweeps(havven_model):
+    """Match every pair of orders one at a time, as the books did before sweeping."""
+    for book in [havven_model.market_manager.havven_fiat_market,
+                 havven_model.market_manager.havven_nomin_market,
+                 havven_model.market_manager.nomin_fiat_market]:
+        book.sweeper = None
+    return havven_model
+
+
+def model_state(havven_model):
+    """The balances, orders and trades of every player, with the book's clock and the fees collected."""
+    book = havven_model.market_manager.havven_fiat_market
+    players = sorted(havven_model.schedule.agents, key=lambda a: a.unique_id)
+    return {
+        "time": book.time,
+        "fees": (havven_model.manager.fiat, havven_model.manager.havvens),
+        "players": [(p.fiat, p.havvens, p.unavailable_fiat, p.unavailable_havvens,
+                     [(o.price, o.quantity, o.fee) for o in p.orders.values()],
+                     [(t.price, t.quantity, t.buyer_id, t.seller_id) for t in p.trade_records()])
+                    for p in players],
+    }
+
+
+@pytest.mark.parametrize('fixed_point', [False, True])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_sweep_matches_pairwise_matching(seed, fixed_point):
+    swept = make_model_from_defaults(fixed_point_orderbook=fixed_point)
+    paired = without_sweeps(make_model_from_defaults(fixed_point_orderbook=fixed_point))
+    assert run_random_orders(swept, seed, actions=600) == run_random_orders(paired, seed, actions=600)
+    assert model_state(swept) == model_state(paired)
+
+
+def sweep_through_asks(havven_model, buyer_fiat):
+    """A buyer places a large bid crossing five levels of asks, and is left with the given fiat to pay for it."""
+    book = havven_model.market_manager.havven_fiat_market
+    seller, buyer = add_funded_players(havven_model, 2)
+    for i in range(5):
+        seller.place_havven_fiat_ask(Dec(10), Dec(1) + Dec(i) / 100)
+    with book.deferred_matching():
+        buyer.place_havven_fiat_bid(Dec(45), Dec(2))
+        buyer.fiat = buyer_fiat
+    return book
+
+
+@pytest.mark.parametrize('buyer_fiat', [Dec(1000), Dec(25)])
+def test_sweep_across_levels(buyer_fiat):
+    swept_model = make_model_from_defaults()
+    paired_model = without_sweeps(make_model_from_defaults())
+    swept = sweep_through_asks(swept_model, buyer_fiat)
+    paired = sweep_through_asks(paired_model, buyer_fiat)
+
+    assert [(t.price, t.quantity, t.bid_fee, t.ask_fee) for t in swept.history] == \
+        [(t.price, t.quantity, t.bid_fee, t.ask_fee) for t in paired.history]
+    assert list(swept.ask_price_buckets.items()) == list(paired.ask_price_buckets.items())
+    assert list(swept.bid_price_buckets.items()) == list(paired.bid_price_buckets.items())
+    assert swept.candle_data == paired.candle_data
+    assert model_state(swept_model) == model_state(paired_model)
+
+    if buyer_fiat > 100:
+        # The bid fills from four and a half levels, leaving the rest of the last.
+        assert [t.price for t in swept.history] == [Dec(1) + Dec(i) / 100 for i in range(5)]
+        assert swept.lowest_ask_quantity() == Dec(5)
+    else:
+        # The buyer runs out of fiat part of the way through, and the bid is cancelled.
+        assert len(swept.history) == 2
+        assert len(swept.bids) == 0
+
+
+def test_sweep_leaves_reactive_agents_to_the_matcher():
+    havven_model = make_model_from_defaults()
+    market_manager = havven_model.market_manager
+    player, = add_funded_players(havven_model, 1)
+    assert market_manager.trades_passively(player)
+    assert not market_manager.trades_passively(
+        ag.IssuanceController(2000, havven_model, fiat=Dec(100), havvens=Dec(100))
+    )
+
+
+def test_order_ids_and_records():
+    havven_model = make_model_from_defaults()
+    market_manager = havven_model.market_manager
+    alice, bob = add_funded_players(havven_model, 2)
+    alice.nomins = Dec(10)
+    bid = alice.place_havven_fiat_bid(Dec(1), Dec('0.9'))
+    ask = alice.place_nomin_fiat_ask(Dec(1), Dec('1.1'))
+    other = bob.place_havven_fiat_ask(Dec(1), Dec('1.2'))
+
+    # Ids are unique across books, and increase in the order the orders were placed.
+    assert [bid.order_id, ask.order_id, other.order_id] == sorted({bid.order_id, ask.order_id, other.order_id})
+    assert market_manager.havven_fiat_market.order(bid.order_id) is bid
+    assert market_manager.havven_fiat_market.order(ask.order_id) is None
+    assert market_manager.nomin_fiat_market.order(ask.order_id) is ask
+    assert list(market_manager.havven_fiat_market.orders_for(alice).values()) == [bid]
+    assert list(market_manager.havven_fiat_market.orders_for(bob).values()) == [other]
+    assert list(market_manager.nomin_fiat_market.orders_for(bob).values()) == []
+    assert alice.orders == {bid.order_id: bid, ask.order_id: ask}
+
+    bid.cancel()
+    assert market_manager.havven_fiat_market.order(bid.order_id) is None
+    assert alice.orders == {ask.order_id: ask}
+    assert market_manager.havven_fiat_market.orders_for(alice) == {}
+
+    # Orders which are never listed are not given ids.
+    empty = ob.Bid(Dec(1), Dec(0), Dec(0), alice, market_manager.havven_fiat_market)
+    assert empty.order_id is None
+    assert alice.orders == {ask.order_id: ask}
+
+
+@pytest.mark.parametrize('fixed_point', [False, True])
+def test_order_records_follow_the_book(fixed_point):
+    havven_model = make_model_from_defaults(fixed_point_orderbook=fixed_point)
+    run_random_orders(havven_model, 8)
+    book = havven_model.market_manager.havven_fiat_market
+    listed = list(book.bids) + list(book.asks)
+    assert sorted(book.orders) == sorted(order.order_id for order in listed)
+    for player in havven_model.schedule.agents:
+        assert all(order.active for order in player.orders.values())
+        assert book.orders_for(player) == {i: o for i, o in player.orders.items() if o.book is book}
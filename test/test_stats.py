@@ -0,0 +1,48 @@
+from decimal import Decimal as Dec
+
+import pytest
+
+from core import stats
+from test.test_orderbook import make_model_from_defaults, add_funded_players, run_random_orders
+
+
+def scan_totals(book):
+    """Compute the totals of each side of a book by scanning every order."""
+    return (
+        sum(bid.quantity for bid in book.bids), sum(bid.quantity * bid.price for bid in book.bids),
+        sum(ask.quantity for ask in book.asks), sum(ask.quantity * ask.price for ask in book.asks)
+    )
+
+
+@pytest.mark.parametrize('fixed_point', [False, True])
+def test_book_totals_match_orders(fixed_point):
+    havven_model = make_model_from_defaults(fixed_point_orderbook=fixed_point)
+    run_random_orders(havven_model, 3)
+    for book in [havven_model.market_manager.havven_fiat_market,
+                 havven_model.market_manager.nomin_fiat_market]:
+        assert (book.total_bid_quantity, book.total_bid_value,
+                book.total_ask_quantity, book.total_ask_value) == scan_totals(book)
+        assert book.bid_depth() == [(float(p), float(q)) for p, q in book.bid_price_buckets.items()]
+        assert book.ask_depth() == [(float(p), float(q)) for p, q in book.ask_price_buckets.items()]
+
+
+def test_supply_and_demand_reporters():
+    havven_model = make_model_from_defaults()
+    run_random_orders(havven_model, 5)
+    alice, = add_funded_players(havven_model, 1)
+    alice.nomins = alice.havvens
+    alice.place_nomin_fiat_ask(Dec(10), Dec(1))
+    alice.place_nomin_fiat_bid(Dec(10), Dec('0.5'))
+    alice.place_havven_nomin_ask(Dec(10), Dec(2))
+    alice.place_havven_nomin_bid(Dec(10), Dec('0.25'))
+
+    hf = scan_totals(havven_model.market_manager.havven_fiat_market)
+    nf = scan_totals(havven_model.market_manager.nomin_fiat_market)
+    hn = scan_totals(havven_model.market_manager.havven_nomin_market)
+    assert stats.fiat_demand(havven_model) == float(hf[3]) + float(nf[3])
+    assert stats.fiat_supply(havven_model) == float(hf[1]) + float(nf[1])
+    assert stats.havven_demand(havven_model) == float(hn[0]) + float(hf[0])
+    assert stats.havven_supply(havven_model) == float(hf[2]) + float(hn[2])
+    assert stats.nomin_demand(havven_model) == float(hn[3]) + float(nf[0])
+    assert stats.nomin_supply(havven_model) == float(hn[1]) + float(nf[2])
+    assert stats.nomin_supply(havven_model) > 0 and stats.nomin_demand(havven_model) > 0
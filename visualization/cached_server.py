@@ -1,4 +1,5 @@
 import copy
+import json
 import os
 import time
 from decimal import Decimal as Dec
@@ -31,12 +32,23 @@ class CachedPageHandler(tornado.web.RequestHandler):
 
 
 class CachedSocketHandler(tornado.websocket.WebSocketHandler):
-    """ Handler for websocket. """
+    """
+    Handler for websocket.
+
+    Clients ask for a range of steps with get_steps, giving step_start and step_end,
+    or a single step, giving step. While playing, a client can instead ask the server
+    to prefetch: the next prefetch_steps steps are sent straight away, then one more
+    at each frame of the client's fps, so the client plays from a buffer, without
+    waiting on a round trip for each frame, until it sends stop_prefetch.
+    """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.step = 0
         self.last_step_time = time.time()
+        # pushes the steps after prefetch_step to the client, while it plays
+        self.prefetcher = None
+        self.prefetch_step = 0
 
     def open(self):
         """
@@ -55,17 +67,14 @@ class CachedSocketHandler(tornado.websocket.WebSocketHandler):
         msg = tornado.escape.json_decode(message)
 
         if msg["type"] == "get_steps":
-            cache_data = self.application.cached_data_handler.get_step(msg['dataset'], msg['step'])
-            if cache_data is False:
-                message = {"type": "end"}
+            if "step_end" in msg:
+                self.send_steps(msg['dataset'], msg['step_start'], msg['step_end'])
             else:
-                data = [(msg['step'] + 1, cache_data)]
-
-                message = {
-                    "type": "viz_state",
-                    "data": data,
-                }
-            self.write_message(message)
+                self.send_steps(msg['dataset'], msg['step'], msg['step'] + 1)
+        elif msg["type"] == "prefetch":
+            self.start_prefetch(msg['dataset'], msg['step'], msg['fps'])
+        elif msg["type"] == "stop_prefetch":
+            self.stop_prefetch()
         elif msg["type"] == "get_datasets":
             data = self.application.cached_data_handler.get_dataset_info()
             message = {
@@ -77,45 +86,98 @@ class CachedSocketHandler(tornado.websocket.WebSocketHandler):
             if self.application.verbose:
                 print("Unexpected message!")
 
+    def send_steps(self, dataset, step_start, step_end):
+        """
+        Send the steps of the dataset from step_start up to step_end, each numbered from 1,
+        or an end message if there are none. Return whether any steps were sent.
+        """
+        cache_data = self.application.cached_data_handler.get_steps_json(dataset, step_start, step_end)
+        if cache_data is False:
+            self.write_message({"type": "end", "dataset": dataset})
+            return False
+        # The steps are stored as JSON, so the message is put together around them, rather than encoded again.
+        message = b"".join([
+            b'{"type":"viz_state","dataset":', json.dumps(dataset).encode(), b',"data":[',
+            b",".join(b"[%d,%s]" % (step_start + i + 1, step_json) for i, step_json in enumerate(cache_data)),
+            b"]}"
+        ])
+        self.write_message(message)
+        return True
+
+    def start_prefetch(self, dataset, step, fps):
+        """
+        Send the prefetch_steps steps of the dataset from step at once,
+        then the next each frame at the given fps, up to fps_max, until the end of the dataset.
+        """
+        self.stop_prefetch()
+        fps = min(max(int(fps), 1), self.application.fps_max)
+        self.prefetch_step = step + self.application.prefetch_steps
+        if not self.send_steps(dataset, step, self.prefetch_step):
+            return
+
+        def push():
+            if self.send_steps(dataset, self.prefetch_step, self.prefetch_step + 1):
+                self.prefetch_step += 1
+            else:
+                self.stop_prefetch()
+
+        self.prefetcher = tornado.ioloop.PeriodicCallback(push, 1000 / fps)
+        self.prefetcher.start()
+
+    def stop_prefetch(self):
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+
     def on_close(self):
         """When the user closes the connection destroy the model"""
         if self.application.verbose:
             print("Connection closed:", self)
+        self.stop_prefetch()
         del self
 
 
 class CachedDataHandler:
     def __init__(self, default_settings):
         self.default_settings = default_settings
-        data = cachehandler.load_saved()
-        all_cached = False
-        for i in cachehandler.run_settings:
-            if i['name'] not in data:
-                break
-        else:
-            all_cached = True
-
-        if not all_cached:
-            data = cachehandler.generate_new_caches(data)
-            cachehandler.save_data(data)
-
-        self.data = data
+        # Only the datasets' descriptions are read here; steps are read from disk as they are requested.
+        self.store = cachehandler.load_saved()
+        codec = "zlib" if default_settings['Server']['cache_compressed'] else "none"
+        # Datasets are served by name, from the version made with the current settings and code.
+        self.keys = cachehandler.dataset_keys(default_settings, codec=codec)
+        if not all(self.store.is_complete(key) for key in self.keys.values()):
+            cachehandler.generate_new_caches(self.store, codec=codec, defaults=default_settings)
+
+        for key in self.keys.values():
+            self.store.touch(key)
+        budget = default_settings['Server']['cache_budget_mb'] * 1024 * 1024
+        for key in self.store.evict(budget, keep=self.keys.values()):
+            print("Evicted old cached dataset", key)
 
     def get_steps(self, dataset, step_start, step_end):
-        if dataset in self.data and \
-                                        0 <= step_start < step_end < len(self.data[dataset]):
-            return self.data[dataset]['data'][step_start:step_end]
+        """the steps of the dataset from step_start up to step_end, or as many as there are, or False if none"""
+        key = self.keys.get(dataset)
+        if 0 <= step_start < min(step_end, self.store.steps(key)):
+            return self.store.get_steps(key, step_start, step_end)
+        return False
+
+    def get_steps_json(self, dataset, step_start, step_end):
+        """the steps of the dataset from step_start up to step_end as JSON, as get_steps, or False if none"""
+        key = self.keys.get(dataset)
+        if 0 <= step_start < min(step_end, self.store.steps(key)):
+            return self.store.get_steps_json(key, step_start, step_end)
         return False
 
     def get_step(self, dataset, step):
-        if dataset in self.data and 0 <= step < len(self.data[dataset]['data']):
-            return self.data[dataset]['data'][step]
+        key = self.keys.get(dataset)
+        if 0 <= step < self.store.steps(key):
+            return self.store.get_step(key, step)
         return False
 
     def get_dataset_info(self):
         to_send = []
-        for name in self.data:
-            i = self.data[name]
+        for name, key in self.keys.items():
+            i = self.store.datasets[key]
             settings = copy.deepcopy(self.default_settings)
             settings = self.merge_settings(settings, i["settings"])
 
@@ -176,6 +238,7 @@ class CachedModularServer(tornado.web.Application):
         self.model_name = name
         self.fps_max = settings['Server']['fps_max']
         self.fps_default = settings['Server']['fps_default']
+        self.prefetch_steps = settings['Server']['cache_prefetch_steps']
 
         self.description = ""
 
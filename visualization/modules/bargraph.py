@@ -2,7 +2,7 @@
 
 from typing import List, Tuple, Dict
 
-from mesa.datacollection import DataCollector
+from core.datacollector import ColumnarDataCollector
 
 from core.model import HavvenModel
 from visualization.visualization_element import VisualizationElement
@@ -34,7 +34,7 @@ class BarGraphModule(VisualizationElement):
         """
         return the data to be sent to the websocket to be rendered on the page
         """
-        data_collector: "DataCollector" = getattr(
+        data_collector: "ColumnarDataCollector" = getattr(
             model, self.data_collector_name
         )
         vals: List[Tuple[str, float]] = []
@@ -1,7 +1,7 @@
 from decimal import Decimal as Dec
 from typing import List, Tuple, Dict
 
-from mesa.datacollection import DataCollector
+from core.datacollector import ColumnarDataCollector
 
 from core import orderbook as ob
 from core.model import HavvenModel
@@ -39,7 +39,7 @@ class CandleStickModule(VisualizationElement):
         return the data to be sent to the websocket to be rendered on the page
         in the format of [[candle data (hi,lo,open,close)], rolling price, volume]
         """
-        data_collector: "DataCollector" = getattr(
+        data_collector: "ColumnarDataCollector" = getattr(
             model, self.data_collector_name
         )
         price_data: List[Dec] = []
@@ -53,7 +53,7 @@ class CandleStickModule(VisualizationElement):
             # the quantities or orders with the same rates
 
             try:
-                order_book: "ob.OrderBook" = data_collector.model_vars[name][-1]
+                order_book: "ob.OrderBook" = data_collector.latest(name)
                 candle_data = order_book.candle_data[:-1]
                 price_data = order_book.price_data[1:]
                 vol_data = order_book.volume_data[1:]
@@ -21,11 +21,11 @@ class ChartModule(VisualizationElement):
         series: A list of dictionaries containing information on series to
                 plot. Each dictionary must contain (at least) the "Label" and
                 "Color" keys. The "Label" value must correspond to a
-                model-level series collected by the model's DataCollector, and
+                model-level series collected by the model's data collector, and
                 "Color" must have a valid HTML color.
         canvas_height, canvas_width: The width and height to draw the chart on
                                      the page, in pixels. Default to 200 x 500
-        data_collector_name: Name of the DataCollector object in the model to
+        data_collector_name: Name of the data collector in the model to
                              retrieve data from.
 
     Example:
@@ -53,7 +53,7 @@ class ChartModule(VisualizationElement):
                     HTML colors to chart them in, e.g.
                     [{"Label": "happy", "Color": "Black"},]
             canvas_height, canvas_width: Size in pixels of the chart to draw.
-            data_collector_name: Name of the DataCollector to use.
+            data_collector_name: Name of the data collector to use.
         """
 
         self.series = series
@@ -73,7 +73,7 @@ class ChartModule(VisualizationElement):
         for s in self.series:
             name = s["Label"]
             try:
-                val = data_collector.model_vars[name][-1]  # Latest value
+                val = data_collector.latest(name)
             except:
                 val = 0
             current_values.append(val)
@@ -1,7 +1,6 @@
-from decimal import Decimal as Dec
 from typing import List, Tuple, Dict
 
-from mesa.datacollection import DataCollector
+from core.datacollector import ColumnarDataCollector
 
 from core import orderbook as ob
 from core.model import HavvenModel
@@ -35,12 +34,12 @@ class OrderBookModule(VisualizationElement):
         """
         return the data to be sent to the websocket to be rendered on the page
         """
-        data_collector: "DataCollector" = getattr(
+        data_collector: "ColumnarDataCollector" = getattr(
             model, self.data_collector_name
         )
         price = 1.0
-        bids: List[Tuple[Dec, Dec]] = []
-        asks: List[Tuple[Dec, Dec]] = []
+        bids: List[Tuple[float, float]] = []
+        asks: List[Tuple[float, float]] = []
 
         for s in self.series:  # TODO: not use series, as it should only really be one graph
             name: str = s['Label']
@@ -49,14 +48,12 @@ class OrderBookModule(VisualizationElement):
             # the quantities or orders with the same rates
 
             try:
-                order_book: "ob.OrderBook" = data_collector.model_vars[name][-1]
+                order_book: "ob.OrderBook" = data_collector.latest(name)
                 price = order_book.price
-                bids = order_book.bid_price_buckets.items()
-                asks = order_book.ask_price_buckets.items()
+                bids = order_book.bid_depth()
+                asks = order_book.ask_depth()
             except Exception:
                 bids = []
                 asks = []
 
-        # convert decimals to floats
-
-        return [float(price), [(float(i[0]), float(i[1])) for i in bids], [(float(i[0]), float(i[1])) for i in asks]]
+        return [float(price), bids, asks]
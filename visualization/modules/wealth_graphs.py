@@ -2,8 +2,9 @@
 
 from typing import List, Tuple, Dict
 
-from mesa.datacollection import DataCollector
+from core.datacollector import ColumnarDataCollector
 
+from core import stats
 from core.model import HavvenModel
 from core.orderbook import Bid, Ask
 from .bargraph import BarGraphModule
@@ -20,11 +21,11 @@ class WealthModule(BarGraphModule):
         self.sent_data = False
 
     def render(self, model: HavvenModel) -> Tuple[List[str], List[str], List[float]]:
-        data_collector: "DataCollector" = getattr(
+        data_collector: "ColumnarDataCollector" = getattr(
             model, self.data_collector_name
         )
 
-        if len(data_collector.agent_vars["Agents"]) <= 1:
+        if data_collector.steps <= 1:
             self.sent_data = False
 
         if not self.sent_data:
@@ -37,13 +38,15 @@ class WealthModule(BarGraphModule):
 
         try:
             agents = sorted(
-                data_collector.agent_vars["Agents"][-1],
+                data_collector.agent_records("Agents"),
                 key=lambda x: x[0]
             )  # [:-1]
-            for item in agents:
-                if not self.sent_data:
+            if not self.sent_data:
+                for item in agents:
                     vals[3].append(item[1].name)
-                vals[0 + static_val_len].append(float(item[1].wealth()))
+            vals[0 + static_val_len].extend(
+                float(wealth) for wealth in stats.wealths(model, [item[1] for item in agents])
+            )
             self.sent_data = True
         except Exception:
             vals = []
@@ -72,11 +75,11 @@ class PortfolioModule(BarGraphModule):
         self.sent_data = False
 
     def render(self, model: HavvenModel) -> PortfolioTuple:
-        data_collector: "DataCollector" = getattr(
+        data_collector: "ColumnarDataCollector" = getattr(
             model, self.data_collector_name
         )
 
-        if len(data_collector.agent_vars["Agents"]) <= 1:
+        if data_collector.steps <= 1:
             self.sent_data = False
 
         # vals are [datasets],[colours],[bar #],[playername],[dataset 1],...[dataset n]
@@ -91,7 +94,7 @@ class PortfolioModule(BarGraphModule):
 
         try:
             agents = sorted(
-                data_collector.agent_vars["Agents"][-1],
+                data_collector.agent_records("Agents"),
                 key=lambda x: x[0]
             )  # [:-1]
 
@@ -124,11 +127,11 @@ class CurrentOrderModule(BarGraphModule):
         self.sent_data = False
 
     def render(self, model: HavvenModel) -> OrderbookValueTuple:
-        data_collector: "DataCollector" = getattr(
+        data_collector: "ColumnarDataCollector" = getattr(
             model, self.data_collector_name
         )
 
-        if len(data_collector.agent_vars["Agents"]) <= 1:
+        if data_collector.steps <= 1:
             self.sent_data = False
 
         # vals are [datasets],[colours],[bar #],[playername],[dataset 1],...[dataset n]
@@ -145,14 +148,14 @@ class CurrentOrderModule(BarGraphModule):
 
         try:
             agents = sorted(
-                data_collector.agent_vars["Agents"][-1],
+                data_collector.agent_records("Agents"),
                 key=lambda x: x[0]
             )  # [:-1]
 
             for item in agents:
                 if not self.sent_data:
                     vals[3].append(item[1].name)
-                orders = item[1].orders
+                orders = item[1].orders.values()
                 nomin_fiat_ask_tot = 0
                 nomin_fiat_bid_tot = 0
                 havven_fiat_ask_tot = 0
@@ -164,19 +167,19 @@ class CurrentOrderModule(BarGraphModule):
                     if order.book.quoted == "fiat":
                         if order.book.base == "nomins":
                             # FIAT/NOM
-                            if type(order) == Ask:
+                            if isinstance(order, Ask):
                                 nomin_fiat_ask_tot += order.quantity
-                            if type(order) == Bid:
+                            if isinstance(order, Bid):
                                 nomin_fiat_bid_tot += order.quantity
                         if order.book.base == "havvens":
-                            if type(order) == Ask:
+                            if isinstance(order, Ask):
                                 havven_fiat_ask_tot += order.quantity
-                            if type(order) == Bid:
+                            if isinstance(order, Bid):
                                 havven_fiat_bid_tot += order.quantity
                     elif order.book.quoted == "nomins":
-                        if type(order) == Ask:
+                        if isinstance(order, Ask):
                             nomin_havven_ask_tot += order.quantity
-                        if type(order) == Bid:
+                        if isinstance(order, Bid):
                             nomin_havven_bid_tot += order.quantity
 
                 vals[0 + static_val_length].append(float(nomin_fiat_ask_tot))
@@ -200,11 +203,11 @@ class PastOrdersModule(BarGraphModule):
         self.sent_data = False
 
     def render(self, model: HavvenModel) -> OrderbookValueTuple:
-        data_collector: "DataCollector" = getattr(
+        data_collector: "ColumnarDataCollector" = getattr(
             model, self.data_collector_name
         )
 
-        if len(data_collector.agent_vars["Agents"]) <= 1:
+        if data_collector.steps <= 1:
             self.sent_data = False
 
         # vals are [datasets],[colours],[bar #],[playername],[dataset 1],...[dataset n]
@@ -220,14 +223,13 @@ class PastOrdersModule(BarGraphModule):
             static_val_length = 0
         try:
             agents = sorted(
-                data_collector.agent_vars["Agents"][-1],
+                data_collector.agent_records("Agents"),
                 key=lambda x: x[0]
             )  # [:-1]
 
             for item in agents:
                 if not self.sent_data:
                     vals[3].append(item[1].name)
-                trades = item[1].trades
                 nomin_fiat_ask_tot = 0
                 nomin_fiat_bid_tot = 0
                 havven_fiat_ask_tot = 0
@@ -235,24 +237,24 @@ class PastOrdersModule(BarGraphModule):
                 nomin_havven_ask_tot = 0
                 nomin_havven_bid_tot = 0
 
-                for trade in trades:
-                    if trade.book.quoted == "fiat":
-                        if trade.book.base == "nomins":
+                for (book, bought), quantity in item[1].traded.items():
+                    if book.quoted == "fiat":
+                        if book.base == "nomins":
                             # FIAT/NOM
-                            if trade.buyer == item[1]:
-                                nomin_fiat_ask_tot += trade.quantity
-                            elif trade.seller == item[1]:
-                                nomin_fiat_bid_tot += trade.quantity
-                        if trade.book.base == "havvens":
-                            if trade.buyer == item[1]:
-                                havven_fiat_ask_tot += trade.quantity
-                            elif trade.seller == item[1]:
-                                havven_fiat_bid_tot += trade.quantity
-                    elif trade.book.quoted == "nomins":
-                        if trade.buyer == item[1]:
-                            nomin_havven_ask_tot += trade.quantity
-                        elif trade.seller == item[1]:
-                            nomin_havven_bid_tot += trade.quantity
+                            if bought:
+                                nomin_fiat_ask_tot += quantity
+                            else:
+                                nomin_fiat_bid_tot += quantity
+                        if book.base == "havvens":
+                            if bought:
+                                havven_fiat_ask_tot += quantity
+                            else:
+                                havven_fiat_bid_tot += quantity
+                    elif book.quoted == "nomins":
+                        if bought:
+                            nomin_havven_ask_tot += quantity
+                        else:
+                            nomin_havven_bid_tot += quantity
 
                 vals[0 + static_val_length].append(float(nomin_fiat_ask_tot))
                 vals[1 + static_val_length].append(-float(nomin_fiat_bid_tot))
@@ -1,8 +1,9 @@
 /** runcontrol.js
 
  Users can reset() the model, advance it by one step(), or run() it through. reset() and
- step() send a message to the server, which then sends back the appropriate data. run() just
- calls the step() method at fixed intervals.
+ step() ask the server for the steps after those already received, which it sends back.
+ run() asks the server to prefetch: to send the steps ahead of the current one, and more
+ as the run plays, so that it plays from those received, at fixed intervals.
 
  The model parameters are controlled via the MesaVisualizationControl object.
  */
@@ -27,6 +28,7 @@ var MesaVisualizationControl = function () {
     this.description = "";
     this.dataset_name = "";
     this.dataset_max_steps = 1;
+    this.prefetching = false; // Whether the server is sending steps ahead of the run
 };
 
 var player; // Variable to store the continuous player
@@ -357,6 +359,10 @@ ws.onmessage = function (message) {
     var msg = JSON.parse(message.data);
     switch (msg["type"]) {
         case "viz_state":
+            // ignore steps sent for a dataset since left
+            if (msg["dataset"] !== undefined && msg["dataset"] !== control.dataset) {
+                break;
+            }
 
             var data = msg["data"];
 
@@ -371,15 +377,20 @@ ws.onmessage = function (message) {
             for (var i in data) {
                 let step = data[i][0];
                 let dataset = data[i][1];
-                if (control.data[control.dataset].length <= step) {
+                // only the next step is added, so steps sent twice are ignored
+                if (control.data[control.dataset].length === step - 1) {
                     control.data[control.dataset].push(dataset);
                 }
             }
             break;
 
         case "end":
+            if (msg["dataset"] !== undefined && msg["dataset"] !== control.dataset) {
+                break;
+            }
             // We have reached the end of the model
             control.done = true;
+            control.prefetching = false;
             console.log("Done!");
             $(playPauseButton.children()[0]).html("<span style=\"font-size: 16.5px;text-shadow: 0 0 12px rgba(0,255,125,1);\" class=\"glyphicon glyphicon-stop\"></span>");
             break;
@@ -446,19 +457,20 @@ var reset = function ($e) {
 };
 
 
-/** Send a message to the server get the next visualization state. */
+/** Advance a tick, asking the server for the next second of steps if they haven't been received. */
 var single_step = function () {
     if (control.tick < 0) {
         control.tick = 0;
     }
     control.tick += 1;
     let fps = parseInt(control.fps);
-    if (control.tick >= control.data[control.dataset].length && control.last_sent !== control.data[control.dataset].length) {
+    if (!control.prefetching && control.tick >= control.data[control.dataset].length &&
+        control.last_sent !== control.data[control.dataset].length) {
         control.last_sent = control.data[control.dataset].length;
         if (!control.done) send({
             "type": "get_steps",
-            "step": control.data[control.dataset].length,
-            "fps": fps,
+            "step_start": control.data[control.dataset].length,
+            "step_end": control.data[control.dataset].length + fps,
             "dataset": control.dataset
         });
     }
@@ -466,6 +478,38 @@ var single_step = function () {
 };
 
 
+/** Ask the server to send the steps after those received, keeping ahead of the run at its fps. */
+var start_prefetch = function () {
+    if (control.done || control.prefetching || control.data[control.dataset].length >= control.dataset_max_steps) {
+        return;
+    }
+    control.prefetching = true;
+    send({
+        "type": "prefetch",
+        "step": control.data[control.dataset].length,
+        "fps": parseInt(control.fps),
+        "dataset": control.dataset
+    });
+};
+
+
+/** Whether the run has played every step, the server having sent them all. */
+var finished = function () {
+    return control.done && control.tick >= control.data[control.dataset].length;
+};
+
+
+/** Ask the server to stop sending steps ahead of the run. */
+var stop_prefetch = function () {
+    if (control.prefetching) {
+        control.prefetching = false;
+        send({"type": "stop_prefetch"});
+    }
+    // let the next step ask for whatever hasn't been received
+    control.last_sent = undefined;
+};
+
+
 /** Step the model backward. */
 var back = function ($e) {
     if ($e !== undefined) $e.preventDefault();
@@ -484,11 +528,11 @@ var back = function ($e) {
 var step = function ($e) {
     if ($e !== undefined) $e.preventDefault();
 
-    if (!control.running && !control.done) {
+    if (!control.running && !finished()) {
         single_step();
         update_graphs(true);
     }
-    else if (!control.done) {
+    else if (!finished()) {
         run();
     }
     return false;
@@ -502,17 +546,19 @@ var run = function ($e) {
     var anchor = $(playPauseButton.children()[0]);
     if (control.running) {
         control.running = false;
+        stop_prefetch();
         if (player) {
             clearInterval(player);
             player = null;
         }
         anchor.html("<span style=\"font-size: 16.5px;text-shadow: 0 0 12px rgba(0,255,125,1);\" class=\"glyphicon glyphicon-play\"></span>");
     }
-    else if (!control.done) {
+    else if (!finished()) {
         if (control.data[control.dataset].length <= 1) {
             show_group($(".list-group-item")[1]);
         }
         control.running = true;
+        start_prefetch();
         player = setInterval(
             function () {
                 if (!control.running) {
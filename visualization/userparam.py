@@ -51,7 +51,7 @@ class UserSettableParameter:
 
     def __init__(
             self, param_type=None, name='', value=None, min_value=None, max_value=None,
-            step=1, choices=list(), description=None
+            step=1, choices=list(), description=None, seed=None
     ):
         if param_type not in self.TYPES:
             raise ValueError("{} is not a valid Option type".format(param_type))
@@ -64,6 +64,8 @@ class UserSettableParameter:
         self.choices = choices
         self.description = description
         self.got_set = False
+        # the generator for randomized agent fractions, seeded so reset models can be replayed
+        self._random = random.Random(seed)
 
         # Validate option types to make sure values are supplied properly
         msg = self._ERROR_MESSAGE.format(self.param_type, name)
@@ -124,6 +126,7 @@ class UserSettableParameter:
     def json(self):
         result = self.__dict__.copy()
         result['value'] = result.pop('_value')  # Return _value as value, value is the same
+        result.pop('_random')
         return result
 
     def randomize_agents(self):
@@ -131,7 +134,7 @@ class UserSettableParameter:
         # import here to avoid circular reference
         from agents import player_names
         v = {
-            i: random.random() / len(player_names) for i in player_names
+            i: self._random.random() / len(player_names) for i in player_names
         }
         if 'Merchant' in v:
             v['Merchant'] = 0